@@ -0,0 +1,314 @@
+# Admission control and load shedding.
+# Under a traffic spike every request is accepted, waits for a threadpool
+# thread and a SQLite connection, and the latency of all of them explodes. The
+# admission controller bounds the requests in flight per route class, lets a
+# bounded number wait for a short deadline, redirects first, and answers the
+# others at once with 503 and Retry-After, so a few requests fail fast instead.
+import asyncio
+import json
+import time
+import zlib
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set
+
+from .config import get_settings
+from .metrics import metrics
+
+# Route classes, highest priority first.
+REDIRECT, CREATE, ADMIN = "redirect", "create", "admin"
+PRIORITY = (REDIRECT, CREATE, ADMIN)
+CREATE_PATHS = {"/url", "/urls/batch"}
+# Health checks are never queued nor shed.
+EXEMPT_PATHS = {"/admin/ready"}
+
+
+# 1. Every client address is hashed into one of `size` buckets, kept in two
+#    flat arrays (tokens, last refill time): memory does not grow with the
+#    number of clients, and clients sharing a bucket share its rate.
+# 2. A bucket refills `rate` tokens per second up to `burst`; a request takes
+#    one token, or gets the seconds until the next one.
+class TokenBuckets:
+    """Per-client token-bucket rate limits in fixed-size arrays.
+
+    Args:
+        rate (float): requests per second of a client, 0 disables the limit.
+        burst (float): requests a client can make at once.
+        size (int): number of buckets.
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 20, size: int = 65536) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.size = size
+        self._tokens = array("d", [burst]) * size if rate else array("d")
+        self._updated = array("d", [0.0]) * size if rate else array("d")
+
+    def take(self, client: str) -> float:
+        """Take a token of `client`: 0 when allowed, else the seconds to wait."""
+        if not self.rate:
+            return 0.0
+        index = zlib.crc32(client.encode()) % self.size
+        now = time.monotonic()
+        tokens = min(self.burst, self._tokens[index] + (now - self._updated[index]) * self.rate)
+        self._updated[index] = now
+        if tokens >= 1:
+            self._tokens[index] = tokens - 1
+            return 0.0
+        self._tokens[index] = tokens
+        return (1 - tokens) / self.rate
+
+
+# 1. A request of a class runs when the class is under its limit and all the
+#    classes are under `max_concurrency`.
+# 2. Otherwise it waits in the queue of its class, at most `queue_timeout`
+#    seconds. The queues share `queue_size` places: when they are full, a
+#    request of a higher class takes the place of the last queued request of
+#    the lowest class, which is shed; otherwise the new request is shed.
+# 3. A finished request hands its place to the queued requests, redirects
+#    first, then creates, then admin calls, in arrival order within a class.
+# 4. Everything runs on the event loop of the worker: no lock is needed.
+class AdmissionController:
+    """Per-class concurrency limits with a bounded priority queue.
+
+    Args:
+        enabled (bool): when False, the middleware is not installed.
+        max_concurrency (int): requests of all classes running at once.
+        limits (Dict[str, int]): requests of each class running at once.
+        queue_size (int): requests waiting at once, all classes together.
+        queue_timeout (float): seconds a request waits at most before a 503.
+        retry_after (int): the Retry-After of the 503 answers, in seconds.
+        buckets (TokenBuckets, optional): per-client rate limits.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_concurrency: int = 32,
+        limits: Optional[Dict[str, int]] = None,
+        queue_size: int = 256,
+        queue_timeout: float = 0.5,
+        retry_after: int = 1,
+        buckets: Optional[TokenBuckets] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.limits = {REDIRECT: 32, CREATE: 8, ADMIN: 2, **(limits or {})}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.buckets = buckets or TokenBuckets()
+        self.running = 0
+        self.running_by_class = dict.fromkeys(PRIORITY, 0)
+        self.queues: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in PRIORITY}
+        self.queued = 0
+        self.counters = {
+            name: {
+                "admitted": 0,
+                "queued": 0,
+                "shed_queue_full": 0,
+                "shed_timeout": 0,
+                "rate_limited": 0,
+                "wait_seconds": 0.0,
+                "max_wait_seconds": 0.0,
+            }
+            for name in PRIORITY
+        }
+
+    def _fits(self, route_class: str) -> bool:
+        return (
+            self.running < self.max_concurrency
+            and self.running_by_class[route_class] < self.limits[route_class]
+        )
+
+    def _start(self, route_class: str) -> None:
+        self.running += 1
+        self.running_by_class[route_class] += 1
+        self.counters[route_class]["admitted"] += 1
+
+    async def acquire(self, route_class: str) -> bool:
+        """Wait for a place for a request of `route_class`; False when it is shed."""
+        counters = self.counters[route_class]
+        if self._fits(route_class) and not any(
+            self.queues[name] for name in PRIORITY[: PRIORITY.index(route_class) + 1]
+        ):
+            self._start(route_class)
+            return True
+        if self.queued >= self.queue_size and not self._shed_lowest(route_class):
+            counters["shed_queue_full"] += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues[route_class].append(waiter)
+        self.queued += 1
+        counters["queued"] += 1
+        start = time.perf_counter()
+        try:
+            admitted = await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # On Python 3.12+ the timeout can fire in the loop iteration that
+            # release() granted the place: the request then runs, or its place
+            # would never be released.
+            admitted = waiter.done() and not waiter.cancelled() and waiter.result()
+            if not admitted:
+                counters["shed_timeout"] += 1
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release(route_class)
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                self._forget(route_class, waiter)
+            waited = time.perf_counter() - start
+            counters["wait_seconds"] += waited
+            counters["max_wait_seconds"] = max(counters["max_wait_seconds"], waited)
+            if metrics.enabled:
+                metrics.operation_duration.observe(("admission_wait",), waited)
+        return admitted
+
+    def release(self, route_class: str) -> None:
+        """Free the place of a finished request and admit the queued ones that fit."""
+        self.running -= 1
+        self.running_by_class[route_class] -= 1
+        for name in PRIORITY:
+            queue = self.queues[name]
+            while queue and self._fits(name):
+                waiter = queue.popleft()
+                self.queued -= 1
+                if not waiter.done():
+                    self._start(name)
+                    waiter.set_result(True)
+
+    def _shed_lowest(self, route_class: str) -> bool:
+        """Shed the last queued request of a class below `route_class`, if any."""
+        for name in reversed(PRIORITY[PRIORITY.index(route_class) + 1 :]):
+            queue = self.queues[name]
+            while queue:
+                waiter = queue.pop()
+                self.queued -= 1
+                if not waiter.done():
+                    self.counters[name]["shed_queue_full"] += 1
+                    waiter.set_result(False)
+                    return True
+        return False
+
+    def _forget(self, route_class: str, waiter: asyncio.Future) -> None:
+        try:
+            self.queues[route_class].remove(waiter)
+            self.queued -= 1
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "running": dict(self.running_by_class),
+            "queued": {name: len(queue) for name, queue in self.queues.items()},
+            "limits": {"total": self.max_concurrency, **self.limits},
+            "counters": self.counters,
+        }
+
+
+# 1. The class of a request comes from its method and path, without routing:
+#    the admin paths, POST /url and /urls/batch, and GET of a single path
+#    segment that is not the first segment of another route: the redirects.
+# 2. Other requests (pages, static files, metrics) are not limited.
+def reserved_segments(routes: Iterable) -> Set[str]:
+    """The first path segments of the routes that are not the redirect route."""
+    segments = set()
+    for route in routes:
+        first = getattr(route, "path", "").strip("/").split("/")[0]
+        if first and not first.startswith("{"):
+            segments.add(first)
+    return segments
+
+
+# 1. Pure ASGI middleware, like MetricsMiddleware.
+# 2. A request over the rate of its client gets a 429, a shed request a 503,
+#    both with Retry-After and without reaching the app.
+# 3. The place of an admitted request is released when the app returns.
+class AdmissionMiddleware:
+    """Admit, queue or shed every redirect, create and admin request."""
+
+    def __init__(self, app, controller: AdmissionController, routes: List) -> None:
+        self.app = app
+        self.controller = controller
+        # The live route list of the app, read at request time: routes added
+        # after the middleware is built, or only in some modes, are seen too.
+        self.routes = routes
+        self._reserved: Set[str] = set()
+        self._route_count = -1
+
+    def reserved(self) -> Set[str]:
+        """The reserved first segments, computed again when routes are added or removed."""
+        if len(self.routes) != self._route_count:
+            self._route_count = len(self.routes)
+            self._reserved = reserved_segments(self.routes)
+        return self._reserved
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        if path.startswith("/admin/"):
+            return None if path in EXEMPT_PATHS else ADMIN
+        if method == "POST" and path in CREATE_PATHS:
+            return CREATE
+        if method == "GET":
+            segment = path[1:]
+            if segment and "/" not in segment and segment not in self.reserved():
+                return REDIRECT
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (
+            route_class := self.classify(scope["method"], scope["path"])
+        ) is None:
+            await self.app(scope, receive, send)
+            return
+        controller = self.controller
+        client = scope.get("client")
+        wait = controller.buckets.take(client[0] if client else "")
+        if wait:
+            controller.counters[route_class]["rate_limited"] += 1
+            await reject(send, 429, "Too many requests", max(1, round(wait)))
+            return
+        if not await controller.acquire(route_class):
+            await reject(send, 503, "Server busy, retry later", controller.retry_after)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route_class)
+
+
+async def reject(send, status: int, detail: str, retry_after: int) -> None:
+    """Send a JSON error response with a Retry-After header."""
+    body = json.dumps({"detail": detail}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+admission = AdmissionController(
+    enabled=get_settings().admission_enabled,
+    max_concurrency=get_settings().admission_max_concurrency,
+    limits={
+        REDIRECT: get_settings().admission_redirect_limit,
+        CREATE: get_settings().admission_create_limit,
+        ADMIN: get_settings().admission_admin_limit,
+    },
+    queue_size=get_settings().admission_queue_size,
+    queue_timeout=get_settings().admission_queue_timeout,
+    retry_after=get_settings().admission_retry_after,
+    buckets=TokenBuckets(
+        rate=get_settings().admission_client_rate,
+        burst=get_settings().admission_client_burst,
+        size=get_settings().admission_client_buckets,
+    ),
+)
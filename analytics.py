@@ -0,0 +1,97 @@
+# Time-bucketed click analytics: per-key click counts rolled up by minute,
+# hour and day in the click_rollups table, instead of a row per click.
+import logging
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from . import crud
+from .clicks import ClickCounter
+from .config import get_settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Bucket sizes in seconds.
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+
+# A rollup counter key: (url key, granularity, bucket start as a unix timestamp).
+RollupKey = Tuple[str, str, int]
+
+
+# 1. Every click is counted once per granularity, in the bucket it falls in.
+# 2. The counts are coalesced in memory by a ClickCounter and upserted in batches.
+# 3. Every hour, the flush also prunes minute and hour buckets older than their
+#    retention: the coarser buckets already hold their clicks, so old traffic
+#    is downsampled instead of lost.
+class ClickRollup:
+    """Aggregates clicks into minute, hour and day buckets.
+
+    Args:
+        enabled (bool): when False, clicks are not rolled up.
+        flush_interval (float): seconds between two flushes.
+        flush_threshold (int): pending buckets that trigger an early flush.
+        retention (Dict[str, float]): seconds a bucket of each granularity is
+        kept, granularities that are not listed are kept forever.
+    """
+
+    PRUNE_INTERVAL = 3600
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        flush_interval: float = 1.0,
+        flush_threshold: int = 1000,
+        retention: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.retention = retention or {}
+        self._counter = ClickCounter(flush_interval, flush_threshold, writer=self._write)
+        self._pruned_at = 0.0
+
+    def add(self, url_key: str, timestamp: Optional[float] = None) -> None:
+        """Count a click on `url_key` at `timestamp` (now by default)."""
+        if not self.enabled:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        for granularity, size in GRANULARITIES.items():
+            self._counter.add((url_key, granularity, int(timestamp // size * size)))
+
+    def pending(self, url_key: str, granularity: str, start: int, end: int) -> Counter:
+        """Clicks of the buckets in [start, end) that are not yet in the database."""
+        return Counter(
+            {
+                bucket: count
+                for (key, bucket_granularity, bucket), count in self._counter.snapshot().items()
+                if key == url_key and bucket_granularity == granularity and start <= bucket < end
+            }
+        )
+
+    def start(self) -> None:
+        if self.enabled:
+            self._counter.start()
+
+    def stop(self) -> None:
+        self._counter.stop()
+
+    def _write(self, counts: Dict[RollupKey, int]) -> None:
+        db = SessionLocal()
+        try:
+            crud.add_db_rollups(db, counts)
+            if time.time() - self._pruned_at > self.PRUNE_INTERVAL:
+                self._pruned_at = time.time()
+                for granularity, seconds in self.retention.items():
+                    crud.delete_db_rollups_before(db, granularity, int(time.time() - seconds))
+        finally:
+            db.close()
+
+
+click_rollup = ClickRollup(
+    enabled=get_settings().click_rollups_enabled,
+    flush_interval=get_settings().click_flush_interval,
+    flush_threshold=get_settings().click_flush_threshold,
+    retention={
+        "minute": get_settings().rollup_minute_retention_hours * 3600,
+        "hour": get_settings().rollup_hour_retention_days * 86400,
+    },
+)
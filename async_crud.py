@@ -0,0 +1,135 @@
+# Async versions of the crud functions, used when `async_mode` is enabled.
+# 1. The queries run on an AsyncSession from database.AsyncSessionLocal.
+# 2. Key allocation and dedup lookups reuse the sync code through AsyncSession.run_sync.
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, keygen, models, schemas
+from .cache import RedirectTarget
+from .config import get_settings
+from .dedup import url_digest
+from .keyfilter import key_filter
+from .metrics import timed
+
+
+# 1. In dedup mode, return the active URL with the same normalized target, if any.
+# 2. Allocate a key with the configured allocator, run on the async connection.
+# 3. Add the URL to the database and commit the session.
+# 4. Refresh the database object, add its key to the negative-lookup filter and
+#    its redirect to the shared table, and return it.
+@timed
+async def create_db_url(db: AsyncSession, url: schemas.URLBase) -> models.URL:
+    """Create URL in the database
+
+    Args:
+        db (AsyncSession): Connect to a database
+        url (schemas.URLBase): url to be shortened
+
+    Returns:
+        models.URL: return a shorten URL
+    """
+    if get_settings().dedup_enabled and not crud.has_policy(url) and (
+        db_url := await db.run_sync(crud.get_db_url_by_target, url.target_url)
+    ):
+        return db_url
+    key = await db.run_sync(keygen.key_allocator.allocate)
+    secret_key = f"{key}_{keygen.create_random_key(length=8)}"
+    db_url = models.URL(
+        target_url=url.target_url,
+        key=key,
+        secret_key=secret_key,
+        target_hash=url_digest(url.target_url),
+        expires_at=crud.to_timestamp(url.expires_at),
+        max_clicks=url.max_clicks,
+        cache_max_age=url.cache_max_age,
+    )
+
+    db.add(db_url)
+    await db.commit()
+    await db.refresh(db_url)
+    key_filter.add(key)
+    crud.share_created(db_url)
+
+    return db_url
+
+
+# 1. First, we look the key up in the in-process redirect cache, or the shared table.
+# 2. Keys that the negative-lookup filter rules out are unknown, without a query.
+# 3. Otherwise, we query only the redirect columns of the active URL.
+# 4. If the URL is found and live, crud.live_target caches it, and we return it.
+@timed
+async def get_target_url_by_key(db: AsyncSession, url_key: str) -> Optional[RedirectTarget]:
+    """Return the target URL of an active key, served from the cache when possible.
+
+    Args:
+        db (AsyncSession): Connect to a database
+        url_key (str): url key stored in database
+
+    Returns:
+        Optional[RedirectTarget]: the redirect, or None if the key is not active
+    """
+    if (target := crud.cached_target(url_key)) is not None:
+        return target
+    if key_filter.definitely_missing(url_key):
+        return None
+    generation = crud.table_generation()
+    result = await db.execute(
+        select(*crud.TARGET_COLUMNS)
+        .where(models.URL.key == url_key, models.URL.is_active)
+        .limit(1)
+    )
+    if (row := result.first()) is None:
+        return None
+    return crud.live_target(url_key, row, generation)
+
+
+# 1. Query the database for an active URL entry with the provided secret_key.
+# 2. Return the URL entry. Otherwise, return None.
+@timed
+async def get_db_url_by_secret_key(
+    db: AsyncSession, secret_key: str
+) -> Optional[models.URL]:
+    """Checks your database for an active database entry
+    with the provided secret_key.
+
+    Args:
+        db (AsyncSession): Connect to a database
+        secret_key (str): url secret key stored in database
+
+    Returns:
+        models.URL: return an URL entry. Otherwise, returnd None.
+    """
+    return await db.scalar(
+        select(models.URL)
+        .where(models.URL.secret_key == secret_key, models.URL.is_active)
+        .limit(1)
+    )
+
+
+# 1. First, we get the URL by the `secret_key` from the database.
+# 2. If the URL is found, we set the `is_active` attribute to False and commit.
+# 3. We evict the key from the redirect cache (or shared table) and the negative-lookup filter,
+#    and return the database object.
+@timed
+async def deactivate_db_url_by_secret_key(
+    db: AsyncSession, secret_key: str
+) -> Optional[models.URL]:
+    """Deactivates a URL by the `secret_key`
+
+    Args:
+        db (AsyncSession): Connect to a database
+        secret_key (str): url secret key stored in database
+
+    Returns:
+        models.URL: set the `is_active` attribute to False
+    """
+    db_url = await get_db_url_by_secret_key(db, secret_key)
+    if db_url:
+        db_url.is_active = False
+        await db.commit()
+        await db.refresh(db_url)
+        crud.evict_target(db_url.key)
+        key_filter.remove(db_url.key)
+    return db_url
@@ -0,0 +1,120 @@
+# Redirect and create latency under a spike, with and without admission control.
+# Each configuration sends GET /{key} and POST /url at once from many clients
+# (a quarter of them creating) through the app in this process. Without
+# admission control every request waits for a threadpool thread and a
+# database connection; with it the requests over the limits queue for a
+# short deadline, redirects first, or are answered 503 at once.
+#     python -m shortener_app.benchmarks.bench_admission --clients 64 256
+import argparse
+import asyncio
+import json
+import random
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_admission"
+
+
+# 1. Migrate the database and create `urls` URLs to redirect.
+# 2. Run `clients` concurrent clients for `requests` requests in total.
+# 3. Return, per route class, the served requests per second, their latency
+#    percentiles and the shed (503) or failed requests.
+async def measure(requests: int, clients: int, urls: int) -> dict:
+    import httpx
+
+    from .. import crud, schemas
+    from ..admission import admission
+    from ..database import SessionLocal
+    from ..main import app, migrate_databases, start_click_counter
+
+    migrate_databases()
+    start_click_counter()
+    db = SessionLocal()
+    try:
+        keys = [
+            db_url.key
+            for db_url in crud.create_db_urls(
+                db, [schemas.URLBase(target_url=f"https://example.com/{n}") for n in range(urls)]
+            )
+        ]
+    finally:
+        db.close()
+    results = {name: {"latencies": [], "shed": 0, "errors": 0} for name in ("redirect", "create")}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+
+        async def send(name: str, number: int) -> None:
+            result = results[name]
+            try:
+                with Timer() as timer:
+                    if name == "create":
+                        response = await client.post(
+                            "/url", json={"target_url": f"https://example.org/{number}"}
+                        )
+                    else:
+                        response = await client.get(f"/{random.choice(keys)}")
+            except Exception:
+                result["errors"] += 1
+                return
+            if response.status_code == 503:
+                result["shed"] += 1
+            elif response.status_code >= 400:
+                result["errors"] += 1
+            else:
+                result["latencies"].append(timer.elapsed)
+
+        async def run_client(first: int) -> None:
+            name = "create" if first % 4 == 0 else "redirect"
+            for number in range(first, requests, clients):
+                await send(name, number)
+
+        with Timer() as total:
+            await asyncio.gather(*(run_client(first) for first in range(clients)))
+    summary = {
+        name: {
+            "per_sec": round(len(result["latencies"]) / total.elapsed, 1),
+            "shed": result["shed"],
+            "errors": result["errors"],
+            **percentiles(result["latencies"]),
+        }
+        for name, result in results.items()
+    }
+    max_wait = max(counters["max_wait_seconds"] for counters in admission.counters.values())
+    summary["max_wait_ms"] = round(max_wait * 1000, 3)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency under a spike with admission control")
+    parser.add_argument("--clients", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--urls", type=int, default=1000)
+    parser.add_argument("--queue-timeout", type=float, default=0.5)
+    parser.add_argument("--profile", default="durable", help="DB_PROFILE of the database")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(measure(args.requests, args.clients[0], args.urls))))
+        return
+
+    results = {}
+    for clients in args.clients:
+        for mode, enabled in (("open", "false"), ("admission", "true")):
+            results[f"{mode}-{clients}"] = run_worker(
+                MODULE,
+                {
+                    "DB_URL": temp_db_url(),
+                    "DB_PROFILE": args.profile,
+                    "ADMISSION_ENABLED": enabled,
+                    "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+                    "METRICS_ENABLED": "false",
+                    "REDIRECT_CACHE_SIZE": "0",
+                },
+                [f"--requests={args.requests}", f"--clients={clients}", f"--urls={args.urls}"],
+            )
+            print(f"{clients:>4} clients, {mode:>9}: {results[f'{mode}-{clients}']}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Concurrent redirect throughput with sync handlers vs. async_mode.
+# The redirect cache is disabled, so every redirect reaches the database.
+#     python -m shortener_app.benchmarks.bench_async --requests 5000 --concurrency 64
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_async"
+
+
+# 1. Create `urls` short links through the API.
+# 2. Fire `requests` redirects at random keys, at most `concurrency` in flight.
+# 3. Return the throughput and the latency percentiles.
+async def measure(urls: int, requests: int, concurrency: int) -> dict:
+    import httpx
+
+    from ..main import app, migrate_databases
+
+    migrate_databases()
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        keys = []
+        for number in range(urls):
+            response = await client.post(
+                "/url", json={"target_url": f"https://example.com/{number}"}
+            )
+            keys.append(response.json()["url"].rsplit("/", 1)[-1])
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def redirect(key: str) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(f"/{key}", follow_redirects=False)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 307
+
+        with Timer() as timer:
+            await asyncio.gather(
+                *(redirect(random.choice(keys)) for _ in range(requests))
+            )
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_sec": round(requests / timer.elapsed, 1),
+        **percentiles(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Redirect throughput, sync vs. async mode")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(measure(args.urls, args.requests, args.concurrency))
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for mode, async_mode in (("sync", "false"), ("async", "true")):
+        results[mode] = run_worker(
+            MODULE,
+            {
+                "ASYNC_MODE": async_mode,
+                "DB_URL": temp_db_url(),
+                "REDIRECT_CACHE_SIZE": "0",
+            },
+            [
+                f"--urls={args.urls}",
+                f"--requests={args.requests}",
+                f"--concurrency={args.concurrency}",
+            ],
+        )
+        print(f"{mode:>5}: {results[mode]}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
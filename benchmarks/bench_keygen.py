@@ -0,0 +1,85 @@
+# Create latency vs. table size for the key allocators.
+# The key length is kept short (3 characters, 46656 keys) so a few ten thousand
+# rows are enough to crowd the key space of the retry loop.
+#     python -m shortener_app.benchmarks.bench_keygen --sizes 1000 20000 40000
+import argparse
+import itertools
+import json
+import random
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_keygen"
+
+# name -> settings of the allocator
+ALLOCATORS = {
+    # The original behaviour: random keys, retried until free, never growing.
+    "random-fixed": {"KEY_ALLOCATOR": "random", "KEY_OCCUPANCY_THRESHOLD": "1.0"},
+    "random": {"KEY_ALLOCATOR": "random"},
+    "pool": {"KEY_ALLOCATOR": "pool"},
+    "counter": {"KEY_ALLOCATOR": "counter"},
+}
+
+
+# 1. Fill the urls table with `size` rows holding random keys of `length` chars.
+# 2. Create `creates` URLs one by one with crud.create_db_url.
+# 3. Return the latency percentiles of the creates.
+def measure(size: int, creates: int, length: int) -> dict:
+    from sqlalchemy import insert
+
+    from .. import crud, models, schemas
+    from ..database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    space = ["".join(chars) for chars in itertools.product(alphabet, repeat=length)]
+    rows = [
+        {"key": key, "secret_key": f"{key}_seed", "target_url": "https://example.com/"}
+        for key in random.sample(space, min(size, len(space)))
+    ]
+    with engine.begin() as connection:
+        if rows:
+            connection.execute(insert(models.URL.__table__), rows)
+
+    db = SessionLocal()
+    latencies = []
+    url = schemas.URLBase(target_url="https://example.com/new")
+    try:
+        for _ in range(creates):
+            with Timer() as timer:
+                crud.create_db_url(db, url)
+            latencies.append(timer.elapsed)
+    finally:
+        db.close()
+    return {"size": size, "creates": creates, **percentiles(latencies)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create latency vs. table size per key allocator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 20000, 40000])
+    parser.add_argument("--creates", type=int, default=200)
+    parser.add_argument("--length", type=int, default=3)
+    parser.add_argument("--allocators", nargs="+", default=list(ALLOCATORS))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.sizes[0], args.creates, args.length)))
+        return
+
+    results = {}
+    for name in args.allocators:
+        results[name] = []
+        for size in args.sizes:
+            result = run_worker(
+                MODULE,
+                {**ALLOCATORS[name], "KEY_LENGTH": str(args.length), "DB_URL": temp_db_url()},
+                [f"--sizes={size}", f"--creates={args.creates}", f"--length={args.length}"],
+            )
+            results[name].append(result)
+            print(f"{name:>12} {size:>8} rows: {result}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
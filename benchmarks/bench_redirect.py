@@ -0,0 +1,140 @@
+# Redirect lookup and admin info, before and after the fast path.
+# The redirect cache is disabled, so every lookup reaches the database:
+# * lookup: the ORM lookup (Session + Query) against crud.get_target_url_fast
+#   (compiled SELECT on a pooled DBAPI connection);
+# * admin_info: URL parsing, url_path_for and a validated URLInfo on each call
+#   against main.get_admin_info (URL templates built once, URLInfo.construct);
+# * redirect: end-to-end redirects with REDIRECT_FAST_PATH off and on.
+#     python -m shortener_app.benchmarks.bench_redirect --lookups 20000
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_redirect"
+
+
+def timed_loop(function, arguments) -> dict:
+    """Call `function` on every argument and return the rate and percentiles."""
+    latencies = []
+    with Timer() as total:
+        for argument in arguments:
+            start = time.perf_counter()
+            function(argument)
+            latencies.append(time.perf_counter() - start)
+    return {"per_sec": round(len(latencies) / total.elapsed, 1), **percentiles(latencies)}
+
+
+# 1. Create `urls` short links through the API.
+# 2. Time the lookups and the admin info of random keys, before and after.
+# 3. Time `requests` end-to-end redirects through the handler of this process.
+async def measure(urls: int, lookups: int, requests: int) -> dict:
+    import httpx
+    from starlette.datastructures import URL
+
+    from .. import crud, schemas
+    from ..config import get_settings
+    from ..database import ReadSessionLocal, SessionLocal
+    from ..main import app, get_admin_info, migrate_databases
+
+    migrate_databases()
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        keys = []
+        for number in range(urls):
+            response = await client.post(
+                "/url", json={"target_url": f"https://example.com/{number}"}
+            )
+            keys.append(response.json()["url"].rsplit("/", 1)[-1])
+        sample = [random.choice(keys) for _ in range(lookups)]
+
+        def orm_lookup(url_key: str) -> None:
+            db = ReadSessionLocal()
+            try:
+                crud.get_target_url_by_key(db, url_key)
+            finally:
+                db.close()
+
+        def formatted_admin_info(db_url) -> schemas.URLInfo:
+            base_url = URL(get_settings().base_url)
+            admin_endpoint = app.url_path_for("administration info", secret_key=db_url.secret_key)
+            return schemas.URLInfo(
+                target_url=db_url.target_url,
+                is_active=db_url.is_active,
+                clicks=db_url.clicks,
+                url=str(base_url.replace(path=db_url.key)),
+                admin_url=str(base_url.replace(path=admin_endpoint)),
+            )
+
+        db = SessionLocal()
+        try:
+            db_urls = [crud.get_db_url_by_key(db, url_key) for url_key in keys]
+            admin_sample = [random.choice(db_urls) for _ in range(lookups)]
+            result = {
+                "lookup": {
+                    "orm": timed_loop(orm_lookup, sample),
+                    "fast": timed_loop(crud.get_target_url_fast, sample),
+                },
+                "admin_info": {
+                    "formatted": timed_loop(formatted_admin_info, admin_sample),
+                    "templates": timed_loop(get_admin_info, admin_sample),
+                },
+            }
+        finally:
+            db.close()
+
+        latencies = []
+        with Timer() as total:
+            for url_key in sample[:requests]:
+                start = time.perf_counter()
+                response = await client.get(f"/{url_key}", follow_redirects=False)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 307
+        result["redirect"] = {
+            "per_sec": round(len(latencies) / total.elapsed, 1),
+            **percentiles(latencies),
+        }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Redirect fast path, before and after")
+    parser.add_argument("--urls", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(measure(args.urls, args.lookups, args.requests))))
+        return
+
+    results = {}
+    for mode, fast_path in (("orm", "false"), ("fast", "true")):
+        results[mode] = run_worker(
+            MODULE,
+            {
+                "DB_URL": temp_db_url(),
+                "REDIRECT_CACHE_SIZE": "0",
+                "REDIRECT_FAST_PATH": fast_path,
+            },
+            [f"--urls={args.urls}", f"--lookups={args.lookups}", f"--requests={args.requests}"],
+        )
+    for name, before, after in (
+        ("lookup", results["orm"]["lookup"]["orm"], results["orm"]["lookup"]["fast"]),
+        (
+            "admin_info",
+            results["orm"]["admin_info"]["formatted"],
+            results["orm"]["admin_info"]["templates"],
+        ),
+        ("redirect", results["orm"]["redirect"], results["fast"]["redirect"]),
+    ):
+        print(f"{name:>10}: before {before}")
+        print(f"{'':>10}  after  {after}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Write throughput vs. shard count.
+# Each configuration creates URLs from many threads at once with
+# crud.create_db_url; every commit of a SQLite file takes its write lock, so
+# one file serializes them and N shards allow up to N commits at a time.
+# The gain needs several cores and a disk where fsync costs something.
+# The counter allocator is used by default: the random allocator reads the
+# highest id of every shard on each create to check the key space occupancy.
+#     python -m shortener_app.benchmarks.bench_sharding --shards 1 2 4 8
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_sharding"
+
+
+# 1. Migrate the main database and every shard.
+# 2. Create `creates` URLs from `threads` threads, one session per create.
+# 3. Return the creates per second and the latency percentiles.
+def measure(creates: int, threads: int) -> dict:
+    from .. import crud, schemas
+    from ..database import SessionLocal, engine, engines
+    from ..migrations import migrate
+
+    for migrated_engine in dict.fromkeys([engine, *engines()]):
+        migrate(migrated_engine)
+    url = schemas.URLBase(target_url="https://example.com/new")
+
+    def create(_) -> float:
+        db = SessionLocal()
+        try:
+            with Timer() as timer:
+                crud.create_db_url(db, url)
+            return timer.elapsed
+        finally:
+            db.close()
+
+    with Timer() as total, ThreadPoolExecutor(threads) as pool:
+        latencies = list(pool.map(create, range(creates)))
+    return {
+        "creates_per_sec": round(creates / total.elapsed, 1),
+        **percentiles(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write throughput vs. shard count")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--creates", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--profile", default="durable", help="DB_PROFILE of every shard")
+    parser.add_argument("--allocator", default="counter", help="KEY_ALLOCATOR")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.creates, args.threads)))
+        return
+
+    from ..sharding import ShardMap
+
+    results = {}
+    for shards in args.shards:
+        db_url = temp_db_url()
+        base, extension = os.path.splitext(db_url)
+        map_path = os.path.join(os.path.dirname(db_url[len("sqlite:///") :]), "shards.json")
+        ShardMap.create(
+            [db_url] + [f"{base}-{number}{extension}" for number in range(1, shards)]
+        ).save(map_path)
+        results[shards] = run_worker(
+            MODULE,
+            {
+                "DB_URL": db_url,
+                "SHARD_MAP": map_path,
+                "DB_PROFILE": args.profile,
+                "KEY_ALLOCATOR": args.allocator,
+                "DB_BUSY_TIMEOUT": "30000",
+            },
+            [f"--creates={args.creates}", f"--threads={args.threads}"],
+        )
+        print(f"{shards:>3} shards: {results[shards]}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
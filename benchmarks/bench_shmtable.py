@@ -0,0 +1,143 @@
+# Memory per worker and redirect lookup latency, per-process cache against the
+# shared table, with 1, 4 and 16 worker processes running at once.
+# Every worker caches all the URLs: in its own redirect cache (filled like the
+# startup warmup), or in the shared table the workers map together (filled by
+# the creates). Memory is read from /proc/self/smaps_rollup (Linux): USS is
+# the memory of the worker alone, PSS also counts its share of the mapped
+# table, so the sum of the PSS of the workers is the memory they use together.
+# The lookups are crud.get_target_url_fast calls on random keys, all
+# served from the cache or the table.
+#     python -m shortener_app.benchmarks.bench_shmtable --workers 1 4 16
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from .common import percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_shmtable"
+
+
+def memory_kb() -> Dict[str, int]:
+    """USS and PSS of this process, in kB."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    return {"uss": fields["Private_Clean"] + fields["Private_Dirty"], "pss": fields["Pss"]}
+
+
+# Create `urls` URLs in batches; with the shared table, the creates fill it.
+def setup(urls: int) -> dict:
+    from .. import crud, schemas
+    from ..database import SessionLocal
+    from ..main import migrate_databases
+
+    migrate_databases()
+    db = SessionLocal()
+    try:
+        for start in range(0, urls, 1000):
+            crud.create_db_urls(
+                db,
+                [
+                    schemas.URLBase(target_url=f"https://example.com/{number}")
+                    for number in range(start, min(start + 1000, urls))
+                ],
+            )
+    finally:
+        db.close()
+    return {"urls": urls}
+
+
+# 1. Load the keys and measure the memory.
+# 2. Without the shared table, fill the redirect cache of this worker with every URL.
+# 3. Time `lookups` lookups of random keys, and measure the memory again.
+def measure(urls: int, lookups: int) -> dict:
+    from .. import crud
+    from ..cache import RedirectTarget, redirect_cache
+    from ..database import SessionLocal
+    from ..shmtable import shared_table
+
+    db = SessionLocal()
+    try:
+        hot_urls = crud.get_hot_urls(db, urls)
+    finally:
+        db.close()
+    sample = [random.choice(hot_urls)[0] for _ in range(lookups)]
+    latencies = []
+    before = memory_kb()
+    if not shared_table.enabled:
+        for key, target_url, _, expires_at, max_age in hot_urls:
+            redirect_cache.put(key, RedirectTarget(target_url, expires_at, max_age))
+    for url_key in sample:
+        start = time.perf_counter()
+        target = crud.get_target_url_fast(url_key)
+        latencies.append(time.perf_counter() - start)
+        assert target is not None
+    after = memory_kb()
+    return {
+        "uss_kb": after["uss"] - before["uss"],
+        "pss_kb": after["pss"] - before["pss"],
+        **percentiles(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-process cache against the shared table")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--urls", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--slot-bytes", type=int, default=256, help="SHARED_TABLE_SLOT_BYTES")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        print(json.dumps(setup(args.urls)))
+        return
+    if args.worker:
+        print(json.dumps(measure(args.urls, args.lookups)))
+        return
+
+    results = {}
+    for mode in ("process", "shared"):
+        env = {
+            "DB_URL": temp_db_url(),
+            "REDIRECT_CACHE_SIZE": str(args.urls),
+            "REDIRECT_CACHE_TTL": "0",
+            "METRICS_ENABLED": "false",
+            "KEY_ALLOCATOR": "counter",
+        }
+        if mode == "shared":
+            env["SHARED_TABLE_PATH"] = os.path.join(tempfile.mkdtemp(), "table.shm")
+            env["SHARED_TABLE_SLOTS"] = str(args.urls * 3 // 2)
+            env["SHARED_TABLE_SLOT_BYTES"] = str(args.slot_bytes)
+        run_worker(MODULE, env, ["--setup", f"--urls={args.urls}"])
+        for workers in args.workers:
+            with ThreadPoolExecutor(workers) as pool:
+                runs = list(
+                    pool.map(
+                        lambda _: run_worker(
+                            MODULE, env, [f"--urls={args.urls}", f"--lookups={args.lookups}"]
+                        ),
+                        range(workers),
+                    )
+                )
+            result = {
+                name: round(sum(run[name] for run in runs) / workers, 3)
+                for name in ("uss_kb", "pss_kb", "p50_ms", "p95_ms", "p99_ms")
+            }
+            result["total_pss_kb"] = sum(run["pss_kb"] for run in runs)
+            results[f"{mode}-{workers}"] = result
+            print(f"{mode:>7}, {workers:>2} workers: {result}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
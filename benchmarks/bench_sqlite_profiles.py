@@ -0,0 +1,116 @@
+# Mixed read/write throughput of the SQLite engine profiles.
+# Reader threads run redirect lookups while writer threads commit click updates.
+#     python -m shortener_app.benchmarks.bench_sqlite_profiles --seconds 5
+import argparse
+import json
+import random
+import threading
+import time
+
+from .common import percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_sqlite_profiles"
+
+# name -> settings of the configuration
+CONFIGURATIONS = {
+    "default": {"DB_PROFILE": "default"},
+    "wal": {"DB_PROFILE": "wal"},
+    "wal+read-pool": {"DB_PROFILE": "wal", "DB_READ_ONLY_POOL": "true"},
+    "durable": {"DB_PROFILE": "durable"},
+}
+
+
+# 1. Seed `urls` rows.
+# 2. Run `readers` threads looking up random keys through ReadSessionLocal and
+#    `writers` threads committing one click update each, for `seconds`.
+# 3. Return the operations per second and the read latency percentiles.
+def measure(urls: int, readers: int, writers: int, seconds: float) -> dict:
+    from sqlalchemy import insert
+
+    from .. import crud, models
+    from ..database import ReadSessionLocal, SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    keys = [f"K{number:06d}" for number in range(urls)]
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.URL.__table__),
+            [{"key": key, "secret_key": f"{key}_s", "target_url": "https://example.com/"} for key in keys],
+        )
+
+    deadline = time.perf_counter() + seconds
+    read_latencies, write_counts, errors = [], [0], [0]
+    lock = threading.Lock()
+
+    def read() -> None:
+        samples = []
+        while time.perf_counter() < deadline:
+            db = ReadSessionLocal()
+            start = time.perf_counter()
+            try:
+                crud.get_target_url_by_key(db, random.choice(keys))
+            except Exception:
+                errors[0] += 1
+            finally:
+                db.close()
+            samples.append(time.perf_counter() - start)
+        with lock:
+            read_latencies.extend(samples)
+
+    def write() -> None:
+        while time.perf_counter() < deadline:
+            db = SessionLocal()
+            try:
+                crud.add_db_clicks(db, {random.choice(keys): 1})
+                with lock:
+                    write_counts[0] += 1
+            except Exception:
+                errors[0] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    threads += [threading.Thread(target=write) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "reads_per_sec": round(len(read_latencies) / seconds, 1),
+        "writes_per_sec": round(write_counts[0] / seconds, 1),
+        "errors": errors[0],
+        **{f"read_{name}": value for name, value in percentiles(read_latencies).items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mixed read/write throughput per SQLite profile")
+    parser.add_argument("--urls", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--configurations", nargs="+", default=list(CONFIGURATIONS))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    options = [
+        f"--urls={args.urls}",
+        f"--readers={args.readers}",
+        f"--writers={args.writers}",
+        f"--seconds={args.seconds}",
+    ]
+
+    if args.worker:
+        print(json.dumps(measure(args.urls, args.readers, args.writers, args.seconds)))
+        return
+
+    results = {}
+    for name in args.configurations:
+        env = {**CONFIGURATIONS[name], "DB_URL": temp_db_url(), "REDIRECT_CACHE_SIZE": "0"}
+        results[name] = run_worker(MODULE, env, options)
+        print(f"{name:>14}: {results[name]}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Cold start of a worker: import, startup hooks and first requests.
+# Every run is a fresh process on the same database, like a restarted worker:
+# * import: `import shortener_app.main`;
+# * startup: the startup hooks (migration, background threads, warmup start);
+# * ready: from the import until the warmup is done, when /admin/ready turns 200;
+# * first_page, first_create, first_redirect: the first request of each kind,
+#   sent once the worker is ready, as a load balancer would.
+#     python -m shortener_app.benchmarks.bench_startup --runs 10
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from .common import run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_startup"
+
+
+# 1. Import the app and run its startup hooks, timing both.
+# 2. Wait for the warmup to finish.
+# 3. Send a first page, create and redirect request, then run the shutdown hooks.
+async def measure() -> dict:
+    import httpx
+
+    start = time.perf_counter()
+    from ..main import app
+    imported = time.perf_counter()
+
+    from ..warmup import warmup
+
+    await app.router.startup()
+    result = {"import_ms": imported - start, "startup_ms": time.perf_counter() - imported}
+    warmup.wait(30)
+    result["ready_ms"] = time.perf_counter() - start
+    async with httpx.AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        for name, method, path, body in (
+            ("first_page_ms", "GET", "/", None),
+            ("first_create_ms", "POST", "/url", {"target_url": "https://example.com/"}),
+        ):
+            request_start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            result[name] = time.perf_counter() - request_start
+            assert response.status_code == 200, response.text
+        key = response.json()["url"].rsplit("/", 1)[-1]
+        request_start = time.perf_counter()
+        response = await client.get(f"/{key}", follow_redirects=False)
+        result["first_redirect_ms"] = time.perf_counter() - request_start
+        assert response.status_code == 307
+    await app.router.shutdown()
+    return {name: round(seconds * 1000, 2) for name, seconds in result.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import, startup and first-request latency")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(measure())))
+        return
+
+    db_url = temp_db_url()
+    runs = [run_worker(MODULE, {"DB_URL": db_url}) for _ in range(args.runs)]
+    # The first run creates the database, the others start on an existing one.
+    results = {"first_run": runs[0]}
+    if len(runs) > 1:
+        results["median"] = {
+            name: round(statistics.median(run[name] for run in runs[1:]), 2) for name in runs[0]
+        }
+    for label, result in results.items():
+        print(f"{label:>9}: {result}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
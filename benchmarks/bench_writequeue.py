@@ -0,0 +1,96 @@
+# Create throughput with and without the group commit of the write queue.
+# Each configuration sends POST /url from 1 to 256 concurrent clients through
+# the app in this process. Without the queue every create commits on its own,
+# in the threadpool; with it the creates of concurrent clients are committed
+# together by the writer thread. The "durable" profile (synchronous=FULL)
+# makes every commit pay its fsync, like a production database.
+#     python -m shortener_app.benchmarks.bench_writequeue --clients 1 16 256
+import argparse
+import asyncio
+import json
+
+from .common import Timer, percentiles, run_worker, temp_db_url
+
+MODULE = "shortener_app.benchmarks.bench_writequeue"
+
+
+# 1. Migrate the database.
+# 2. Send `creates` POST /url from `clients` concurrent clients.
+# 3. Return the creates per second, the latency percentiles, the failed
+#    creates (e.g. pool timeouts) and the batches.
+async def measure(creates: int, clients: int) -> dict:
+    import httpx
+
+    from ..main import app, migrate_databases, start_click_counter
+    from ..writequeue import write_queue
+
+    migrate_databases()
+    start_click_counter()
+    latencies = []
+    errors = 0
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+
+        async def create(number: int) -> None:
+            nonlocal errors
+            try:
+                with Timer() as timer:
+                    response = await client.post(
+                        "/url", json={"target_url": f"https://example.com/{number}"}
+                    )
+                response.raise_for_status()
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(timer.elapsed)
+
+        async def run_client(first: int) -> None:
+            for number in range(first, creates, clients):
+                await create(number)
+
+        with Timer() as total:
+            await asyncio.gather(*(run_client(first) for first in range(clients)))
+    write_queue.stop()
+    return {
+        "creates_per_sec": round(len(latencies) / total.elapsed, 1),
+        "errors": errors,
+        **percentiles(latencies),
+        "mean_batch": write_queue.stats()["mean_batch"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create throughput with the write queue")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--creates", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait", type=float, default=0.002)
+    parser.add_argument("--profile", default="durable", help="DB_PROFILE of the database")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(measure(args.creates, args.clients[0]))))
+        return
+
+    results = {}
+    for clients in args.clients:
+        for mode, enabled in (("commit", "false"), ("queue", "true")):
+            results[f"{mode}-{clients}"] = run_worker(
+                MODULE,
+                {
+                    "DB_URL": temp_db_url(),
+                    "DB_PROFILE": args.profile,
+                    "DB_BUSY_TIMEOUT": "30000",
+                    "WRITE_QUEUE_ENABLED": enabled,
+                    "WRITE_QUEUE_MAX_BATCH": str(args.max_batch),
+                    "WRITE_QUEUE_MAX_WAIT": str(args.max_wait),
+                    "METRICS_ENABLED": "false",
+                },
+                [f"--creates={args.creates}", f"--clients={clients}"],
+            )
+            print(f"{clients:>4} clients, {mode:>6}: {results[f'{mode}-{clients}']}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
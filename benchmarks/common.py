@@ -0,0 +1,74 @@
+# Helpers shared by the benchmark scripts.
+# The benchmarks import the app like the tests do, so run them as modules from
+# the directory that contains `shortener_app`, `static` and `templates`:
+#     python -m shortener_app.benchmarks.bench_async
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+
+# 1. Sort the samples once.
+# 2. Pick the sample at each requested rank (nearest-rank method).
+# 3. Return the percentiles in milliseconds.
+def percentiles(samples: List[float], ranks=(50, 95, 99)) -> Dict[str, float]:
+    """Latency percentiles of a list of durations in seconds.
+
+    Args:
+        samples (List[float]): durations in seconds
+        ranks (tuple): percentiles to report
+
+    Returns:
+        Dict[str, float]: e.g. {"p50_ms": 0.4, "p95_ms": 1.2, "p99_ms": 2.0}
+    """
+    if not samples:
+        return {f"p{rank}_ms": 0.0 for rank in ranks}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        f"p{rank}_ms": round(ordered[min(last, int(rank / 100 * len(ordered)))] * 1000, 3)
+        for rank in ranks
+    }
+
+
+def temp_db_url(name: str = "bench.db") -> str:
+    """A SQLite database URL in a fresh temporary directory."""
+    return f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='shortener-bench-'), name)}"
+
+
+# 1. Start `python -m <module> --worker` with the extra environment variables.
+# 2. The settings are read once at import, so every configuration needs its own process.
+# 3. The worker prints its result as JSON on the last line of stdout.
+def run_worker(module: str, env: Dict[str, str], args: Optional[List[str]] = None) -> dict:
+    """Run a benchmark worker in a subprocess and return its JSON result.
+
+    Args:
+        module (str): module to run, e.g. "shortener_app.benchmarks.bench_async"
+        env (Dict[str, str]): settings passed as environment variables
+        args (List[str], optional): extra command line arguments
+
+    Returns:
+        dict: the decoded JSON result of the worker
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", module, "--worker", *(args or [])],
+        env={**os.environ, **env},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class Timer:
+    """Context manager measuring wall-clock time with perf_counter."""
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.elapsed = time.perf_counter() - self.start
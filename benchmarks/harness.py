@@ -0,0 +1,229 @@
+# Reproducible benchmark of the hot endpoints, driven in-process through ASGI.
+# A temporary SQLite database is seeded with `--rows` URLs, then every scenario
+# runs `--requests` requests with `--concurrency` in flight:
+# - redirect: GET /{key}, keys drawn from a Zipf distribution (few hot keys),
+# - create:   POST /url,
+# - admin:    GET /admin/{secret_key}, uniformly drawn,
+# - delete:   DELETE /admin/{secret_key}, every seeded key at most once.
+# The report is JSON. With --baseline, the run fails (exit status 1) when a
+# scenario's p95 latency or throughput is worse than the baseline by more than
+# --threshold.
+#     python -m shortener_app.benchmarks.harness --rows 100000 --output run.json
+#     python -m shortener_app.benchmarks.harness --rows 100000 --baseline run.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+from .common import Timer, percentiles, temp_db_url
+
+SCENARIOS = ("redirect", "create", "admin", "delete")
+
+
+def seeded_key(number: int) -> str:
+    """Key of the seeded URL `number`; 7 digits never collide with generated keys."""
+    return f"{number:07d}"
+
+
+# 1. Draw a rank in [0, n) with P(rank k) proportional to 1 / (k + 1) ** s, by
+#    inverting the CDF of the continuous Zipf distribution, in constant memory.
+def zipf_sampler(n: int, s: float, rng: random.Random) -> Callable[[], int]:
+    if s == 1.0:
+        return lambda: min(n - 1, int(n ** rng.random()) - 1)
+    exponent = 1.0 - s
+    top = n**exponent - 1.0
+    return lambda: min(n - 1, int((top * rng.random() + 1.0) ** (1.0 / exponent)) - 1)
+
+
+# 1. Insert `rows` URLs with sqlite3 executemany, in chunks of 100k rows.
+# 2. The schema has already been created by importing the app.
+def seed(db_path: str, rows: int) -> None:
+    from ..dedup import url_digest
+
+    connection = sqlite3.connect(db_path)
+    chunk = 100_000
+    for start in range(0, rows, chunk):
+        connection.executemany(
+            "INSERT INTO urls (key, secret_key, target_url, target_hash, is_active, clicks)"
+            " VALUES (?, ?, ?, ?, 1, 0)",
+            (
+                (
+                    seeded_key(number),
+                    f"{seeded_key(number)}_SEED",
+                    f"https://example.com/{number}",
+                    url_digest(f"https://example.com/{number}"),
+                )
+                for number in range(start, min(rows, start + chunk))
+            ),
+        )
+        connection.commit()
+    connection.close()
+
+
+# 1. Run `requests` calls of `send`, at most `concurrency` in flight.
+# 2. Return the throughput, the error count and the latency percentiles.
+async def run_scenario(send, requests: int, concurrency: int, expected: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(number: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(number)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                errors += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*(one(number) for number in range(requests)))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "requests_per_sec": round(requests / timer.elapsed, 1),
+        **percentiles(latencies),
+    }
+
+
+async def run(args) -> Dict[str, dict]:
+    import httpx
+
+    from ..main import app
+
+    rng = random.Random(args.seed)
+    zipf = zipf_sampler(args.rows, args.zipf, rng)
+    # Deletes take keys from the end of the table, the redirects hit the start.
+    deleted = iter(range(args.rows - 1, -1, -1))
+
+    senders = {
+        "redirect": (
+            lambda client, number: client.get(
+                f"/{seeded_key(zipf())}", follow_redirects=False
+            ),
+            307,
+        ),
+        "create": (
+            lambda client, number: client.post(
+                "/url", json={"target_url": f"https://example.org/{number}"}
+            ),
+            200,
+        ),
+        "admin": (
+            lambda client, number: client.get(
+                f"/admin/{seeded_key(rng.randrange(args.rows))}_SEED"
+            ),
+            200,
+        ),
+        "delete": (
+            lambda client, number: client.delete(f"/admin/{seeded_key(next(deleted))}_SEED"),
+            200,
+        ),
+    }
+
+    results = {}
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for name in args.scenarios:
+                send, expected = senders[name]
+                requests = min(args.requests, args.rows) if name == "delete" else args.requests
+                results[name] = await run_scenario(
+                    lambda number: send(client, number), requests, args.concurrency, expected
+                )
+                print(f"{name:>9}: {results[name]}", file=sys.stderr)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+# 1. Compare every scenario of the baseline with the current run.
+# 2. A regression is a p95 latency above, or a throughput below, the baseline
+#    by more than `threshold` (a fraction).
+def find_regressions(report: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, before in baseline.get("scenarios", {}).items():
+        after = report["scenarios"].get(name)
+        if after is None:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {after['p95_ms']}ms")
+        if after["requests_per_sec"] < before["requests_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {before['requests_per_sec']} -> {after['requests_per_sec']} req/s"
+            )
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="In-process benchmark of the hot endpoints")
+    parser.add_argument("--rows", type=int, default=10_000, help="seeded URLs (10k to 10M)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the redirect keys")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression")
+    args = parser.parse_args()
+
+    # The settings are read when the app is imported, so the database is set first.
+    db_url = temp_db_url()
+    os.environ["DB_URL"] = db_url
+    from ..database import engine
+    from ..migrations import migrate
+
+    migrate(engine)
+    with Timer() as seeding:
+        seed(db_url[len("sqlite:///") :], args.rows)
+    print(f"Seeded {args.rows} rows in {seeding.elapsed:.1f}s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "rows": args.rows,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "zipf": args.zipf,
+            "seed": args.seed,
+        },
+        "scenarios": asyncio.run(run(args)),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            report_file.write(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = find_regressions(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
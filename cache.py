@@ -0,0 +1,109 @@
+# In-process caches that sit in front of the database on the hot paths.
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from .config import get_settings
+
+
+# 1. The LRUCache class keeps at most `maxsize` entries in insertion/usage order.
+# 2. Every entry remembers when it expires, so stale entries are never served.
+# 3. A hit moves the entry to the end of the OrderedDict (most recently used).
+# 4. When the cache is full, the least recently used entry is evicted.
+# 5. A lock makes the cache safe to share between the threadpool workers.
+class LRUCache:
+    """A bounded, thread-safe LRU cache with a per-entry time to live.
+
+    Args:
+        maxsize (int): maximum number of entries kept in memory.
+        ttl (float): seconds an entry stays valid. `0` disables expiry.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`, evicting the oldest entry when full."""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Drop `key` from the cache, if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry, keeping the counters."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/eviction counters and the current size."""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# 1. The redirect cache keeps the target URL of a key with the unix time the
+#    URL expires at, so a cache hit rejects an expired URL without a query.
+# 2. It also keeps the HTTP cache max-age of the URL, if it has its own, for
+#    the Cache-Control header of the redirect (see redirects.py).
+# 3. URLs with a maximum number of clicks are never cached: their clicks are
+#    checked against the database row on every redirect.
+class RedirectTarget(NamedTuple):
+    """A redirect: the target URL, its expiry, cache max-age and click limit, if any."""
+
+    url: str
+    expires_at: Optional[int] = None
+    max_age: Optional[int] = None
+    max_clicks: Optional[int] = None
+
+    def live(self) -> Optional["RedirectTarget"]:
+        """The redirect, or None once the URL has expired."""
+        if self.expires_at is not None and self.expires_at <= time.time():
+            return None
+        return self
+
+
+# The redirect cache maps an active url key to its RedirectTarget.
+redirect_cache = LRUCache(
+    maxsize=get_settings().redirect_cache_size,
+    ttl=get_settings().redirect_cache_ttl,
+)
@@ -0,0 +1,134 @@
+# Write-behind click counting: redirects only touch memory, a background
+# thread folds the pending increments into the database in batches.
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from . import crud
+from .config import get_settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Flushes the pending counts with a new database session.
+# 2. All keys are updated in one transaction by crud.add_db_clicks.
+# 3. The session is always closed, even when the update fails.
+def write_clicks(clicks: Dict[str, int]) -> None:
+    """Persist coalesced click counts in a single transaction.
+
+    Args:
+        clicks (Dict[str, int]): number of new clicks per url key
+    """
+    db = SessionLocal()
+    try:
+        crud.add_db_clicks(db, clicks)
+    finally:
+        db.close()
+
+
+# 1. The ClickCounter coalesces the clicks of every key in a Counter.
+# 2. The counts are flushed every `flush_interval` seconds by a background thread.
+# 3. When `flush_threshold` clicks are pending, the thread is woken up early.
+# 4. While a batch is being written it stays visible to pending(), so the admin
+#    info never under-reports clicks.
+# 5. stop() flushes whatever is left, so no click is lost on shutdown.
+class ClickCounter:
+    """In-memory click accumulator with batched write-behind.
+
+    Args:
+        flush_interval (float): seconds between two flushes.
+        flush_threshold (int): pending clicks that trigger an early flush.
+        writer (Callable): persists a batch of counts, defaults to write_clicks.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        flush_threshold: int = 1000,
+        writer: Optional[Callable[[Dict[str, int]], None]] = None,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._writer = writer or write_clicks
+        self._pending: Counter = Counter()
+        self._flushing: Counter = Counter()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, url_key: str, count: int = 1) -> None:
+        """Record `count` clicks for `url_key`."""
+        with self._lock:
+            self._pending[url_key] += count
+            self._total += count
+            full = self._total >= self.flush_threshold
+        if self._thread is None:
+            self.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, url_key: str) -> int:
+        """Clicks recorded for `url_key` that are not yet in the database."""
+        with self._lock:
+            return self._pending[url_key] + self._flushing[url_key]
+
+    def snapshot(self) -> Counter:
+        """A copy of every count that is not yet in the database."""
+        with self._lock:
+            return self._pending + self._flushing
+
+    def flush(self) -> None:
+        """Write every pending click to the database in one batch."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, Counter()
+                self._total = 0
+            try:
+                self._writer(dict(self._flushing))
+            except Exception:
+                logger.exception("Failed to flush %d click counts", len(self._flushing))
+                with self._lock:
+                    self._pending.update(self._flushing)
+                    self._total += sum(self._flushing.values())
+            finally:
+                with self._lock:
+                    self._flushing = Counter()
+
+    def start(self) -> None:
+        """Start the background flush thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="click-flusher", daemon=True
+            )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush the remaining clicks."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+click_counter = ClickCounter(
+    flush_interval=get_settings().click_flush_interval,
+    flush_threshold=get_settings().click_flush_threshold,
+)
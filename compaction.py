@@ -0,0 +1,195 @@
+# Background compaction of the urls table.
+# Deactivated and expired URLs stay in urls, where they keep their key taken
+# and grow the unique indexes every lookup and key check goes through. The
+# compactor moves them to the urls_archive table in small batches, one short
+# transaction each, and deletes the archived rows past their retention. The
+# archive reuses the pages freed in urls; the pages left free are returned to
+# the file system by incremental vacuum, a few pages per transaction.
+#     python -m shortener_app.compaction
+#     python -m shortener_app.compaction --vacuum
+import argparse
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.engine import Engine
+
+from . import crud
+from .clicks import click_counter
+from .config import get_settings
+from .database import SessionLocal, engines
+from .keyfilter import key_filter
+from .migrations import INCREMENTAL_VACUUM
+
+logger = logging.getLogger(__name__)
+
+
+# 1. compact() archives batches of rows on every database holding URLs, until
+#    none is left, then prunes the archive older than `archive_days`, and
+#    pauses between batches so other writers get the lock.
+# 2. Keys with clicks still pending in memory are archived by a later run,
+#    once their clicks are written.
+# 3. The archived keys are evicted from the redirect cache and the shared
+#    table, and the active ones (expired URLs) removed from the negative-lookup filter.
+# 4. vacuum() frees `vacuum_pages` pages of the free list per transaction,
+#    when the database is in incremental auto-vacuum mode (see migrations).
+# 5. A background thread runs compact() every `interval` seconds.
+class Compactor:
+    """Archives inactive and expired URLs and vacuums their pages.
+
+    Args:
+        enabled (bool): when False, the background thread is not started.
+        interval (float): seconds between two runs.
+        batch_size (int): rows archived per transaction.
+        vacuum_pages (int): pages freed per transaction.
+        archive_days (float): days archived URLs are kept, 0 keeps them forever.
+        pause (float): seconds between two transactions.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        interval: float = 300.0,
+        batch_size: int = 500,
+        vacuum_pages: int = 1000,
+        archive_days: float = 0,
+        pause: float = 0.01,
+    ) -> None:
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.archive_days = archive_days
+        self.pause = pause
+        self.totals = {"runs": 0, "archived": 0, "pruned": 0, "pages_freed": 0}
+        self._run_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def compact(self) -> Dict[str, int]:
+        """Archive every inactive or expired URL, prune the archive, vacuum the freed pages."""
+        with self._run_lock:
+            start = time.perf_counter()
+            archived = batches = pruned = pages = 0
+            before = int(time.time() - self.archive_days * 86400)
+            db = SessionLocal()
+            try:
+                for shard_db in crud.all_shard_sessions(db):
+                    while rows := crud.archive_db_urls(
+                        shard_db, self.batch_size, skip=click_counter.pending
+                    ):
+                        for key, was_active in rows:
+                            crud.evict_target(key)
+                            if was_active:
+                                key_filter.remove(key)
+                        archived += len(rows)
+                        batches += 1
+                        time.sleep(self.pause)
+                    while self.archive_days and (
+                        deleted := crud.prune_db_archive(shard_db, before, self.batch_size)
+                    ):
+                        pruned += deleted
+                        time.sleep(self.pause)
+            finally:
+                db.close()
+            for vacuumed_engine in engines():
+                pages += self.vacuum(vacuumed_engine)
+            self.totals["runs"] += 1
+            self.totals["archived"] += archived
+            self.totals["pruned"] += pruned
+            self.totals["pages_freed"] += pages
+            elapsed = time.perf_counter() - start
+        if archived or pruned or pages:
+            logger.info(
+                "Archived %d URLs in %d batches, pruned %d archived URLs, freed %d pages in %.2fs",
+                archived,
+                batches,
+                pruned,
+                pages,
+                elapsed,
+            )
+        return {"archived": archived, "batches": batches, "pruned": pruned, "pages_freed": pages}
+
+    def vacuum(self, vacuumed_engine: Engine) -> int:
+        """Free the pages of the free list, `vacuum_pages` per transaction."""
+        if vacuumed_engine.dialect.name != "sqlite":
+            return 0
+        freed = 0
+        with vacuumed_engine.connect() as connection:
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != INCREMENTAL_VACUUM:
+                return 0
+            free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+            while free:
+                connection.exec_driver_sql(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+                remaining = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+                if remaining >= free:
+                    break
+                freed += free - remaining
+                free = remaining
+                time.sleep(self.pause)
+        return freed
+
+    def start(self) -> None:
+        """Start the background thread, when enabled."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, after the batch it is writing."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, object]:
+        return {"enabled": self.enabled, **self.totals}
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Compaction failed")
+
+
+def main() -> None:
+    from .migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Archive inactive and expired URLs")
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="VACUUM every database afterwards, which enables incremental vacuum on"
+        " databases migrated before it; stop the app first, it locks the whole file",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for migrated_engine in dict.fromkeys(engines()):
+        migrate(migrated_engine)
+    print(compactor.compact())
+    if args.vacuum:
+        for vacuumed_engine in engines():
+            with vacuumed_engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as connection:
+                connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                connection.exec_driver_sql("VACUUM")
+            logger.info("Vacuumed %s", vacuumed_engine.url)
+
+
+compactor = Compactor(
+    enabled=get_settings().compaction_enabled,
+    interval=get_settings().compaction_interval,
+    batch_size=get_settings().compaction_batch_size,
+    vacuum_pages=get_settings().compaction_vacuum_pages,
+    archive_days=get_settings().compaction_archive_days,
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,163 @@
 # It allows us to cache the results of a function call.
+import logging
 from functools import lru_cache
+from typing import Optional
 
 from pydantic import BaseSettings
 
+logger = logging.getLogger(__name__)
+
 
 # 1. It imports the BaseSettings class from the settings.py file.
 # 2. It creates a new class called Settings that inherits from BaseSettings.
-# 3. It defines the environment name, base_url, and db_url variables.
-# 4. It calls the super().__init__() method to set the other variables.
-# 5. It returns the Settings class.
+# 3. It defines the environment name, base_url, and db_url variables, the database engine profile,
+#    the shard map, the schema migration at startup, the admin token and the template cache.
+# 4. It defines the redirect cache size and time to live, the shared redirect table, the HTTP caching of the redirects, the startup warmup, the compaction, the click flush, rollup and event log policy
+#    whether the url endpoints run in async mode, the group commit of the creates, the key allocation strategy
+#    the negative-lookup filter, target URL deduplication, the metrics and profiling.
+# 5. It calls the super().__init__() method to set the other variables.
+# 6. It returns the Settings class.
 class Settings(BaseSettings):
     env_name: str = "Local"
     base_url: str = "http://localhost:8000"
     db_url: str = "sqlite:///./shortener.db"
+    # SQLite engine profile: "default", "wal" or "durable" (see database.DB_PROFILES).
+    # The db_* options below override single values of the profile.
+    db_profile: str = "default"
+    db_journal_mode: Optional[str] = None
+    db_synchronous: Optional[str] = None
+    db_mmap_size: Optional[int] = None
+    db_cache_size: Optional[int] = None
+    db_busy_timeout: Optional[int] = None
+    db_pool_size: Optional[int] = None
+    db_max_overflow: Optional[int] = None
+    # Serve redirect lookups from a separate pool of read-only connections.
+    db_read_only_pool: bool = False
+    # JSON shard map spreading the urls over several databases by key hash
+    # (see sharding.py). Empty: every URL is stored in db_url.
+    shard_map: str = ""
+    # Create and migrate the schema of the databases in a startup hook. Turn it
+    # off when `python -m shortener_app.migrations` runs as a deploy step.
+    migrate_on_startup: bool = True
+    # Token of the admin routes that dump, scan or change every URL, sent in
+    # an `X-Admin-Token` header. Empty: those routes answer 404.
+    admin_token: str = ""
+    # Folder of the compiled Jinja templates; empty uses a folder in the temp directory.
+    template_cache_dir: str = ""
+    # Bounded LRU cache of key -> target_url in front of the redirect lookup.
+    # A size of 0 disables the cache, a ttl of 0 keeps entries until evicted.
+    redirect_cache_size: int = 4096
+    redirect_cache_ttl: float = 300.0
+    # File of the redirect table shared by the workers of a multi-process
+    # deployment, used instead of the per-process redirect cache; its size is
+    # fixed when the file is created. Empty disables it.
+    shared_table_path: str = ""
+    shared_table_slots: int = 65536
+    shared_table_slot_bytes: int = 512
+    # Status code of the redirects (301, 302, 307 or 308) and the seconds
+    # browsers and CDNs may cache them, for URLs without their own
+    # cache_max_age; a cached redirect is not counted as a click. 0 sends
+    # `no-store`, so every click is counted. Every max-age is capped by the
+    # limit, the longest a deleted URL can still redirect from a cache.
+    redirect_status_code: int = 307
+    redirect_max_age: int = 0
+    redirect_max_age_limit: int = 86400
+    # Optional fast path of the redirects, without an ORM session: cache hits
+    # stay on the event loop, misses run a compiled SELECT on a pooled
+    # connection (SQLite only). Off, redirects go through the ORM handler.
+    redirect_fast_path: bool = False
+    # At startup, preload the most clicked active URLs into the redirect cache
+    # (at most its size) and render the pages and templates, within a budget
+    # of seconds; /admin/ready answers 503 until then. 0 keys skips the preload.
+    warmup_keys: int = 1000
+    warmup_budget: float = 5.0
+    # Move inactive and expired URLs to the urls_archive table every interval,
+    # in batches of one transaction each (at most 900 rows), which frees their
+    # keys, then free their pages with incremental vacuum, a step of pages at a time.
+    compaction_enabled: bool = False
+    compaction_interval: float = 300.0
+    compaction_batch_size: int = 500
+    compaction_vacuum_pages: int = 1000
+    # Days archived URLs are kept; 0 keeps them forever.
+    compaction_archive_days: float = 0
+    # Clicks are counted in memory and written in batches every interval,
+    # or as soon as the threshold of pending clicks is reached.
+    click_flush_interval: float = 1.0
+    click_flush_threshold: int = 1000
+    # Roll clicks up in minute, hour and day buckets for the stats endpoint.
+    # Minute and hour buckets are pruned after their retention.
+    click_rollups_enabled: bool = True
+    rollup_minute_retention_hours: float = 48
+    rollup_hour_retention_days: float = 90
+    # Append-only NDJSON log of click events (time, key, referrer, user agent),
+    # written in segments rotated by size or age.
+    event_log_enabled: bool = False
+    event_log_dir: str = "./events"
+    event_log_segment_bytes: int = 64 * 1024 * 1024
+    event_log_segment_seconds: float = 3600
+    event_log_queue_size: int = 10000
+    # Serve the url endpoints as `async def` handlers on an async engine
+    # (aiosqlite for SQLite) instead of sync handlers in the threadpool.
+    async_mode: bool = False
+    # Group commit: POST /url hands its URL to a single writer thread, which
+    # commits the creates of concurrent requests together, in batches of at
+    # most max_batch URLs collected for up to max_wait seconds.
+    write_queue_enabled: bool = False
+    write_queue_max_batch: int = 64
+    write_queue_max_wait: float = 0.002
+    # Admission control: at most max_concurrency requests run at once, and at
+    # most the limit of their class (redirects, POST /url and /urls/batch, admin
+    # calls). Others wait, redirects first, up to queue_timeout seconds in a
+    # queue of queue_size places, or get a 503 with Retry-After. Keep the
+    # limits under the threadpool size (40) and the database pool size.
+    admission_enabled: bool = False
+    admission_max_concurrency: int = 32
+    admission_redirect_limit: int = 32
+    admission_create_limit: int = 8
+    admission_admin_limit: int = 2
+    admission_queue_size: int = 256
+    admission_queue_timeout: float = 0.5
+    admission_retry_after: int = 1
+    # Token bucket of requests per second per client address, in a fixed
+    # number of buckets shared by the clients hashing to them; 0 disables it.
+    admission_client_rate: float = 0
+    admission_client_burst: float = 20
+    admission_client_buckets: int = 65536
+    # Key allocation strategy: "random" (collision check per key), "pool"
+    # (pre-generated random keys) or "counter" (permuted counter, no collisions).
+    # Keys grow by one character once the key space passes the occupancy threshold.
+    key_allocator: str = "random"
+    key_length: int = 5
+    key_occupancy_threshold: float = 0.5
+    key_pool_size: int = 1000
+    key_block_size: int = 100
+    key_secret: str = ""
+    # Counting Bloom filter of the active keys, answering 404 for unknown keys
+    # without a query. Only enable it with a single process writing the urls:
+    # keys created by another process are not seen until the filter is rebuilt.
+    key_filter_enabled: bool = False
+    key_filter_capacity: int = 1_000_000
+    key_filter_error_rate: float = 0.01
+    # Return the existing active URL when the same (normalized) target is
+    # shortened again, instead of inserting a duplicate. Note that the caller
+    # then gets the secret key of the existing URL.
+    dedup_enabled: bool = False
+    # Record request, database and pool latency histograms, served at /metrics
+    # in the Prometheus text format, without authentication: only enable it
+    # where /metrics is not reachable from the internet. When disabled
+    # nothing is instrumented.
+    metrics_enabled: bool = False
+    # Profile single requests with a stack sampler: requests signed with the
+    # secret in an `X-Profile` header, and a random fraction of the others.
+    # Profiles are written in the collapsed stack format, the newest are kept.
+    # /admin/profiles serves them to requests with the secret in an
+    # `X-Profiling-Secret` header, and answers 404 without a secret.
+    profiling_enabled: bool = False
+    profiling_secret: str = ""
+    profiling_sample_rate: float = 0.0
+    profiling_interval: float = 0.001
+    profiling_dir: str = "./profiles"
+    profiling_keep: int = 100
 
     class Config:
         env_file = ".env"
@@ -27,5 +172,5 @@ class Settings(BaseSettings):
 @lru_cache
 def get_settings() -> Settings:
     settings = Settings()
-    print(f"Loading setting for: {settings.env_name}")
+    logger.info("Loading settings for: %s", settings.env_name)
     return settings
@@ -1,14 +1,139 @@
 # 1. Importing the SQLAlchemy modules we’ll need.
 # 2. Importing our models and schema modules.
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy import bindparam, delete, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from . import keygen, models, schemas
+from .cache import RedirectTarget, redirect_cache
+from .config import get_settings
+from .database import ShardSessions, engine_for_key, read_engine, session_for_key, shard_map
+from .dedup import normalize_url, url_digest
+from .keyfilter import key_filter
+from .metrics import timed
+from .shmtable import shared_table
+
+T = TypeVar("T")
+
+
+# 1. Without a shard map, all the items are handled with the given session.
+# 2. Otherwise, the items are grouped by the shard of their url key, and each
+#    group comes with a new session on its shard, closed after the group.
+def shard_sessions(
+    db: Session, items: Iterable[T], key: Callable[[T], str]
+) -> Iterator[Tuple[Session, List[T]]]:
+    """Split items by shard
+
+    Args:
+        db (Session): the session used when sharding is off
+        items (Iterable[T]): the items to split
+        key (Callable[[T], str]): returns the url key of an item
+
+    Yields:
+        Tuple[Session, List[T]]: a session and the items of its shard
+    """
+    if shard_map is None:
+        yield db, list(items)
+        return
+    for name, group in shard_map.group(items, key).items():
+        shard_db = ShardSessions[name]()
+        try:
+            yield shard_db, group
+        finally:
+            shard_db.close()
+
+
+# 1. Without a shard map, yield the given session.
+# 2. Otherwise, yield a new session on every shard in turn.
+def all_shard_sessions(db: Session) -> Iterator[Session]:
+    """A session on every database holding URLs."""
+    if shard_map is None:
+        yield db
+        return
+    for sessions in ShardSessions.values():
+        shard_db = sessions()
+        try:
+            yield shard_db
+        finally:
+            shard_db.close()
+
+
+# Expiry times are stored as unix times; a datetime without a timezone is UTC.
+def to_timestamp(moment: Optional[datetime]) -> Optional[int]:
+    if moment is None:
+        return None
+    return int((moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp())
+
+
+# URLs that expire or have their own cache max-age are never merged with
+# another URL by the dedup mode.
+def has_policy(url: schemas.URLBase) -> bool:
+    return (
+        url.expires_at is not None or url.max_clicks is not None or url.cache_max_age is not None
+    )
+
+
+# 1. The redirects are cached in the shared table when it is enabled, so every
+#    worker sees them; otherwise in the redirect cache of this process.
+# 2. A redirect read from the database is cached with the generation of the
+#    shared table seen before the read, so a URL deleted meanwhile by another
+#    worker is not cached again.
+# 3. New URLs are written to the shared table by the worker creating them; the
+#    redirect cache of a process is only filled by its redirects.
+# 4. An expired entry is evicted and reported as a miss: once compaction has
+#    archived the URL, its key can be reused by a new URL, which the lookup
+#    then finds in the database.
+def cached_target(url_key: str) -> Optional[RedirectTarget]:
+    if shared_table.enabled:
+        target = shared_table.get(url_key)
+    else:
+        target = redirect_cache.get(url_key)
+    if target is None or target.live() is not None:
+        return target
+    evict_target(url_key)
+    return None
+
+
+def table_generation() -> Optional[int]:
+    return shared_table.generation() if shared_table.enabled else None
+
+
+def cache_target(url_key: str, target: RedirectTarget, generation: Optional[int] = None) -> None:
+    if shared_table.enabled:
+        shared_table.put(url_key, target, generation)
+    else:
+        redirect_cache.put(url_key, target)
+
+
+def share_created(db_url: models.URL) -> None:
+    if shared_table.enabled:
+        shared_table.put(
+            db_url.key,
+            RedirectTarget(
+                db_url.target_url, db_url.expires_at, db_url.cache_max_age, db_url.max_clicks
+            ),
+        )
+
 
+def evict_target(url_key: str) -> None:
+    redirect_cache.pop(url_key)
+    if shared_table.enabled:
+        shared_table.remove(url_key)
 
-# 1. Create a new URL object
-# 2. Add the URL to the database
-# 3. Commit the database session
-# 4. Refresh the database object
+
+# 1. In dedup mode, return the active URL with the same normalized target, if any
+# 2. Create a new URL object with a key from the configured key allocator
+# 3. Add the URL to the database (the shard of its key) and commit
+# 4. Refresh the database object, add its key to the negative-lookup filter and
+#    its redirect to the shared table
 # 5. Return the database object
+@timed
 def create_db_url(db: Session, url: schemas.URLBase) -> models.URL:
     """Create URL in the database
 
@@ -19,17 +144,188 @@ def create_db_url(db: Session, url: schemas.URLBase) -> models.URL:
     Returns:
         models.URL: return a shorten URL
     """
-    key = keygen.create_unique_random_key(db)
+    if get_settings().dedup_enabled and not has_policy(url) and (
+        db_url := get_db_url_by_target(db, url.target_url)
+    ):
+        return db_url
+    key = keygen.key_allocator.allocate(db)
     secret_key = f"{key}_{keygen.create_random_key(length=8)}"
-    db_url = models.URL(target_url=url.target_url, key=key, secret_key=secret_key)
+    db_url = models.URL(
+        target_url=url.target_url,
+        key=key,
+        secret_key=secret_key,
+        target_hash=url_digest(url.target_url),
+        expires_at=to_timestamp(url.expires_at),
+        max_clicks=url.max_clicks,
+        cache_max_age=url.cache_max_age,
+    )
 
-    db.add(db_url)
-    db.commit()
-    db.refresh(db_url)
+    url_db = db if shard_map is None else session_for_key(key)
+    try:
+        url_db.add(db_url)
+        url_db.commit()
+        url_db.refresh(db_url)
+    finally:
+        if url_db is not db:
+            url_db.close()
+    key_filter.add(key)
+    share_created(db_url)
 
     return db_url
 
 
+class PartialCreateError(Exception):
+    """Raised by create_db_urls when a shard failed after others committed.
+
+    Args:
+        created (Dict[int, models.URL]): the committed URLs, by index in `urls`.
+    """
+
+    def __init__(self, created: Dict[int, models.URL]) -> None:
+        super().__init__(f"{len(created)} URLs were committed before a shard failed")
+        self.created = created
+
+
+# 1. In dedup mode, look up the active URLs of all normalized targets at once;
+#    targets found, or repeated in the batch, reuse a single URL. URLs that
+#    expire or have their own cache max-age are always created. The URLs found
+#    are detached from the session, so the commit does not expire them.
+# 2. Create unique keys for the URLs to create with the configured key allocator.
+# 3. Build one row per new URL with its key, secret_key and target hash.
+# 4. Insert all rows with a single executemany INSERT and commit once
+#    (once per shard with a shard map).
+# 5. Add the new keys of every committed shard to the negative-lookup filter,
+#    build URL objects from the inserted values, without refreshing them, and
+#    add their redirects to the shared table.
+# 6. When a shard fails after others committed, raise PartialCreateError with
+#    the committed URLs, so a retry does not insert them twice.
+# 7. Return them in the order of `urls`.
+@timed
+def create_db_urls(db: Session, urls: List[schemas.URLBase]) -> List[models.URL]:
+    """Create many URLs in the database in one transaction
+
+    Args:
+        db (Session): Connect to a database
+        urls (List[schemas.URLBase]): urls to be shortened
+
+    Returns:
+        List[models.URL]: the shortened URLs, in the order of `urls`
+    """
+    if not urls:
+        return []
+    dedup_enabled = get_settings().dedup_enabled
+    found: Dict[object, models.URL] = {}
+    if dedup_enabled:
+        found = get_db_urls_by_targets(
+            db, [url.target_url for url in urls if not has_policy(url)]
+        )
+        for db_url in found.values():
+            db.expunge(db_url)
+        targets = [
+            index if has_policy(url) else normalize_url(url.target_url)
+            for index, url in enumerate(urls)
+        ]
+        new_urls = list(
+            {
+                target: url for target, url in zip(targets, urls) if target not in found
+            }.items()
+        )
+    else:
+        targets = list(range(len(urls)))
+        new_urls = list(enumerate(urls))
+
+    keys = keygen.key_allocator.allocate_many(db, len(new_urls))
+    rows = [
+        {
+            "target_url": url.target_url,
+            "key": key,
+            "secret_key": f"{key}_{keygen.create_random_key(length=8)}",
+            "target_hash": url_digest(url.target_url),
+            "is_active": True,
+            "clicks": 0,
+            "expires_at": to_timestamp(url.expires_at),
+            "max_clicks": url.max_clicks,
+            "cache_max_age": url.cache_max_age,
+        }
+        for (_, url), key in zip(new_urls, keys)
+    ]
+    refs = {row["key"]: ref for (ref, _), row in zip(new_urls, rows)}
+    created: Dict[object, models.URL] = {}
+    for shard_db, shard_rows in shard_sessions(db, rows, key=lambda row: row["key"]):
+        if not shard_rows:
+            continue
+        try:
+            shard_db.execute(insert(models.URL.__table__), shard_rows)
+            shard_db.commit()
+        except Exception as error:
+            if not created:
+                raise
+            done = {**found, **created}
+            raise PartialCreateError(
+                {index: done[ref] for index, ref in enumerate(targets) if ref in done}
+            ) from error
+        for row in shard_rows:
+            key_filter.add(row["key"])
+            created[refs[row["key"]]] = db_url = models.URL(**row)
+            share_created(db_url)
+
+    found.update(created)
+    return [found[target] for target in targets]
+
+
+# 1. Hash the normalized target URL.
+# 2. Query the active URLs with that hash through the partial target_hash index.
+# 3. Compare the normalized targets, as two targets may share a hash.
+# 4. Return the oldest matching URL, or None.
+def get_db_url_by_target(db: Session, target_url: str) -> Optional[models.URL]:
+    """Return the active URL with the same normalized target, if any.
+
+    Args:
+        db (Session): Connect to a database
+        target_url (str): the URL to be shortened
+
+    Returns:
+        Optional[models.URL]: an existing URL entry. Otherwise, return None.
+    """
+    return get_db_urls_by_targets(db, [target_url]).get(normalize_url(target_url))
+
+
+# 1. Hash every normalized target URL.
+# 2. Query the active URLs of all hashes without an expiry or a cache max-age,
+#    in chunks of bound parameters.
+# 3. Keep the oldest URL of every normalized target that was asked for.
+def get_db_urls_by_targets(db: Session, target_urls: List[str]) -> Dict[str, models.URL]:
+    """Return the active URLs of many targets, keyed by normalized target.
+
+    Args:
+        db (Session): Connect to a database
+        target_urls (List[str]): the URLs to be shortened
+
+    Returns:
+        Dict[str, models.URL]: normalized target URL -> its existing URL entry
+    """
+    wanted = {normalize_url(target_url) for target_url in target_urls}
+    digests = list({url_digest(target_url) for target_url in target_urls})
+    found: Dict[str, models.URL] = {}
+    for start in range(0, len(digests), MAX_IN_PARAMETERS):
+        query = (
+            db.query(models.URL)
+            .filter(
+                models.URL.target_hash.in_(digests[start : start + MAX_IN_PARAMETERS]),
+                models.URL.is_active,
+                models.URL.expires_at.is_(None),
+                models.URL.max_clicks.is_(None),
+                models.URL.cache_max_age.is_(None),
+            )
+            .order_by(models.URL.id)
+        )
+        for db_url in query:
+            target = normalize_url(db_url.target_url)
+            if target in wanted:
+                found.setdefault(target, db_url)
+    return found
+
+
 # 1. Import the models.URL class from the models module.
 # 2. Import the get_db_url_by_key function from the db_utils module.
 # 3. Create a new function called get_url_by_key that takes in a db session and a url_key.
@@ -52,10 +348,209 @@ def get_db_url_by_key(db: Session, url_key: str) -> models.URL:
     )
 
 
+# The columns of an active URL that a redirect reads: its target, expiry and cache max-age.
+TARGET_COLUMNS = (
+    models.URL.target_url,
+    models.URL.expires_at,
+    models.URL.max_clicks,
+    models.URL.clicks,
+    models.URL.cache_max_age,
+)
+
+
+# 1. A URL past its expiry time, or whose stored and pending clicks reached
+#    max_clicks, does not redirect anymore.
+# 2. A live URL without max_clicks is cached with its expiry time; one with
+#    max_clicks is not cached, its clicks are checked on every redirect.
+# 3. Return the redirect, or None when the URL has expired.
+def live_target(
+    url_key: str,
+    row: Tuple[str, Optional[int], Optional[int], int, Optional[int]],
+    generation: Optional[int] = None,
+) -> Optional[RedirectTarget]:
+    """Check the expiry of a URL row read by a redirect lookup
+
+    Args:
+        url_key (str): url key stored in database
+        row (Tuple): the TARGET_COLUMNS of the URL
+        generation (int, optional): the shared table generation seen before the read
+
+    Returns:
+        Optional[RedirectTarget]: the redirect, or None if the URL has expired
+    """
+    target_url, expires_at, max_clicks, clicks, cache_max_age = row
+    if expires_at is not None and expires_at <= time.time():
+        return None
+    target = RedirectTarget(target_url, expires_at, cache_max_age, max_clicks)
+    if max_clicks is None:
+        cache_target(url_key, target, generation)
+        return target
+    # The click counter imports this module, so it is imported on first use.
+    from .clicks import click_counter
+
+    return target if clicks + click_counter.pending(url_key) < max_clicks else None
+
+
+# 1. First, we look the key up in the in-process redirect cache, or the shared
+#    table; a cached URL that has expired is evicted and looked up again.
+# 2. Keys that the negative-lookup filter rules out are unknown, without a query.
+# 3. Otherwise, we query only the redirect columns of the active URL.
+# 4. If the URL is found and live, we store it in the cache for the next redirects.
+# 5. We return the redirect, or None when the key is unknown or expired.
+@timed
+def get_target_url_by_key(db: Session, url_key: str) -> Optional[RedirectTarget]:
+    """Return the target URL of an active key, served from the cache when possible.
+
+    Args:
+        db (Session): Connect to a database
+        url_key (str): url key stored in database
+
+    Returns:
+        Optional[RedirectTarget]: the redirect, or None if the key is not active
+    """
+    if (target := cached_target(url_key)) is not None:
+        return target
+    if key_filter.definitely_missing(url_key):
+        return None
+    generation = table_generation()
+    row = (
+        db.query(*TARGET_COLUMNS)
+        .filter(models.URL.key == url_key, models.URL.is_active)
+        .first()
+    )
+    if row is None:
+        return None
+    return live_target(url_key, row, generation)
+
+
+# The redirect lookup as SQL, compiled once from the Core statement. sqlite3
+# keeps the prepared statement in the cache of each pooled connection.
+TARGET_URL_BY_KEY = str(
+    select(*TARGET_COLUMNS)
+    .where(models.URL.key == bindparam("url_key"), models.URL.is_active)
+    .compile(dialect=sqlite.dialect(paramstyle="qmark"))
+)
+
+
+# 1. Like get_target_url_by_key: the redirect cache or shared table, then the
+#    negative-lookup filter.
+# 2. On a miss, run the compiled lookup on a DBAPI connection checked out of the
+#    pool of the key's database, without a Session, a Query or ORM objects.
+# 3. Check the expiry of the row, cache the redirect and return it, or None
+#    when the key is unknown or expired.
+@timed
+def get_target_url_fast(url_key: str) -> Optional[RedirectTarget]:
+    """Return the target URL of an active key without an ORM session (SQLite only).
+
+    Args:
+        url_key (str): url key stored in database
+
+    Returns:
+        Optional[RedirectTarget]: the redirect, or None if the key is not active
+    """
+    if (target := cached_target(url_key)) is not None:
+        return target
+    if key_filter.definitely_missing(url_key):
+        return None
+    generation = table_generation()
+    connection = (read_engine if shard_map is None else engine_for_key(url_key)).raw_connection()
+    try:
+        cursor = connection.cursor()
+        row = cursor.execute(TARGET_URL_BY_KEY, (url_key,)).fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    return live_target(url_key, row, generation)
+
+
+# SQLite limits the number of bound parameters of a statement.
+MAX_IN_PARAMETERS = 900
+
+
+# 1. Split the keys by shard, and into chunks that fit in one statement.
+# 2. Query which of them are already used by a URL, active or not.
+# 3. Return the used keys as a set.
+@timed
+def get_existing_keys(db: Session, keys: Iterable[str]) -> Set[str]:
+    """Return the subset of `keys` that already exist in the database.
+
+    Args:
+        db (Session): Connect to a database
+        keys (Iterable[str]): candidate url keys
+
+    Returns:
+        Set[str]: the keys that are taken
+    """
+    existing = set()
+    for shard_db, shard_keys in shard_sessions(db, keys, key=lambda key: key):
+        for start in range(0, len(shard_keys), MAX_IN_PARAMETERS):
+            chunk = shard_keys[start : start + MAX_IN_PARAMETERS]
+            existing.update(
+                key
+                for (key,) in shard_db.query(models.URL.key).filter(models.URL.key.in_(chunk))
+            )
+    return existing
+
+
+# 1. Read the highest id of the urls table, served by the primary key index.
+# 2. With a shard map, add up the highest id of every shard.
+# 3. Return 0 when the table is empty.
+def get_max_url_id(db: Session) -> int:
+    """Return the highest URL id, an upper bound of the number of keys in use.
+
+    Args:
+        db (Session): Connect to a database
+
+    Returns:
+        int: the highest id, 0 when there is no URL yet
+    """
+    return sum(
+        shard_db.query(func.max(models.URL.id)).scalar() or 0
+        for shard_db in all_shard_sessions(db)
+    )
+
+
+# 1. Increase the named counter by `size` in an UPDATE, which takes the write lock.
+# 2. If the counter does not exist yet, insert it; a concurrent insert is retried.
+# 3. Read the new value in the same transaction and commit.
+# 4. Return the first value of the reserved block.
+def reserve_key_sequence(db: Session, name: str, size: int) -> int:
+    """Reserve `size` consecutive values of a named counter.
+
+    Args:
+        db (Session): Connect to a database
+        name (str): name of the counter
+        size (int): number of values to reserve
+
+    Returns:
+        int: the first reserved value
+    """
+    sequence = models.KeySequence
+    while True:
+        updated = (
+            db.query(sequence)
+            .filter(sequence.name == name)
+            .update({sequence.value: sequence.value + size}, synchronize_session=False)
+        )
+        if updated:
+            value = db.query(sequence.value).filter(sequence.name == name).scalar()
+            db.commit()
+            return value - size
+        try:
+            db.add(sequence(name=name, value=size))
+            db.commit()
+            return 0
+        except IntegrityError:
+            db.rollback()
+
+
 # 1. Import the models module from the models.py file.
 # 2. Create a function that takes in a database session and a secret_key.
 # 3. Query the database for an active URL entry with the provided secret_key.
 # 4. Return the URL entry. Otherwise, return None.
+@timed
 def get_db_url_by_secret_key(db: Session, secret_key: str) -> models.URL:
     """Checks your database for an active database entry
     with the provided secret_key.
@@ -98,11 +593,42 @@ def update_db_clicks(db: Session, db_url: schemas.URL) -> models.URL:
     return db_url
 
 
+# 1. Build one UPDATE statement with bound parameters for the key and the count.
+# 2. Let the database add the new clicks, so concurrent batches never lose updates.
+# 3. Execute it once for all keys (executemany) and commit a single transaction
+#    (one per shard with a shard map).
+@timed
+def add_db_clicks(db: Session, clicks: Dict[str, int]) -> None:
+    """Add a batch of click counts to their URLs.
+
+    Args:
+        db (Session): Connect to a database
+        clicks (Dict[str, int]): number of new clicks per url key
+    """
+    if not clicks:
+        return
+    table = models.URL.__table__
+    statement = (
+        update(table)
+        .where(table.c.key == bindparam("url_key"))
+        .values(clicks=table.c.clicks + bindparam("count"))
+    )
+    for shard_db, shard_clicks in shard_sessions(db, clicks.items(), key=lambda item: item[0]):
+        shard_db.execute(
+            statement,
+            [{"url_key": key, "count": count} for key, count in shard_clicks],
+        )
+        shard_db.commit()
+
+
 # 1. First, we get the URL by the `secret_key` from the database.
 # 2. If the URL is found, we set the `is_active` attribute to False.
 # 3. We commit the changes to the database.
 # 4. We refresh the database object to get the latest data.
-# 5. We return the database object.
+# 5. We evict the key from the redirect cache and the negative-lookup filter,
+#    so the link stops redirecting at once.
+# 6. We return the database object.
+@timed
 def deactivate_db_url_by_secret_key(db: Session, secret_key: str) -> models.URL:
     """Deactivates a URL by the `secret_key`
 
@@ -118,4 +644,249 @@ def deactivate_db_url_by_secret_key(db: Session, secret_key: str) -> models.URL:
         db_url.is_active = False
         db.commit()
         db.refresh(db_url)
+        evict_target(db_url.key)
+        key_filter.remove(db_url.key)
     return db_url
+
+
+# 1. Stream the keys of the active URLs, fetching them in chunks, shard by shard.
+# 2. Only the key column is loaded, no URL object is built.
+def get_active_keys(db: Session, chunk_size: int = 10000) -> Iterator[str]:
+    """Yield the key of every active URL.
+
+    Args:
+        db (Session): Connect to a database
+        chunk_size (int): rows fetched per round trip
+
+    Yields:
+        str: an active url key
+    """
+    for shard_db in all_shard_sessions(db):
+        query = shard_db.query(models.URL.key).filter(models.URL.is_active)
+        for (key,) in query.yield_per(chunk_size):
+            yield key
+
+
+# 1. Take the `limit` most clicked active URLs of every shard. Clicks are not
+#    indexed, they change on every flush: this scans and sorts the rows, once
+#    per startup. URLs with max_clicks are never cached, and expired ones do
+#    not redirect: both are left out.
+# 2. Keep the `limit` most clicked of them, most clicked first.
+def get_hot_urls(
+    db: Session, limit: int
+) -> List[Tuple[str, str, int, Optional[int], Optional[int]]]:
+    """Return the most clicked active URLs.
+
+    Args:
+        db (Session): Connect to a database
+        limit (int): number of URLs returned
+
+    Returns:
+        List[Tuple[str, str, int, Optional[int], Optional[int]]]: (key,
+        target_url, clicks, expires_at, cache_max_age), most clicked first
+    """
+    rows = []
+    now = int(time.time())
+    for shard_db in all_shard_sessions(db):
+        rows.extend(
+            shard_db.query(
+                models.URL.key,
+                models.URL.target_url,
+                models.URL.clicks,
+                models.URL.expires_at,
+                models.URL.cache_max_age,
+            )
+            .filter(
+                models.URL.is_active,
+                models.URL.max_clicks.is_(None),
+                or_(models.URL.expires_at.is_(None), models.URL.expires_at > now),
+            )
+            .order_by(models.URL.clicks.desc())
+            .limit(limit)
+        )
+    return [tuple(row) for row in heapq.nlargest(limit, rows, key=lambda row: row.clicks)]
+
+
+def count_active_clicks(db: Session) -> int:
+    """Return the clicks of all active URLs."""
+    return sum(
+        shard_db.query(func.sum(models.URL.clicks)).filter(models.URL.is_active).scalar() or 0
+        for shard_db in all_shard_sessions(db)
+    )
+
+
+# 1. Find up to `limit` rows to archive (at most MAX_IN_PARAMETERS): inactive rows, rows past their expiry
+#    time and rows whose clicks reached max_clicks, each through its partial index.
+# 2. Leave out the rows that `skip` rejects, e.g. keys with clicks pending in memory,
+#    and read the next page of rows after them (keyset on the index order), so
+#    skipped rows never hide the rows behind them.
+# 3. In one transaction, copy the rows to urls_archive, delete them from urls,
+#    which frees their key, and delete their click rollups.
+# 4. Return the key of every archived row and whether it was still active.
+def archive_db_urls(
+    db: Session, limit: int, skip: Optional[Callable[[str], bool]] = None
+) -> List[Tuple[str, bool]]:
+    """Move a batch of inactive or expired URLs to the archive table.
+
+    Args:
+        db (Session): Connect to the database of the urls (one shard)
+        limit (int): rows archived at most
+        skip (Callable[[str], bool], optional): keys for which it is true stay in place
+
+    Returns:
+        List[Tuple[str, bool]]: the archived keys, and whether each was active
+    """
+    now = int(time.time())
+    limit = min(limit, MAX_IN_PARAMETERS)
+    table = models.URL.__table__
+    candidates: Dict[int, Tuple[str, bool]] = {}
+    for condition, order in (
+        (~table.c.is_active, (table.c.id,)),
+        (table.c.expires_at <= now, (table.c.expires_at, table.c.id)),
+        ((table.c.max_clicks.isnot(None)) & (table.c.clicks >= table.c.max_clicks), (table.c.id,)),
+    ):
+        last: Optional[Tuple] = None
+        while len(candidates) < limit:
+            query = select(table.c.key, table.c.is_active, *order).where(condition)
+            if last is not None:
+                query = query.where(tuple_(*order) > tuple_(*last))
+            rows = db.execute(query.order_by(*order).limit(limit)).all()
+            for key, is_active, *last in rows:
+                if len(candidates) < limit and not (skip and skip(key)):
+                    candidates[last[-1]] = (key, bool(is_active))
+            if len(rows) < limit:
+                break
+    if not candidates:
+        return []
+    ids = list(candidates)
+    columns = [
+        column.name
+        for column in models.ArchivedURL.__table__.columns
+        if column.name not in ("id", "archived_at")
+    ]
+    db.execute(
+        insert(models.ArchivedURL.__table__).from_select(
+            [*columns, "archived_at"],
+            select(*(table.c[name] for name in columns), literal(now)).where(
+                table.c.id.in_(ids)
+            ),
+        )
+    )
+    db.execute(delete(table).where(table.c.id.in_(ids)))
+    keys = [key for key, _ in candidates.values()]
+    db.execute(delete(models.ClickRollup.__table__).where(models.ClickRollup.key.in_(keys)))
+    db.commit()
+    return list(candidates.values())
+
+
+# 1. Delete up to `limit` archived rows older than `before`, oldest first,
+#    in one transaction.
+# 2. Return the number of rows deleted.
+def prune_db_archive(db: Session, before: int, limit: int) -> int:
+    """Delete a batch of old rows of the archive table.
+
+    Args:
+        db (Session): Connect to the database of the urls (one shard)
+        before (int): unix time, rows archived earlier are deleted
+        limit (int): rows deleted at most
+
+    Returns:
+        int: the number of rows deleted
+    """
+    table = models.ArchivedURL.__table__
+    old_ids = select(table.c.id).where(table.c.archived_at < before).limit(limit)
+    deleted = db.execute(delete(table).where(table.c.id.in_(old_ids.scalar_subquery()))).rowcount
+    db.commit()
+    return deleted
+
+
+# 1. Count the active URLs, so the filter can be sized for them.
+# 2. Rebuild the negative-lookup filter from the active keys.
+def rebuild_key_filter(db: Session) -> None:
+    """Rebuild the negative-lookup filter from the urls table.
+
+    Args:
+        db (Session): Connect to a database
+    """
+    expected = sum(
+        shard_db.query(func.count(models.URL.id)).filter(models.URL.is_active).scalar()
+        for shard_db in all_shard_sessions(db)
+    )
+    key_filter.rebuild(get_active_keys(db), expected=expected)
+
+
+# 1. Build one upsert statement: insert the bucket, or add to its clicks.
+# 2. Execute it once for all buckets (executemany) and commit a single transaction
+#    (one per shard with a shard map).
+@timed
+def add_db_rollups(db: Session, counts: Dict[Tuple[str, str, int], int]) -> None:
+    """Add a batch of clicks to their time buckets.
+
+    Args:
+        db (Session): Connect to a database
+        counts (Dict[Tuple[str, str, int], int]): clicks per (key, granularity, bucket)
+    """
+    if not counts:
+        return
+    table = models.ClickRollup.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.key, table.c.granularity, table.c.bucket],
+        set_={"clicks": table.c.clicks + statement.excluded.clicks},
+    )
+    for shard_db, shard_counts in shard_sessions(
+        db, counts.items(), key=lambda item: item[0][0]
+    ):
+        shard_db.execute(
+            statement,
+            [
+                {"key": key, "granularity": granularity, "bucket": bucket, "clicks": clicks}
+                for (key, granularity, bucket), clicks in shard_counts
+            ],
+        )
+        shard_db.commit()
+
+
+# 1. Delete the buckets of one granularity that start before `before`, on every shard.
+def delete_db_rollups_before(db: Session, granularity: str, before: int) -> None:
+    """Prune old buckets of a granularity.
+
+    Args:
+        db (Session): Connect to a database
+        granularity (str): "minute", "hour" or "day"
+        before (int): unix timestamp, older buckets are deleted
+    """
+    for shard_db in all_shard_sessions(db):
+        shard_db.query(models.ClickRollup).filter(
+            models.ClickRollup.granularity == granularity,
+            models.ClickRollup.bucket < before,
+        ).delete(synchronize_session=False)
+        shard_db.commit()
+
+
+# 1. Range-scan the primary key of one key and granularity.
+# 2. Return the clicks per bucket start.
+@timed
+def get_db_rollups(
+    db: Session, url_key: str, granularity: str, start: int, end: int
+) -> Dict[int, int]:
+    """Return the clicks of the buckets in [start, end).
+
+    Args:
+        db (Session): Connect to a database
+        url_key (str): url key stored in database
+        granularity (str): "minute", "hour" or "day"
+        start (int): unix timestamp of the first bucket
+        end (int): unix timestamp after the last bucket
+
+    Returns:
+        Dict[int, int]: clicks per bucket start
+    """
+    rollup = models.ClickRollup
+    rows = db.query(rollup.bucket, rollup.clicks).filter(
+        rollup.key == url_key,
+        rollup.granularity == granularity,
+        rollup.bucket >= start,
+        rollup.bucket < end,
+    )
+    return {bucket: clicks for bucket, clicks in rows}
@@ -3,31 +3,240 @@
 # 3. Importing the declarative_base module from sqlalchemy.ext.declarative.
 # 4. Importing the sessionmaker module from sqlalchemy.orm.
 # 5. Calling the get_settings() function from the config module.
-# 6. Creating a new SQLite database called data.db.
-# 7. Creating a new SQLAlchemy engine called engine.
+# 6. Defining the engine profiles (pragmas and pool size) for SQLite.
+# 7. Creating a new SQLAlchemy engine called engine, and a read-only one for redirects.
+#    With a shard map, creating one engine and session factory per shard.
 # 8. Creating a new SQLAlchemy declarative base called Base.
 # 9. Creating a new SQLAlchemy session called session.
 from sqlite3 import connect
-from sqlalchemy import create_engine
+from typing import Dict, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from .config import get_settings
+from .sharding import load_shard_map
+
+# Engine profiles for SQLite. Every profile sets connection pragmas, and the
+# size of the connection pool when it should not be the SQLAlchemy default.
+# - default: what SQLite does out of the box (rollback journal).
+# - wal: write-ahead log, readers no longer wait for the writer; synchronous
+#   NORMAL only syncs at checkpoints, a crash may lose the last transactions
+#   but never corrupts the database.
+# - durable: write-ahead log with a sync on every commit.
+DB_PROFILES = {
+    "default": {},
+    "wal": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "pool_size": 8,
+        "max_overflow": 16,
+    },
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -65536,
+        "pool_size": 8,
+        "max_overflow": 16,
+    },
+}
+
+# Connection pragmas, in the order they are applied.
+PRAGMAS = ("busy_timeout", "journal_mode", "synchronous", "cache_size", "mmap_size")
+
+
+# 1. Start from the profile named by `db_profile` in the settings.
+# 2. Every `db_<option>` setting that is set overrides the profile.
+def get_db_profile() -> dict:
+    """Return the engine options of the configured profile
+
+    Raises:
+        ValueError: the profile does not exist
+
+    Returns:
+        dict: pragma values and pool options
+    """
+    settings = get_settings()
+    if settings.db_profile not in DB_PROFILES:
+        raise ValueError(f"Unknown database profile: {settings.db_profile!r}")
+    profile = dict(DB_PROFILES[settings.db_profile])
+    for option in (*PRAGMAS, "pool_size", "max_overflow"):
+        if (value := getattr(settings, f"db_{option}")) is not None:
+            profile[option] = value
+    return profile
+
+
+# 1. On every new DBAPI connection, run the pragmas of the profile.
+# 2. Read-only connections keep the journal mode of the database file and
+#    refuse writes with query_only.
+def set_sqlite_pragmas(target, profile: dict, read_only: bool = False) -> None:
+    """Apply the pragmas of `profile` to every connection of an engine
+
+    Args:
+        target: the Engine (or its pool) to listen on
+        profile (dict): pragma values
+        read_only (bool): whether the connections are read-only
+    """
+
+    @event.listens_for(target, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            if pragma in profile and not (read_only and pragma == "journal_mode"):
+                cursor.execute(f"PRAGMA {pragma}={profile[pragma]}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
 
 # Entry point to database
-# 1. Importing the create_engine function from the sqlalchemy module.
-# 2. Creating an engine object with the database URL from the settings file.
-# 3. Connecting to the database using the connect_args argument.
-engine = create_engine(
-    # The database URL from db_url of the settings
-    get_settings().db_url,
-    connect_args={"check_same_thread": False},
-)
+# 1. Creating an engine object with the database URL from the settings file.
+# 2. Connecting to SQLite with check_same_thread=False, so the threadpool can share connections.
+# 3. Using a QueuePool of the profile size, when the profile sets one.
+# 4. Applying the pragmas of the profile to every new connection.
+def create_db_engine(db_url: str, profile: dict, read_only: bool = False) -> Engine:
+    """Create the engine of a database with an engine profile
+
+    Args:
+        db_url (str): the database URL
+        profile (dict): the options returned by get_db_profile()
+        read_only (bool): open a SQLite file in read-only mode
+
+    Returns:
+        Engine: the new engine
+    """
+    if not db_url.startswith("sqlite"):
+        return create_engine(db_url)
+    options = {"connect_args": {"check_same_thread": False}}
+    if "pool_size" in profile:
+        options.update(
+            poolclass=QueuePool,
+            pool_size=profile["pool_size"],
+            max_overflow=profile.get("max_overflow", 0),
+        )
+    if read_only:
+        path = make_url(db_url).database
+        options["creator"] = lambda: connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+    new_engine = create_engine(db_url, **options)
+    set_sqlite_pragmas(new_engine, profile, read_only)
+    return new_engine
+
+
+# 1. Only SQLite files have a separate read-only pool; in-memory databases
+#    and other databases read through the main engine.
+def has_read_only_pool(db_url: str) -> bool:
+    database = make_url(db_url).database
+    return (
+        get_settings().db_read_only_pool
+        and db_url.startswith("sqlite")
+        and bool(database)
+        and database != ":memory:"
+    )
+
+
+engine = create_db_engine(get_settings().db_url, get_db_profile())
 # Create a Local session
 SessionLocal: sessionmaker = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
 )
 
+# Redirect lookups can read through a separate pool of read-only connections,
+# so they never queue behind the connections used for writes.
+read_engine = (
+    create_db_engine(get_settings().db_url, get_db_profile(), read_only=True)
+    if has_read_only_pool(get_settings().db_url)
+    else engine
+)
+ReadSessionLocal: sessionmaker = sessionmaker(
+    autocommit=False, autoflush=False, bind=read_engine
+)
+
+# With a shard map, the urls (and their click rollups) live in the shard
+# databases; db_url keeps the data that is not sharded, such as key sequences.
+# A shard on db_url reuses the main engine.
+shard_map = load_shard_map()
+shard_engines: Dict[str, Engine] = {}
+ShardSessions: Dict[str, sessionmaker] = {}
+if shard_map is not None:
+    if get_settings().async_mode or get_settings().dedup_enabled:
+        raise ValueError("Sharding supports neither async_mode nor dedup_enabled")
+    for name, shard_url in shard_map.shards.items():
+        shard_engines[name] = (
+            engine
+            if shard_url == get_settings().db_url
+            else create_db_engine(shard_url, get_db_profile())
+        )
+        ShardSessions[name] = sessionmaker(
+            autocommit=False, autoflush=False, bind=shard_engines[name]
+        )
+
+
+# 1. Without a shard map, every URL is in the main database.
+# 2. Otherwise, the bucket of the key picks the shard.
+def engine_for_key(url_key: str) -> Engine:
+    """The engine of the database holding `url_key`."""
+    if shard_map is None:
+        return engine
+    return shard_engines[shard_map.shard_for_key(url_key)]
+
+
+def session_for_key(url_key: str) -> Session:
+    """A new session on the database holding `url_key`."""
+    if shard_map is None:
+        return SessionLocal()
+    return ShardSessions[shard_map.shard_for_key(url_key)]()
+
+
+def engines() -> List[Engine]:
+    """The engines of every database holding URLs."""
+    if shard_map is None:
+        return [engine]
+    return list(shard_engines.values())
+
+
+# 1. Swapping the sync driver of the database URL for its asyncio driver.
+# 2. SQLite uses aiosqlite, other databases keep their URL as configured.
+def get_async_db_url(db_url: str) -> str:
+    """Return the asyncio flavour of a database URL
+
+    Args:
+        db_url (str): database URL from the settings
+
+    Returns:
+        str: the same database behind an async driver
+    """
+    if db_url.startswith("sqlite://"):
+        return db_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return db_url
+
+
+# The async engine is only created in async mode, so aiosqlite stays optional.
+# 1. Creating an async engine on the same database as the sync engine.
+# 2. Creating an async session factory that keeps objects loaded after commit.
+async_engine = None
+AsyncSessionLocal = None
+if get_settings().async_mode:
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_engine = create_async_engine(get_async_db_url(get_settings().db_url))
+    if get_settings().db_url.startswith("sqlite"):
+        set_sqlite_pragmas(async_engine.sync_engine, get_db_profile())
+    AsyncSessionLocal = sessionmaker(
+        async_engine,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
 # connects the database engine to the SQLAlchemy functionality of the models
 # It creates a base class that our class code will inherit from.
 Base = declarative_base()
@@ -0,0 +1,156 @@
+# Target URL deduplication: normalization, the compact digest stored in
+# `urls.target_hash`, and an offline job merging existing duplicates.
+#     python -m shortener_app.dedup
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, List
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+# 1. Lowercase the scheme and the host, they are case-insensitive.
+# 2. Drop the port when it is the default port of the scheme.
+# 3. Use "/" for an empty path; the query and the fragment are kept as they are.
+def normalize_url(target_url: str) -> str:
+    """Return the canonical form of a URL used to find duplicates
+
+    Args:
+        target_url (str): the URL to normalize
+
+    Returns:
+        str: the normalized URL
+    """
+    parts = urlsplit(target_url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo = f"{userinfo}:{parts.password}"
+        host = f"{userinfo}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, parts.fragment))
+
+
+# 1. Hash the normalized URL with blake2b into 8 bytes.
+# 2. Return it as a signed 64-bit integer, the size of a SQLite INTEGER.
+def url_digest(target_url: str) -> int:
+    """Compact digest of the normalized URL, stored in `urls.target_hash`
+
+    Args:
+        target_url (str): the URL to hash
+
+    Returns:
+        int: a signed 64-bit digest
+    """
+    digest = hashlib.blake2b(normalize_url(target_url).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+# 1. Fill target_hash for the rows created before the column existed, in chunks.
+def backfill_target_hashes(db: Session, chunk_size: int = 1000) -> int:
+    """Compute the missing target hashes
+
+    Args:
+        db (Session): Connect to a database
+        chunk_size (int): rows updated per transaction
+
+    Returns:
+        int: the number of rows updated
+    """
+    updated = 0
+    while rows := (
+        db.query(models.URL.id, models.URL.target_url)
+        .filter(models.URL.target_hash.is_(None))
+        .limit(chunk_size)
+        .all()
+    ):
+        db.bulk_update_mappings(
+            models.URL,
+            [{"id": row.id, "target_hash": url_digest(row.target_url)} for row in rows],
+        )
+        db.commit()
+        updated += len(rows)
+    return updated
+
+
+# 1. Find the digests shared by more than one active URL.
+# 2. Within a digest, group the URLs by normalized target (digests can collide).
+# 3. Keep the oldest URL of every group, add the clicks of the others to it
+#    and deactivate them. Each group is merged in its own transaction.
+#    URLs that expire are left alone.
+# Deactivated keys stop redirecting, and running processes forget them when
+# their redirect cache entries expire.
+def merge_duplicates(db: Session) -> Dict[str, int]:
+    """Merge active URLs pointing to the same normalized target
+
+    Args:
+        db (Session): Connect to a database
+
+    Returns:
+        Dict[str, int]: the number of groups merged and URLs deactivated
+    """
+    backfill_target_hashes(db)
+    digests = [
+        digest
+        for (digest,) in db.query(models.URL.target_hash)
+        .filter(
+            models.URL.is_active,
+            models.URL.expires_at.is_(None),
+            models.URL.max_clicks.is_(None),
+            models.URL.cache_max_age.is_(None),
+        )
+        .group_by(models.URL.target_hash)
+        .having(func.count(models.URL.id) > 1)
+    ]
+    groups = deactivated = 0
+    for digest in digests:
+        by_target: Dict[str, List[models.URL]] = defaultdict(list)
+        for db_url in (
+            db.query(models.URL)
+            .filter(
+                models.URL.target_hash == digest,
+                models.URL.is_active,
+                models.URL.expires_at.is_(None),
+                models.URL.max_clicks.is_(None),
+                models.URL.cache_max_age.is_(None),
+            )
+            .order_by(models.URL.id)
+        ):
+            by_target[normalize_url(db_url.target_url)].append(db_url)
+        for kept, *duplicates in by_target.values():
+            if not duplicates:
+                continue
+            for duplicate in duplicates:
+                kept.clicks += duplicate.clicks
+                duplicate.clicks = 0
+                duplicate.is_active = False
+            groups += 1
+            deactivated += len(duplicates)
+        db.commit()
+    return {"groups": groups, "deactivated": deactivated}
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal, engine
+    from .migrations import migrate
+
+    logging.basicConfig(level=logging.INFO)
+    migrate(engine)
+    db = SessionLocal()
+    try:
+        logger.info("Merged duplicates: %s", merge_duplicates(db))
+    finally:
+        db.close()
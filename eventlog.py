@@ -0,0 +1,252 @@
+# Append-only click event log: one NDJSON line per redirect, written by a
+# background thread into rotating segment files, away from the urls database.
+#     python -m shortener_app.eventlog aggregate --dir ./events
+import argparse
+import json
+import logging
+import mmap
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Mapping, Optional
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Segments are written as `<name>.ndjson.open` and renamed when they are closed.
+SEGMENT_SUFFIX = ".ndjson"
+OPEN_SUFFIX = ".open"
+
+
+# 1. record() puts the event on a bounded queue and returns at once; when the
+#    queue is full the event is dropped and counted, the redirect never waits.
+# 2. A background thread drains the queue, writes the events as NDJSON lines
+#    and flushes the file once per drained batch.
+# 3. A segment is closed (renamed without `.open`) when it reaches
+#    `segment_bytes` or has been open for `segment_seconds`.
+# 4. Segment names hold the creation time in milliseconds, the process id and
+#    a sequence number, so several workers can share a directory and names
+#    sort by age.
+class EventLog:
+    """Buffered, rotating NDJSON log of click events.
+
+    Args:
+        directory (str): folder of the segment files.
+        enabled (bool): when False, events are not recorded.
+        segment_bytes (int): size after which a segment is closed.
+        segment_seconds (float): age after which a segment is closed.
+        queue_size (int): events buffered before new ones are dropped.
+    """
+
+    def __init__(
+        self,
+        directory: str = "./events",
+        enabled: bool = False,
+        segment_bytes: int = 64 * 1024 * 1024,
+        segment_seconds: float = 3600,
+        queue_size: int = 10000,
+    ) -> None:
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._file: Optional[IO[bytes]] = None
+        self._path: Optional[Path] = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._sequence = 0
+
+    def record(self, event: dict) -> None:
+        """Queue an event for the writer thread, without blocking."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_click(self, url_key: str, headers: Mapping[str, str]) -> None:
+        """Queue the click event of a redirect."""
+        if self.enabled:
+            self.record(
+                {
+                    "ts": time.time(),
+                    "key": url_key,
+                    "referrer": headers.get("referer"),
+                    "user_agent": headers.get("user-agent"),
+                }
+            )
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the queued events and close the current segment."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                event = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._rotate_if_needed()
+                continue
+            batch = [event]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write(event for event in batch if event is not None)
+            except OSError:
+                logger.exception("Failed to write %d click events", len(batch))
+            if stop:
+                self._close_segment()
+                return
+
+    def _write(self, events: Iterable[dict]) -> None:
+        for event in events:
+            if self._file is None:
+                self._open_segment()
+            line = json.dumps(event, separators=(",", ":")).encode() + b"\n"
+            self._file.write(line)
+            self._size += len(line)
+            self.written += 1
+            if self._size >= self.segment_bytes:
+                self._close_segment()
+        if self._file is not None:
+            self._file.flush()
+        self._rotate_if_needed()
+
+    def _rotate_if_needed(self) -> None:
+        if self._file is not None and time.time() - self._opened_at >= self.segment_seconds:
+            self._close_segment()
+
+    def _open_segment(self) -> None:
+        self._opened_at = time.time()
+        self._sequence += 1
+        name = (
+            f"events-{int(self._opened_at * 1000):013d}-{os.getpid()}"
+            f"-{self._sequence:06d}{SEGMENT_SUFFIX}"
+        )
+        self._path = self.directory / (name + OPEN_SUFFIX)
+        self._file = open(self._path, "ab")
+        self._size = 0
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._path.rename(self._path.with_name(self._path.name[: -len(OPEN_SUFFIX)]))
+        self._file = None
+        self._path = None
+
+
+# 1. List the closed segments of a directory, oldest first.
+def closed_segments(directory: str) -> List[Path]:
+    return sorted(Path(directory).glob(f"*{SEGMENT_SUFFIX}"))
+
+
+# 1. Stream the events of a segment line by line with a buffered file.
+# 2. A torn last line (e.g. after a crash) is skipped.
+def read_segment(path: Path) -> Iterator[dict]:
+    with open(path, "rb") as segment:
+        for line in segment:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+# 1. Map a closed segment in memory and split it on newlines, without copying
+#    the file through read buffers. Faster for scans of large segments.
+def read_segment_mmap(path: Path) -> Iterator[dict]:
+    with open(path, "rb") as segment:
+        if os.fstat(segment.fileno()).st_size == 0:
+            return
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while (end := mapped.find(b"\n", start)) != -1:
+                try:
+                    yield json.loads(mapped[start:end])
+                except ValueError:
+                    pass
+                start = end + 1
+
+
+# 1. Count the events per key, referrer and user agent.
+# 2. Keep the first and last timestamps.
+def aggregate(events: Iterable[dict], top: int = 10) -> Dict[str, object]:
+    """Aggregate a stream of click events
+
+    Args:
+        events (Iterable[dict]): the events to aggregate
+        top (int): number of referrers and user agents reported
+
+    Returns:
+        Dict[str, object]: totals, clicks per key and top referrers and user agents
+    """
+    keys: Counter = Counter()
+    referrers: Counter = Counter()
+    user_agents: Counter = Counter()
+    first = last = None
+    for event in events:
+        keys[event["key"]] += 1
+        referrers[event.get("referrer") or "-"] += 1
+        user_agents[event.get("user_agent") or "-"] += 1
+        first = event["ts"] if first is None else min(first, event["ts"])
+        last = event["ts"] if last is None else max(last, event["ts"])
+    return {
+        "events": sum(keys.values()),
+        "first": first,
+        "last": last,
+        "keys": dict(keys.most_common()),
+        "referrers": dict(referrers.most_common(top)),
+        "user_agents": dict(user_agents.most_common(top)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Read the click event log")
+    parser.add_argument("command", choices=("aggregate", "cat"))
+    parser.add_argument("--dir", default=get_settings().event_log_dir)
+    parser.add_argument("--mmap", action="store_true", help="memory-map the segments")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    reader = read_segment_mmap if args.mmap else read_segment
+    events = (event for path in closed_segments(args.dir) for event in reader(path))
+    if args.command == "cat":
+        for event in events:
+            print(json.dumps(event))
+    else:
+        print(json.dumps(aggregate(events, args.top), indent=2))
+
+
+event_log = EventLog(
+    directory=get_settings().event_log_dir,
+    enabled=get_settings().event_log_enabled,
+    segment_bytes=get_settings().event_log_segment_bytes,
+    segment_seconds=get_settings().event_log_segment_seconds,
+    queue_size=get_settings().event_log_queue_size,
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Negative-lookup filter: a counting Bloom filter of the active url keys, so
+# redirects for keys that never existed are answered without the database.
+import hashlib
+import math
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .config import get_settings
+
+
+# 1. The filter is a bytearray of counters, one byte each.
+# 2. Every key increments `hashes` counters picked by double hashing of a blake2b digest.
+# 3. A key is definitely absent when one of its counters is zero.
+# 4. Counters make removal possible; a saturated counter (255) is never
+#    decremented again, which can only add false positives.
+class CountingBloomFilter:
+    """A counting Bloom filter sized for `capacity` keys at `error_rate`.
+
+    Args:
+        capacity (int): number of keys the filter is sized for.
+        error_rate (float): false-positive rate at full capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._counters = bytearray(self.size)
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        counters = self._counters
+        for position in self._positions(key):
+            if counters[position] < 255:
+                counters[position] += 1
+        self.count += 1
+
+    def remove(self, key: str) -> None:
+        """Forget a key that was added before; removing unknown keys corrupts the filter."""
+        counters = self._counters
+        positions = self._positions(key)
+        if not all(counters[position] for position in positions):
+            return
+        for position in positions:
+            if counters[position] < 255:
+                counters[position] -= 1
+        self.count -= 1
+
+    def __contains__(self, key: str) -> bool:
+        counters = self._counters
+        return all(counters[position] for position in self._positions(key))
+
+    def false_positive_rate(self) -> float:
+        """Estimated false-positive rate for the keys currently in the filter."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def memory_bytes(self) -> int:
+        return len(self._counters)
+
+
+# 1. The KeyFilter holds the current CountingBloomFilter of the active keys.
+# 2. It only answers once it has been built, before that every key may exist.
+# 3. rebuild() builds a new filter on the side and swaps it in; keys added
+#    while it runs are replayed on the new filter, so no new key is ever missed.
+# 4. Removals during a rebuild are skipped, they can only leave false positives.
+class KeyFilter:
+    """Short-circuits lookups of url keys that are definitely not active.
+
+    Args:
+        enabled (bool): when False, every key may exist and nothing is tracked.
+        capacity (int): minimal number of keys the filter is sized for.
+        error_rate (float): target false-positive rate.
+    """
+
+    def __init__(self, enabled: bool = False, capacity: int = 1_000_000, error_rate: float = 0.01) -> None:
+        self.enabled = enabled
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.negatives = 0
+        self._filter: Optional[CountingBloomFilter] = None
+        self._added_during_rebuild: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def definitely_missing(self, url_key: str) -> bool:
+        """True when `url_key` is certainly not an active key."""
+        current = self._filter
+        if current is None or url_key in current:
+            return False
+        self.negatives += 1
+        return True
+
+    def add(self, url_key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(url_key)
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append(url_key)
+
+    def remove(self, url_key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._filter is not None and self._added_during_rebuild is None:
+                self._filter.remove(url_key)
+
+    def rebuild(self, keys: Iterable[str], expected: int = 0) -> None:
+        """Replace the filter with one built from `keys`, the active keys."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._added_during_rebuild = []
+        try:
+            new_filter = CountingBloomFilter(max(self.capacity, 2 * expected), self.error_rate)
+            for key in keys:
+                new_filter.add(key)
+            with self._lock:
+                for key in self._added_during_rebuild:
+                    new_filter.add(key)
+                self._filter = new_filter
+        finally:
+            with self._lock:
+                self._added_during_rebuild = None
+
+    def stats(self) -> Dict[str, object]:
+        """Size, memory footprint and estimated false-positive rate of the filter."""
+        current = self._filter
+        return {
+            "enabled": self.enabled,
+            "ready": current is not None,
+            "keys": current.count if current else 0,
+            "capacity": current.capacity if current else self.capacity,
+            "hashes": current.hashes if current else 0,
+            "memory_bytes": current.memory_bytes() if current else 0,
+            "false_positive_rate": current.false_positive_rate() if current else None,
+            "negatives": self.negatives,
+        }
+
+
+key_filter = KeyFilter(
+    enabled=get_settings().key_filter_enabled,
+    capacity=get_settings().key_filter_capacity,
+    error_rate=get_settings().key_filter_error_rate,
+)
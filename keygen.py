@@ -1,10 +1,19 @@
 # This code imports the secrets module and the string module.
+import hashlib
 import secrets
 import string
+import threading
+from collections import deque
+from typing import List, Optional
 
 from sqlalchemy.orm import Session
 
 from . import crud
+from .config import get_settings
+from .database import SessionLocal
+
+# Keys are made of uppercase letters and digits.
+KEY_CHARS = string.ascii_uppercase + string.digits
 
 
 # 1. Import the secrets module.
@@ -15,16 +24,238 @@ from . import crud
 # 6. Join the random characters together to create a random key.
 # 7. Return the random key.
 def create_random_key(length: int = 5) -> str:
-    chars = string.ascii_uppercase + string.digits
-    return "".join(secrets.choice(chars) for _ in range(length))
+    return "".join(secrets.choice(KEY_CHARS) for _ in range(length))
 
 
 # 1. First, it creates a random key using the create_random_key() function.
-# 2. Then, it checks if the key already exists in the database.
-# 3. If it does, it creates another random key and checks again.
-# 4. If it doesn’t, it returns the key.
-def create_unique_random_key(db: Session) -> str:
-    key = create_random_key()
-    while crud.get_db_url_by_key(db, key):
-        key = create_random_key()
+# 2. Then, it checks if the key is already used by a URL, active or not.
+# 3. If it is, it creates another random key and checks again.
+# 4. If it isn’t, it returns the key.
+def create_unique_random_key(db: Session, length: int = 5) -> str:
+    key = create_random_key(length)
+    while crud.get_existing_keys(db, [key]):
+        key = create_random_key(length)
     return key
+
+
+# 1. First, it creates one random key per URL, using a set to drop duplicates.
+# 2. Then, it checks all candidates against the database with one IN query.
+# 3. Keys that already exist are dropped and replaced with new candidates.
+# 4. It repeats until it has `count` unique keys, usually after a single query.
+def create_unique_random_keys(db: Session, count: int, length: int = 5) -> List[str]:
+    keys: set = set()
+    while len(keys) < count:
+        candidates = set()
+        while len(candidates) < count - len(keys):
+            key = create_random_key(length)
+            if key not in keys:
+                candidates.add(key)
+        keys |= candidates - crud.get_existing_keys(db, candidates)
+    return list(keys)
+
+
+# 1. The KeyAllocator class is the interface of the key allocation strategies.
+# 2. allocate_many() returns `count` keys that are not used by any URL.
+# 3. allocate() is a shortcut for a single key.
+class KeyAllocator:
+    """Base class of the key allocation strategies.
+
+    Args:
+        length (int): length of the keys while the key space is not crowded.
+        occupancy_threshold (float): share of the key space after which keys
+        grow by one character.
+    """
+
+    def __init__(self, length: int = 5, occupancy_threshold: float = 0.5) -> None:
+        self.length = length
+        self.occupancy_threshold = occupancy_threshold
+
+    def allocate(self, db: Session) -> str:
+        return self.allocate_many(db, 1)[0]
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        raise NotImplementedError
+
+
+# 1. Random keys, checked against the database like create_unique_random_key.
+# 2. The highest URL id is an upper bound of the keys in use, it is cheap to read
+#    and never under-estimates the occupancy of the key space.
+# 3. When it passes the threshold, the keys grow by one character, so the number
+#    of collision checks per key stays close to one.
+class RandomKeyAllocator(KeyAllocator):
+    """Random keys with a collision check, growing as the key space fills up."""
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        self._grow(crud.get_max_url_id(db) + count)
+        return create_unique_random_keys(db, count, self.length)
+
+    def _grow(self, used: int) -> None:
+        while used > self.occupancy_threshold * len(KEY_CHARS) ** self.length:
+            self.length += 1
+
+
+# 1. A pool of random keys, checked against the database in bulk.
+# 2. allocate_many() pops keys from the pool, and refills it inline when it runs dry.
+# 3. A background thread refills the pool when it drops below half its size.
+# 4. Keys handed out from the pool are never handed out again by this process,
+#    the unique index on `urls.key` still protects against other processes.
+class PoolKeyAllocator(RandomKeyAllocator):
+    """Random keys taken from a pre-generated pool refilled in the background.
+
+    Args:
+        pool_size (int): number of keys kept ready.
+    """
+
+    def __init__(self, length: int = 5, occupancy_threshold: float = 0.5, pool_size: int = 1000) -> None:
+        super().__init__(length, occupancy_threshold)
+        self.pool_size = pool_size
+        self._pool: deque = deque()
+        self._lock = threading.Lock()
+        self._refilling = threading.Lock()
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        keys = []
+        with self._lock:
+            while self._pool and len(keys) < count:
+                keys.append(self._pool.popleft())
+            low = len(self._pool) < self.pool_size // 2
+        if len(keys) < count:
+            keys.extend(super().allocate_many(db, count - len(keys)))
+        if low:
+            self._refill_in_background()
+        return keys
+
+    def refill(self, db: Session) -> None:
+        """Top the pool up to `pool_size` unique keys."""
+        with self._lock:
+            missing = self.pool_size - len(self._pool)
+        if missing <= 0:
+            return
+        keys = super().allocate_many(db, missing)
+        with self._lock:
+            self._pool.extend(key for key in keys if key not in self._pool)
+
+    def _refill_in_background(self) -> None:
+        if self._refilling.acquire(blocking=False):
+            threading.Thread(target=self._run_refill, name="key-pool", daemon=True).start()
+
+    def _run_refill(self) -> None:
+        db = SessionLocal()
+        try:
+            self.refill(db)
+        finally:
+            db.close()
+            self._refilling.release()
+
+
+# 1. Keys are derived from a monotonic counter stored in the database, so two
+#    allocations never get the same key.
+# 2. The counter is reserved in blocks of `block_size` values, one short
+#    transaction per block.
+# 3. Each counter value is mapped to a key length; a length is used up when
+#    `occupancy_threshold` of its key space has been handed out.
+# 4. Within a length, a keyed Feistel network permutes the counter value, so
+#    consecutive keys look random. Cycle walking keeps the result inside the
+#    key space, which makes the mapping a bijection.
+# 5. Keys of a new block that are already taken (e.g. random keys created before
+#    switching allocator) are dropped with one IN query per block.
+class CounterKeyAllocator(KeyAllocator):
+    """Collision-free keys from a permuted monotonic counter.
+
+    Args:
+        block_size (int): counter values reserved per database round trip.
+        secret (str): key of the permutation, keeps the key order unguessable.
+    """
+
+    ROUNDS = 4
+
+    def __init__(
+        self,
+        length: int = 5,
+        occupancy_threshold: float = 0.5,
+        block_size: int = 100,
+        secret: str = "",
+    ) -> None:
+        super().__init__(length, occupancy_threshold)
+        self.block_size = block_size
+        self._secret = hashlib.blake2b(secret.encode()).digest()[:32]
+        self._ready: deque = deque()
+        self._lock = threading.Lock()
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        with self._lock:
+            while len(self._ready) < count:
+                self._reserve_block(db, max(self.block_size, count - len(self._ready)))
+            return [self._ready.popleft() for _ in range(count)]
+
+    def _reserve_block(self, db: Session, size: int) -> None:
+        reserve_db = SessionLocal()
+        try:
+            start = crud.reserve_key_sequence(reserve_db, "url_key", size)
+        finally:
+            reserve_db.close()
+        keys = [self.key_for(value) for value in range(start, start + size)]
+        taken = crud.get_existing_keys(db, keys)
+        self._ready.extend(key for key in keys if key not in taken)
+
+    def key_for(self, value: int) -> str:
+        """Map a counter value to its key, the same value always gives the same key."""
+        length = self.length
+        capacity = int(self.occupancy_threshold * len(KEY_CHARS) ** length)
+        while value >= capacity:
+            value -= capacity
+            length += 1
+            capacity = int(self.occupancy_threshold * len(KEY_CHARS) ** length)
+        return self._encode(self._permute(value, len(KEY_CHARS) ** length), length)
+
+    def _permute(self, value: int, space: int) -> int:
+        bits = max(2, (space - 1).bit_length() + 1) // 2 * 2
+        while True:
+            value = self._feistel(value, bits // 2)
+            if value < space:
+                return value
+
+    def _feistel(self, value: int, half: int) -> int:
+        mask = (1 << half) - 1
+        size = min(64, max(8, (half + 7) // 8))
+        left, right = value >> half, value & mask
+        for round_number in range(self.ROUNDS):
+            digest = hashlib.blake2b(
+                right.to_bytes(size, "big") + bytes([round_number]),
+                key=self._secret,
+                digest_size=size,
+            ).digest()
+            left, right = right, left ^ (int.from_bytes(digest, "big") & mask)
+        return (left << half) | right
+
+    @staticmethod
+    def _encode(value: int, length: int) -> str:
+        chars = []
+        for _ in range(length):
+            value, digit = divmod(value, len(KEY_CHARS))
+            chars.append(KEY_CHARS[digit])
+        return "".join(reversed(chars))
+
+
+# 1. Pick the allocator configured by `key_allocator` in the settings.
+# 2. Raise a ValueError for an unknown strategy, so a typo fails at startup.
+def get_key_allocator(name: Optional[str] = None) -> KeyAllocator:
+    settings = get_settings()
+    name = name or settings.key_allocator
+    if name == "random":
+        return RandomKeyAllocator(settings.key_length, settings.key_occupancy_threshold)
+    if name == "pool":
+        return PoolKeyAllocator(
+            settings.key_length, settings.key_occupancy_threshold, settings.key_pool_size
+        )
+    if name == "counter":
+        return CounterKeyAllocator(
+            settings.key_length,
+            settings.key_occupancy_threshold,
+            settings.key_block_size,
+            settings.key_secret,
+        )
+    raise ValueError(f"Unknown key allocator: {name!r}")
+
+
+key_allocator = get_key_allocator()
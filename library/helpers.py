@@ -1,14 +1,92 @@
-import os.path
+import hashlib
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 
-import markdown
+
+# The markdown pages shipped with the app, whatever the working directory is.
+PAGES_DIR = Path(__file__).resolve().parent.parent / "pages"
+
+# Page names map to files in PAGES_DIR, so they may not contain path separators.
+PAGE_NAME = re.compile(r"^[\w-]+$")
+
+
+class Page(NamedTuple):
+    """A markdown page rendered to HTML, and the mtime of its source file."""
+
+    html: str
+    mtime: float
+
+
+# 1. The PageStore renders every pages/*.md file to HTML once, at load().
+# 2. get() stats the file and only renders it again when its mtime changed.
+# 3. Unknown pages return None, so the caller can answer with a 404.
+# 4. rendered() caches the final bytes of a page (e.g. page.html) with their
+#    ETag, until the markdown page changes.
+class PageStore:
+    """In-memory cache of the rendered markdown pages.
+
+    Args:
+        directory (Path): folder holding the `<name>.md` pages.
+    """
+
+    def __init__(self, directory: Path = PAGES_DIR) -> None:
+        self.directory = Path(directory)
+        self._pages: Dict[str, Page] = {}
+        self._rendered: Dict[Tuple[str, str], Tuple[float, str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Render every page of the directory."""
+        for path in self.directory.glob("*.md"):
+            self.get(path.stem)
+
+    def get(self, name: str) -> Optional[Page]:
+        """Return the rendered page, or None when there is no such page."""
+        if not PAGE_NAME.match(name):
+            return None
+        path = self.directory / f"{name}.md"
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            self._pages.pop(name, None)
+            return None
+        page = self._pages.get(name)
+        if page is None or page.mtime != mtime:
+            with self._lock:
+                # markdown is imported on the first page render, not at startup.
+                import markdown
+
+                text = path.read_text(encoding="utf-8")
+                page = Page(html=markdown.markdown(text), mtime=mtime)
+                self._pages[name] = page
+        return page
+
+    def rendered(
+        self, name: str, variant: str, render: Callable[[Page], str]
+    ) -> Optional[Tuple[str, bytes]]:
+        """Return the ETag and bytes of `render(page)`, cached per page and variant."""
+        page = self.get(name)
+        if page is None:
+            return None
+        cached = self._rendered.get((name, variant))
+        if cached is None or cached[0] != page.mtime:
+            body = render(page).encode("utf-8")
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+            cached = (page.mtime, etag, body)
+            self._rendered[(name, variant)] = cached
+        return cached[1], cached[2]
+
+
+page_store = PageStore()
 
 
 def openfile(filename):
-    filepath = os.path.join("shortener_app/pages/", filename)
-    with open(filepath, "r", encoding="utf-8") as input_file:
-        text = input_file.read()
-    html = markdown.markdown(text)
-    return {"text": html}
+    page = page_store.get(Path(filename).stem)
+    if page is None:
+        raise FileNotFoundError(PAGES_DIR / filename)
+    return {"text": page.html}
 
 if __name__ == "__main__":
-    print(openfile("about.md"))
\ No newline at end of file
+    print(openfile("about.md"))
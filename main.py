@@ -8,34 +8,135 @@
 # 8. Creating a RedirectResponse to the index page.
 # 9. Creating a HTMLResponse to the index page.
 # 10. Creating a get_index function to return the index page.
-import validators
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+import asyncio
+import hashlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from starlette.datastructures import URL
 
-from . import crud, models, schemas
+from . import crud, migrations, models, schemas
+from .admission import AdmissionMiddleware, admission
+from .analytics import GRANULARITIES, click_rollup
+from .clicks import click_counter
+from .compaction import compactor
 from .config import get_settings
-from .database import SessionLocal, engine
-from .library.helpers import openfile
-from .routers import accordion, twoforms, unsplash
+from .database import (
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    SessionLocal,
+    async_engine,
+    engine,
+    engines,
+    read_engine,
+    session_for_key,
+    shard_engines,
+    shard_map,
+)
+from .eventlog import event_log
+from .keyfilter import key_filter
+from .library.helpers import page_store
+from .metrics import MetricsMiddleware, metrics, timed
+from .profiling import ProfilingMiddleware, profiler
+from .redirects import redirect_policy
+from .routers import accordion, admin, twoforms, unsplash
+from .routers import metrics as metrics_router
+from .sharding import key_of_secret
+from .templating import get_templates
+from .warmup import warmup
+from .writequeue import write_queue
 
 # It creates a new FastAPI application object.
 app = FastAPI()
 
-templates = Jinja2Templates(directory="templates")
-
 # It tells the application that the static files are located in the static directory
 app.mount("/static", StaticFiles(directory="./static"), name="static")
 
 app.include_router(unsplash.router)
 app.include_router(twoforms.router)
 app.include_router(accordion.router)
-
-# This code creates a database file in the directory of your choosing. Binds the database engine
-models.Base.metadata.create_all(bind=engine)
+app.include_router(admin.router)
+
+# The admission middleware is only installed when `admission_enabled` is on.
+# It is added first, inside the metrics middleware, which counts the shed requests.
+if admission.enabled:
+    app.add_middleware(AdmissionMiddleware, controller=admission, routes=app.routes)
+
+# The metrics middleware, pool and commit timers and the /metrics endpoint
+# are only installed when `metrics_enabled` is on.
+if metrics.enabled:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    metrics.instrument_pool(engine, "write")
+    if read_engine is not engine:
+        metrics.instrument_pool(read_engine, "read")
+    if async_engine is not None:
+        metrics.instrument_pool(async_engine.sync_engine, "async")
+    for name, shard_engine in shard_engines.items():
+        if shard_engine is not engine:
+            metrics.instrument_pool(shard_engine, f"shard-{name}")
+    metrics.instrument_sessions()
+    app.include_router(metrics_router.router)
+
+# The profiling middleware is only installed when `profiling_enabled` is on.
+if get_settings().profiling_enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+
+# On startup, before the other hooks, the database file is created in the
+# directory of your choosing and the schema of an existing database, and of
+# every shard, is migrated.
+@app.on_event("startup")
+def migrate_databases():
+    if get_settings().migrate_on_startup:
+        for migrated_engine in dict.fromkeys([engine, *engines()]):
+            migrations.migrate(migrated_engine)
+
+
+# 1. On startup, the click counter, the click rollup, the event log, the compactor
+#    and the write queue start their background threads.
+# 2. On shutdown, they stop and write the URLs and clicks that are still pending.
+@app.on_event("startup")
+def start_click_counter():
+    if write_queue.enabled:
+        write_queue.start()
+    click_counter.start()
+    click_rollup.start()
+    event_log.start()
+    compactor.start()
+
+
+# On startup, the warmup preloads the most clicked URLs into the redirect
+# cache and renders the pages, in the background; see warmup.py.
+@app.on_event("startup")
+def start_warmup():
+    warmup.start(SessionLocal, warm_pages)
+
+
+# On startup, the negative-lookup filter is built from the active keys.
+@app.on_event("startup")
+def build_key_filter():
+    if key_filter.enabled:
+        db = SessionLocal()
+        try:
+            crud.rebuild_key_filter(db)
+        finally:
+            db.close()
+
+
+@app.on_event("shutdown")
+def flush_click_counter():
+    compactor.stop()
+    write_queue.stop()
+    click_counter.stop()
+    click_rollup.stop()
+    event_log.stop()
 
 
 # 1. The get_db() function returns a new database session each time it is called.
@@ -59,12 +160,75 @@ def get_db():
         db.close()
 
 
+# 1. The get_key_db() function is get_db() for the redirect lookups.
+# 2. Its sessions are on the shard of `url_key` with a shard map, otherwise on
+#    the read-only pool when `db_read_only_pool` is enabled.
+def get_key_db(url_key: str):
+    """Connect to the database of a url key
+
+    Yields:
+        Session: new database sessions on the database of the key.
+    """
+    db = ReadSessionLocal() if shard_map is None else session_for_key(url_key)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# 1. The get_secret_db() function is get_key_db() for a secret key, which starts
+#    with the url key, so the admin endpoints only use one shard.
+def get_secret_db(secret_key: str):
+    """Connect to the database of a secret key
+
+    Yields:
+        Session: new database sessions on the database of the secret key.
+    """
+    db = SessionLocal() if shard_map is None else session_for_key(key_of_secret(secret_key))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# 1. The get_async_db() function is the async mode counterpart of get_db().
+# 2. The async with block closes the AsyncSession when the request is finished.
+async def get_async_db():
+    """Connect to the database through the async engine
+
+    Yields:
+        AsyncSession: new async database sessions.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# 1. First, we get the base URL from the settings and create a URL object from it.
+# 2. We replace its path with a marker, and with the admin endpoint of the
+#    app for a marker secret key.
+# 3. We split both URLs on the marker, once: the URLs of a key are then the
+#    parts around the marker joined with the key.
+@lru_cache
+def get_url_templates() -> Tuple[Tuple[str, str], Tuple[str, str]]:
+    """The shortened URL and admin URL, split around the key and the secret key
+
+    Returns:
+        Tuple[Tuple[str, str], Tuple[str, str]]: (before, after) of both URLs
+    """
+    base_url = URL(get_settings().base_url)
+    admin_endpoint = app.url_path_for("administration info", secret_key="\0")
+    url_before, _, url_after = str(base_url.replace(path="\0")).partition("\0")
+    admin_before, _, admin_after = str(base_url.replace(path=admin_endpoint)).partition("\0")
+    return (url_before, url_after), (admin_before, admin_after)
+
+
 # It gets the base URL from the admin config and then replaces the path with the key.
-# 1. First, we get the base URL from the settings.
-# 2. Then, we create a URL object from the base URL.
-# 3. We create an admin endpoint from the app.
-# 4. We replace the path of the base URL with the admin endpoint.
-# 5. We return the URL object.
+# 1. First, we get the URL templates built once from the settings and the app.
+# 2. We insert the key and the secret key in them.
+# 3. We add the clicks that are still pending in memory to the stored clicks.
+# 4. We return the URL info, built without validation since every value comes
+#    from the database.
+@timed
 def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
     """Get baseline URL from admin config
 
@@ -74,13 +238,78 @@ def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
     Returns:
         schemas.URLInfo: returns a json object with details about the URL
     """
-    base_url = URL(get_settings().base_url)
-    admin_endpoint = app.url_path_for(
-        "administration info", secret_key=db_url.secret_key
+    (url_before, url_after), (admin_before, admin_after) = get_url_templates()
+    return schemas.URLInfo.construct(
+        target_url=db_url.target_url,
+        is_active=db_url.is_active,
+        clicks=db_url.clicks + click_counter.pending(db_url.key),
+        expires_at=(
+            None
+            if db_url.expires_at is None
+            else datetime.fromtimestamp(db_url.expires_at, timezone.utc)
+        ),
+        max_clicks=db_url.max_clicks,
+        cache_max_age=db_url.cache_max_age,
+        url=f"{url_before}{db_url.key}{url_after}",
+        admin_url=f"{admin_before}{db_url.secret_key}{admin_after}",
     )
-    db_url.url = str(base_url.replace(path=db_url.key))
-    db_url.admin_url = str(base_url.replace(path=admin_endpoint))
-    return db_url
+
+
+# 1. The ETag of the admin info is a digest of its JSON, so it changes with the
+#    clicks, the deactivation and the settings of the URL.
+# 2. A request whose If-None-Match holds it gets a 304 without a body.
+# 3. Otherwise the info is returned with its ETag, and `no-cache`, so browsers
+#    and proxies revalidate it on every request.
+def admin_info_response(request: Request, response: Response, db_url: models.URL):
+    """The admin info of a URL, or a 304 when the client has it already
+
+    Args:
+        request (Request): the request, with its If-None-Match header
+        response (Response): the response of the handler, gets the headers
+        db_url (models.URL): the database URL
+
+    Returns:
+        schemas.URLInfo | Response: the URL info, or an empty 304 response
+    """
+    info = get_admin_info(db_url)
+    etag = f'W/"{hashlib.blake2b(info.json().encode(), digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return info
+
+
+# If-None-Match uses the weak comparison: the W/ prefix is ignored.
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+    return "*" in tags or etag[2:] in tags
+
+
+# Query string datetimes without a timezone are taken as UTC.
+def as_utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+# validators is imported on the first URL validation, starting the app does not need it.
+def is_valid_url(target_url: str) -> bool:
+    import validators
+
+    return bool(validators.url(target_url))
+
+
+# 1. The target URL must be valid.
+# 2. An expiry time must be in the future.
+# 3. It returns the error message, or None when the URL can be shortened.
+def url_error(url: schemas.URLBase) -> Optional[str]:
+    if not is_valid_url(url.target_url):
+        return "Your provided URL is not valid"
+    if url.expires_at is not None and as_utc(url.expires_at) <= datetime.now(timezone.utc):
+        return "expires_at must be in the future"
+    return None
 
 
 # 1. First, we import the HTTPException class from fastapi.exceptions. 2. Then, we define a function
@@ -97,7 +326,7 @@ def raise_bad_request(message):
         HTTPException:  raised when the provided URL is not valid
     """
 
-    raise HTTPException(detail=message)
+    raise HTTPException(status_code=400, detail=message)
 
 
 # 1. First, it checks if the URL exists in the database.
@@ -116,127 +345,416 @@ def raise_not_found(request):
     raise HTTPException(status_code=404, detail=message)
 
 
-# main point of interaction
-# This code is a simple HTML page that welcomes the user to the URL shortener API.
-@app.get("/", response_class=HTMLResponse)
-def read_root(request: Request):
-    """The root path and delegates all incoming GET requests
+# 1. A request to "/" of the configured base URL, built once.
+# 2. The cached pages are rendered for it, never for the Host header of a client.
+@lru_cache
+def get_base_request() -> Request:
+    """A GET request to the root of the configured base URL
 
     Returns:
-        str: Welcomes user to the URL shortener App.
+        Request: the request the cached pages are rendered for
     """
-    data = openfile("home.md")
-    # data = {'page': "Home Page"}
+    base_url = URL(get_settings().base_url)
+    return Request(
+        {
+            "type": "http",
+            "app": app,
+            "router": app.router,
+            "method": "GET",
+            "scheme": base_url.scheme,
+            "server": (base_url.hostname, base_url.port),
+            "root_path": "",
+            "path": "/",
+            "query_string": b"",
+            "headers": [(b"host", base_url.netloc.encode())],
+        }
+    )
 
-    return templates.TemplateResponse('page.html', {'request':request, 'data': data})
 
-@app.get("/page/{page_name}", response_class=HTMLResponse)
-def show_page(request: Request, page_name: str):
-    data = openfile(f"{page_name}.md")
-    return templates.TemplateResponse("page.html", {"request": request, "data": data})
-
-# 1. The first thing you do is create a URLInfo object that matches the
-#    URLInfo schema.
-# 2. You then check if the URL is valid. If it’s not, you raise a
-#    BadRequest exception.
-# 3. If the URL is valid, you create a database entry for the URL.
-# 4. You then add the key and secret_key to the db_url to match the
-#    required URLInfo schema that you need to return at the end of the
-#    function.
-# 5. You return the URLInfo object.
-@app.post("/url", response_model=schemas.URLInfo)
-def create_url(url: schemas.URLBase, db: Session = Depends(get_db)):
-    """Create a URL to be shortened
+# 1. The markdown page is taken from the page store, rendered once per file change.
+# 2. The page.html output is rendered for the configured base URL, whatever the
+#    Host header of the request, and cached per page with its ETag: one entry
+#    per page. The template rendering is timed as the "render_page" operation.
+# 3. A request with a matching If-None-Match header gets a 304 without a body.
+# 4. Unknown pages raise a 404 error.
+def page_response(request: Request, page_name: str) -> Response:
+    """Serve a markdown page through the page.html template
 
     Args:
-        url (schemas.URLBase): Expects a URL string as a POST request body.
-        By passing get_db into `Depends()`, you establish a database session
-        for the request and close the session when the request is finished
-
-        db (Session, optional): _description_. Defaults to Depends(get_db()).
+        request (Request): the incoming request
+        page_name (str): name of the page, without the .md extension
 
     Returns:
-        _type_: _description_
+        Response: the rendered page, or 304 when the client copy is current
     """
-    if not validators.url(url.target_url):
-        raise_bad_request(message="Your provided URL is not valid")
+    def render(page):
+        with metrics.time("render_page"):
+            return get_templates().get_template("page.html").render(
+                {"request": get_base_request(), "data": {"text": page.html}}
+            )
+
+    rendered = page_store.rendered(page_name, get_settings().base_url, render)
+    if rendered is None:
+        raise_not_found(request)
+    etag, body = rendered
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return HTMLResponse(body, headers={"ETag": etag})
 
-    # create a database entry for your target_url.
-    db_url = crud.create_db_url(db=db, url=url)
 
-    return get_admin_info(db_url)
+# 1. The markdown pages are rendered to HTML and every template is compiled.
+# 2. Each page is rendered through page.html, which fills the cache of page_response.
+# 3. It returns the number of pages rendered.
+def warm_pages() -> int:
+    """Render the pages and compile the templates before the first request
 
+    Returns:
+        int: number of pages rendered
+    """
+    page_store.load()
+    templates = get_templates()
+    for name in templates.env.list_templates():
+        templates.get_template(name)
+    request = get_base_request()
+    pages = [path.stem for path in page_store.directory.glob("*.md")]
+    for page_name in pages:
+        page_response(request, page_name)
+    return len(pages)
 
-# 1. The @app.get decorator is used to register the URL path and HTTP verb for the function.
-# 2. The function takes the URL key as a path parameter and a Request object as a dependency.
-# 3. The function looks up the URL entry in the database using the URL key.
-# 4. If the URL entry is found, the function updates the clicks count in the database and returns a RedirectResponse object.
-# 5. If the URL entry is not found, the function raises a NotFound exception.
-@app.get("/{url_key}")
-def forward_to_target_url(
-    url_key: str, request: Request, db: Session = Depends(get_db)
-):
-    """_summary_
 
-    Args:
-        url_key (str): URL key in database
-        request (Request): looks for an active URL entry in the database.
-        db (Session, optional): _description_. Defaults to Depends(get_db).
+# main point of interaction
+# This code is a simple HTML page that welcomes the user to the URL shortener API.
+@app.get("/", response_class=HTMLResponse)
+def read_root(request: Request):
+    """The root path and delegates all incoming GET requests
 
     Returns:
-        str: return the targeted URL
+        str: Welcomes user to the URL shortener App.
     """
+    return page_response(request, "home")
 
-    if db_url := crud.get_db_url_by_key(db=db, url_key=url_key):
-        crud.update_db_clicks(db=db, db_url=db_url)
-        return RedirectResponse(db_url.target_url)
-    else:
-        raise_not_found(request)
 
+@app.get("/page/{page_name}", response_class=HTMLResponse)
+def show_page(request: Request, page_name: str):
+    return page_response(request, page_name)
 
-# It gets the information about a URL from the database.
-# 1. First, it checks if the URL exists in the database. If it does, it returns the URL information.
-# 2. If the URL does not exist, it raises a 404 error.
-@app.get(
-    "/admin/{secret_key}",
-    name="administration info",
-    response_model=schemas.URLInfo,
-)
-def get_url_info(secret_key: str, request: Request, db: Session = Depends(get_db)):
-    """Function to get information about a URL
+
+# 1. Every URL of the batch is validated first; invalid ones get an error item.
+# 2. The valid URLs are created together by crud.create_db_urls in one transaction.
+# 3. The results are returned in the order of the request body.
+@app.post("/urls/batch", response_model=List[schemas.URLBatchItem])
+def create_urls(urls: List[schemas.URLBase], db: Session = Depends(get_db)):
+    """Shorten many URLs with a single transaction
+
+    Args:
+        urls (List[schemas.URLBase]): Expects a list of URL objects as a POST request body.
+        db (Session, optional): Defaults to Depends(get_db).
+
+    Returns:
+        List[schemas.URLBatchItem]: the URL info or the error of every URL
+    """
+    errors = [url_error(url) for url in urls]
+    valid_urls = [url for url, error in zip(urls, errors) if error is None]
+    db_urls = iter(crud.create_db_urls(db=db, urls=valid_urls))
+
+    results = []
+    for url, error in zip(urls, errors):
+        if error is None:
+            item = schemas.URLBatchItem(
+                target_url=url.target_url, url_info=get_admin_info(next(db_urls))
+            )
+        else:
+            item = schemas.URLBatchItem(target_url=url.target_url, error=error)
+        results.append(item)
+    return results
+
+
+# The default time range of the stats endpoint for every granularity.
+DEFAULT_STATS_RANGES = {
+    "minute": timedelta(hours=1),
+    "hour": timedelta(days=1),
+    "day": timedelta(days=30),
+}
+# The largest number of buckets a stats request may span.
+MAX_STATS_BUCKETS = 2000
+
+
+# 1. The time range is aligned on the buckets of the granularity.
+# 2. Ranges spanning too many buckets are rejected, so every answer is bounded.
+# 3. The buckets are range-scanned from the rollups table, and the clicks still
+#    pending in memory are added.
+@app.get("/admin/{secret_key}/stats", response_model=schemas.URLStats)
+def get_url_stats(
+    secret_key: str,
+    request: Request,
+    granularity: str = "hour",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_secret_db),
+):
+    """Clicks of a URL over time
 
     Args:
         secret_key (str): Secret key of URL
         request (Request): body of the request
-        db (Session, optional): _description_. Defaults to Depends(get_db).
+        granularity (str): "minute", "hour" or "day". Defaults to "hour".
+        start (datetime, optional): start of the range, `from` in the query string.
+        end (datetime, optional): end of the range, `to` in the query string. Defaults to now.
+        db (Session, optional): Defaults to Depends(get_secret_db).
 
     Returns:
-        (json): Information about a URL
+        schemas.URLStats: the clicks per bucket
     """
-    if db_url := crud.get_db_url_by_secret_key(db=db, secret_key=secret_key):
-        return get_admin_info(db_url)
-    else:
+    if granularity not in GRANULARITIES:
+        raise_bad_request(message=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    db_url = crud.get_db_url_by_secret_key(db=db, secret_key=secret_key)
+    if not db_url:
         raise_not_found(request)
 
+    size = GRANULARITIES[granularity]
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_STATS_RANGES[granularity]
+    end_bucket = -(-int(as_utc(end).timestamp()) // size) * size
+    start_bucket = int(as_utc(start).timestamp()) // size * size
+    if not 0 < (end_bucket - start_bucket) // size <= MAX_STATS_BUCKETS:
+        raise_bad_request(message=f"the range must span 1 to {MAX_STATS_BUCKETS} buckets")
 
-# 1. First, it checks if the secret key is valid. If it is, it deactivates the URL.
-# 2. If the secret key is not valid, it raises a 404 error.
-# 3. If the secret key is valid, it returns a message.
-# 4. If the secret key is not valid, it raises a 404 error.
-@app.delete("/admin/{secret_key}")
-def delete_url(secret_key: str, request: Request, db: Session = Depends(get_db)):
-    """A function to deactivates a URL
+    clicks = Counter(
+        crud.get_db_rollups(db, db_url.key, granularity, start_bucket, end_bucket)
+    )
+    clicks.update(click_rollup.pending(db_url.key, granularity, start_bucket, end_bucket))
+    return schemas.URLStats(
+        granularity=granularity,
+        start=datetime.fromtimestamp(start_bucket, timezone.utc),
+        end=datetime.fromtimestamp(end_bucket, timezone.utc),
+        total=sum(clicks.values()),
+        buckets=[
+            schemas.StatsBucket(
+                start=datetime.fromtimestamp(bucket, timezone.utc), clicks=count
+            )
+            for bucket, count in sorted(clicks.items())
+        ],
+    )
 
-    Args:
-        secret_key (str):  Secret key of URLn
-        request (Request): body of the request
-        db (Session, optional): _description_. Defaults to Depends(get_db).
 
-    Returns:
-        str: A success message if shortened URL was deleted, if not a 404 error
-    """
-    if db_url := crud.deactivate_db_url_by_secret_key(db, secret_key):
-        message = f"Successfully deleted shortened URL for '{db_url.target_url}'"
-        return {"detail": message}
+# 1. With the write queue, POST /url is an async handler in both modes: it
+#    validates the URL, queues it and awaits the group commit of its batch,
+#    without holding a threadpool thread or a database session.
+# 2. The other url endpoints do not change.
+if write_queue.enabled:
+
+    @app.post("/url", response_model=schemas.URLInfo)
+    async def create_url(url: schemas.URLBase):
+        """Create a URL to be shortened in the next batch of the write queue."""
+        if message := url_error(url):
+            raise_bad_request(message=message)
+
+        db_url = await asyncio.wrap_future(write_queue.submit(url))
+
+        return get_admin_info(db_url)
+
+
+# The url endpoints are registered as sync handlers on a blocking Session,
+# or as async handlers on an AsyncSession when `async_mode` is enabled.
+if not get_settings().async_mode:
+    if not write_queue.enabled:
+        # 1. The first thing you do is create a URLInfo object that matches the
+        #    URLInfo schema.
+        # 2. You then check if the URL is valid. If it’s not, you raise a
+        #    BadRequest exception.
+        # 3. If the URL is valid, you create a database entry for the URL.
+        # 4. You then add the key and secret_key to the db_url to match the
+        #    required URLInfo schema that you need to return at the end of the
+        #    function.
+        # 5. You return the URLInfo object.
+        @app.post("/url", response_model=schemas.URLInfo)
+        def create_url(url: schemas.URLBase, db: Session = Depends(get_db)):
+            """Create a URL to be shortened
+
+            Args:
+                url (schemas.URLBase): Expects a URL string as a POST request body.
+                By passing get_db into `Depends()`, you establish a database session
+                for the request and close the session when the request is finished
+
+                db (Session, optional): _description_. Defaults to Depends(get_db()).
+
+            Returns:
+                _type_: _description_
+            """
+            if message := url_error(url):
+                raise_bad_request(message=message)
+
+            # create a database entry for your target_url.
+            db_url = crud.create_db_url(db=db, url=url)
+
+            return get_admin_info(db_url)
+
+    if get_settings().redirect_fast_path and get_settings().db_url.startswith("sqlite"):
+        # 1. Redirects served from the redirect cache or the shared table never leave the event loop;
+        #    an expired cached URL is evicted and looked up in the database.
+        # 2. On a miss, crud.get_target_url_fast runs the compiled lookup on a
+        #    pooled DBAPI connection in the threadpool: no Session, no ORM object.
+        # 3. The click is recorded in memory and the redirect is returned with
+        #    the status code and Cache-Control of the redirect policy.
+        @app.get("/{url_key}")
+        async def forward_to_target_url(url_key: str, request: Request):
+            """Redirect to the target URL, see forward_to_target_url below."""
+            if (target := crud.cached_target(url_key)) is None:
+                target = await run_in_threadpool(crud.get_target_url_fast, url_key)
+            if target is not None:
+                click_counter.add(url_key)
+                click_rollup.add(url_key)
+                event_log.record_click(url_key, request.headers)
+                return redirect_policy.response(target)
+            else:
+                raise_not_found(request)
+
     else:
-        raise_not_found(request)
+        # 1. The @app.get decorator is used to register the URL path and HTTP verb for the function.
+        # 2. The function takes the URL key as a path parameter and a Request object as a dependency.
+        # 3. The function looks up the target URL in the redirect cache, then in the database.
+        # 4. If the URL entry is found, the function records the click in memory (and in the event log)
+        #    and returns a RedirectResponse object, with the status code and Cache-Control of
+        #    the redirect policy.
+        # 5. If the URL entry is not found, the function raises a NotFound exception.
+        @app.get("/{url_key}")
+        def forward_to_target_url(
+            url_key: str, request: Request, db: Session = Depends(get_key_db)
+        ):
+            """_summary_
+
+            Args:
+                url_key (str): URL key in database
+                request (Request): looks for an active URL entry in the database.
+                db (Session, optional): a read session. Defaults to Depends(get_key_db).
+
+            Returns:
+                str: return the targeted URL
+            """
+
+            if target := crud.get_target_url_by_key(db=db, url_key=url_key):
+                click_counter.add(url_key)
+                click_rollup.add(url_key)
+                event_log.record_click(url_key, request.headers)
+                return redirect_policy.response(target)
+            else:
+                raise_not_found(request)
+
+
+    # It gets the information about a URL from the database.
+    # 1. First, it checks if the URL exists in the database. If it does, it returns the URL information,
+    #    or a 304 when the If-None-Match header holds its ETag.
+    # 2. If the URL does not exist, it raises a 404 error.
+    @app.get(
+        "/admin/{secret_key}",
+        name="administration info",
+        response_model=schemas.URLInfo,
+    )
+    def get_url_info(
+        secret_key: str,
+        request: Request,
+        response: Response,
+        db: Session = Depends(get_secret_db),
+    ):
+        """Function to get information about a URL
+
+        Args:
+            secret_key (str): Secret key of URL
+            request (Request): body of the request
+            response (Response): the response, gets the ETag header
+            db (Session, optional): _description_. Defaults to Depends(get_secret_db).
+
+        Returns:
+            (json): Information about a URL
+        """
+        if db_url := crud.get_db_url_by_secret_key(db=db, secret_key=secret_key):
+            return admin_info_response(request, response, db_url)
+        else:
+            raise_not_found(request)
+
+
+    # 1. First, it checks if the secret key is valid. If it is, it deactivates the URL.
+    # 2. If the secret key is not valid, it raises a 404 error.
+    # 3. If the secret key is valid, it returns a message.
+    # 4. If the secret key is not valid, it raises a 404 error.
+    @app.delete("/admin/{secret_key}")
+    def delete_url(
+        secret_key: str, request: Request, db: Session = Depends(get_secret_db)
+    ):
+        """A function to deactivates a URL
+
+        Args:
+            secret_key (str):  Secret key of URLn
+            request (Request): body of the request
+            db (Session, optional): _description_. Defaults to Depends(get_secret_db).
+
+        Returns:
+            str: A success message if shortened URL was deleted, if not a 404 error
+        """
+        if db_url := crud.deactivate_db_url_by_secret_key(db, secret_key):
+            message = f"Successfully deleted shortened URL for '{db_url.target_url}'"
+            return {"detail": message}
+        else:
+            raise_not_found(request)
+
+else:
+    # Async mode: the same endpoints as `async def` handlers on an AsyncSession,
+    # so they run on the event loop instead of the threadpool. The asyncio
+    # extension of SQLAlchemy is only imported in this mode.
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from . import async_crud
+
+    if not write_queue.enabled:
+        @app.post("/url", response_model=schemas.URLInfo)
+        async def create_url(url: schemas.URLBase, db: AsyncSession = Depends(get_async_db)):
+            """Create a URL to be shortened, see the sync create_url."""
+            if message := url_error(url):
+                raise_bad_request(message=message)
+
+            db_url = await async_crud.create_db_url(db=db, url=url)
+
+            return get_admin_info(db_url)
+
+    @app.get("/{url_key}")
+    async def forward_to_target_url(
+        url_key: str, request: Request, db: AsyncSession = Depends(get_async_db)
+    ):
+        """Redirect to the target URL, see the sync forward_to_target_url."""
+        if target := await async_crud.get_target_url_by_key(db=db, url_key=url_key):
+            click_counter.add(url_key)
+            click_rollup.add(url_key)
+            event_log.record_click(url_key, request.headers)
+            return redirect_policy.response(target)
+        else:
+            raise_not_found(request)
+
+    @app.get(
+        "/admin/{secret_key}",
+        name="administration info",
+        response_model=schemas.URLInfo,
+    )
+    async def get_url_info(
+        secret_key: str,
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        """Information about a URL, see the sync get_url_info."""
+        if db_url := await async_crud.get_db_url_by_secret_key(
+            db=db, secret_key=secret_key
+        ):
+            return admin_info_response(request, response, db_url)
+        else:
+            raise_not_found(request)
+
+    @app.delete("/admin/{secret_key}")
+    async def delete_url(
+        secret_key: str, request: Request, db: AsyncSession = Depends(get_async_db)
+    ):
+        """Deactivate a URL, see the sync delete_url."""
+        if db_url := await async_crud.deactivate_db_url_by_secret_key(db, secret_key):
+            message = f"Successfully deleted shortened URL for '{db_url.target_url}'"
+            return {"detail": message}
+        else:
+            raise_not_found(request)
@@ -0,0 +1,331 @@
+# Request and database latency metrics, exported in the Prometheus text format.
+# Every thread records into its own shard of each metric, without locks; the
+# shards are only merged when /metrics is scraped. When `metrics_enabled` is
+# off, the middleware is not installed and timed() returns the function as is.
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+
+# Upper bounds of the latency buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+# 1. Every thread gets its own dict of labels -> values, registered once.
+# 2. Only the owning thread writes to a shard, so no lock is needed to record.
+# 3. merged() sums the shards of all threads, dead ones included, so the
+#    values stay monotonic.
+class _ShardedMetric:
+    def __init__(self, name: str, documentation: str, label_names: Labels) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self, size: int) -> Dict[Labels, List[float]]:
+        with self._lock:
+            shards = list(self._shards)
+        merged: Dict[Labels, List[float]] = {}
+        for shard in shards:
+            for labels, values in list(shard.items()):
+                total = merged.setdefault(labels, [0] * size)
+                for index, value in enumerate(list(values)):
+                    total[index] += value
+        return merged
+
+    def _label_text(self, labels: Labels, extra: str = "") -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_ShardedMetric):
+    """Monotonic counter per label values."""
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0]
+        cell[0] += amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, (value,) in sorted(self._merged(1).items()):
+            yield f"{self.name}{self._label_text(labels)} {value}"
+
+
+# 1. A histogram cell holds one count per bucket, one for +Inf and the sum.
+# 2. Counts are stored per bucket and made cumulative when rendered.
+class Histogram(_ShardedMetric):
+    """Latency histogram per label values.
+
+    Args:
+        name (str): metric name.
+        documentation (str): HELP text.
+        label_names (Labels): names of the labels.
+        buckets (tuple): upper bounds of the buckets, in seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Labels,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def observe(self, labels: Labels, seconds: float) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0] * (len(self.buckets) + 2)
+        cell[bisect_left(self.buckets, seconds)] += 1
+        cell[-1] += seconds
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, cell in sorted(self._merged(len(self.buckets) + 2).items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), cell):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_text(labels)} {cell[-1]}"
+            yield f"{self.name}_count{self._label_text(labels)} {cumulative}"
+
+
+def escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# 1. The Metrics registry holds the request, database and pool metrics.
+# 2. Gauges (in-flight requests, threadpool, pool usage) are read on scrape.
+# 3. timed() and time() record the duration of a function or a block as an
+#    operation (e.g. "crud.get_target_url_by_key", "commit", "render_page").
+class Metrics:
+    """Registry of the application metrics.
+
+    Args:
+        enabled (bool): when False, nothing is instrumented.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.in_flight = 0
+        self.http_duration = Histogram(
+            "shortener_http_request_duration_seconds",
+            "Time to answer a request, per route.",
+            ("method", "route"),
+        )
+        self.http_responses = Counter(
+            "shortener_http_responses_total",
+            "Responses sent, per route and status code.",
+            ("method", "route", "status"),
+        )
+        self.operation_duration = Histogram(
+            "shortener_operation_duration_seconds",
+            "Time spent in database operations, commits and rendering.",
+            ("operation",),
+        )
+        self.pool_wait = Histogram(
+            "shortener_db_pool_checkout_seconds",
+            "Time to check a connection out of the SQLAlchemy pool.",
+            ("pool",),
+        )
+        self._pools: Dict[str, object] = {}
+
+    def timed(self, func: Callable) -> Callable:
+        """Decorator recording the duration of every call of `func`."""
+        if not self.enabled:
+            return func
+        labels = (f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}",)
+        observe = self.operation_duration.observe
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(labels, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(labels, time.perf_counter() - start)
+
+        return wrapper
+
+    @contextmanager
+    def time(self, operation: str) -> Iterator[None]:
+        """Record the duration of a block as `operation`."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.operation_duration.observe((operation,), time.perf_counter() - start)
+
+    # 1. Wrap the `_do_get` of the engine pool, which blocks while the pool is
+    #    exhausted, to time every checkout.
+    # 2. Keep the pool to report its checked out connections on scrape.
+    def instrument_pool(self, engine, name: str) -> None:
+        if not self.enabled or name in self._pools:
+            return
+        pool = engine.pool
+        do_get = pool._do_get
+        labels = (name,)
+        observe = self.pool_wait.observe
+
+        def timed_do_get():
+            start = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                observe(labels, time.perf_counter() - start)
+
+        pool._do_get = timed_do_get
+        self._pools[name] = pool
+
+    # 1. Time commits (flush included) of every ORM session, sync and async,
+    #    from before_commit to after_commit.
+    def instrument_sessions(self) -> None:
+        if not self.enabled or event.contains(Session, "before_commit", _before_commit):
+            return
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", _forget_commit)
+
+    def _after_commit(self, session: Session) -> None:
+        start = session.info.pop("metrics_commit_start", None)
+        if start is not None:
+            self.operation_duration.observe(("commit",), time.perf_counter() - start)
+
+    def render(self, threadpool: Optional[object] = None) -> str:
+        """The metrics in the Prometheus text exposition format.
+
+        Args:
+            threadpool: statistics of the anyio capacity limiter of the threadpool
+
+        Returns:
+            str: the exposition text
+        """
+        lines = [
+            *self.http_duration.render(),
+            *self.http_responses.render(),
+            *self.operation_duration.render(),
+            *self.pool_wait.render(),
+            "# HELP shortener_http_requests_in_flight Requests being answered.",
+            "# TYPE shortener_http_requests_in_flight gauge",
+            f"shortener_http_requests_in_flight {self.in_flight}",
+        ]
+        if threadpool is not None:
+            lines += [
+                "# HELP shortener_threadpool_threads Threads of the threadpool, per state.",
+                "# TYPE shortener_threadpool_threads gauge",
+                f'shortener_threadpool_threads{{state="busy"}} {threadpool.borrowed_tokens}',
+                f'shortener_threadpool_threads{{state="total"}} {threadpool.total_tokens}',
+                "# HELP shortener_threadpool_waiting Tasks waiting for a threadpool thread.",
+                "# TYPE shortener_threadpool_waiting gauge",
+                f"shortener_threadpool_waiting {threadpool.tasks_waiting}",
+            ]
+        if self._pools:
+            lines += [
+                "# HELP shortener_db_pool_checked_out Connections checked out of the pool.",
+                "# TYPE shortener_db_pool_checked_out gauge",
+            ]
+            for name, pool in sorted(self._pools.items()):
+                if hasattr(pool, "checkedout"):
+                    lines.append(f'shortener_db_pool_checked_out{{pool="{name}"}} {pool.checkedout()}')
+        return "\n".join(lines) + "\n"
+
+
+def _before_commit(session: Session) -> None:
+    session.info["metrics_commit_start"] = time.perf_counter()
+
+
+def _forget_commit(session: Session) -> None:
+    session.info.pop("metrics_commit_start", None)
+
+
+# 1. Pure ASGI middleware: no request object and no extra task per request.
+# 2. The route label is the path template of the matched route (e.g.
+#    "/{url_key}"), which FastAPI sets in the scope, so keys never become labels.
+# 3. The status code is taken from the response start message.
+class MetricsMiddleware:
+    """Record the latency, status and in-flight count of every HTTP request."""
+
+    def __init__(self, app, metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", None) or (
+                "/static" if scope["path"].startswith("/static/") else "unmatched"
+            )
+            metrics.http_duration.observe((scope["method"], path), elapsed)
+            metrics.http_responses.inc((scope["method"], path, status))
+
+
+metrics = Metrics(enabled=get_settings().metrics_enabled)
+timed = metrics.timed
@@ -0,0 +1,163 @@
+# In-place schema migrations for existing databases.
+# Base.metadata.create_all only creates missing tables, it never alters an
+# existing one. The migrations below bring an existing SQLite file up to date;
+# the version reached is stored in `PRAGMA user_version`.
+#     python -m shortener_app.migrations
+import logging
+from typing import Callable, List
+
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .dedup import backfill_target_hashes
+
+logger = logging.getLogger(__name__)
+
+# Value of `PRAGMA auto_vacuum` in incremental mode.
+INCREMENTAL_VACUUM = 2
+
+# Databases up to this many pages are vacuumed by the migration (~40 MB with
+# the default page size); larger ones are left to an offline VACUUM.
+VACUUM_PAGES_LIMIT = 10000
+
+
+# 1. Drop the index on target_url, no query uses it and it slows every insert.
+# 2. Create the partial index on inactive rows.
+def drop_target_url_index(connection: Connection) -> None:
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_urls_target_url")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_urls_inactive_id ON urls (id) WHERE is_active = 0"
+    )
+
+
+# 1. Add the target_hash column, unless create_all already created it.
+# 2. Compute the hash of the existing rows.
+# 3. Index the hashes of the active rows.
+def add_target_hash(connection: Connection) -> None:
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(urls)")}
+    if "target_hash" not in columns:
+        connection.exec_driver_sql("ALTER TABLE urls ADD COLUMN target_hash INTEGER")
+    db = Session(bind=connection)
+    backfill_target_hashes(db)
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_urls_active_target_hash"
+        " ON urls (target_hash) WHERE is_active = 1"
+    )
+
+
+# Version 3 indexed the clicks of the active rows; drop_active_clicks_index
+# removed that index, this migration is kept for the numbering.
+def index_active_clicks(connection: Connection) -> None:
+    pass
+
+
+# 1. Add the expiry columns, unless create_all already created them.
+# 2. Index the rows that can expire, for the compactor.
+# 3. migrate() then switches the database to incremental auto-vacuum, see
+#    enable_incremental_vacuum().
+def add_expiry(connection: Connection) -> None:
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(urls)")}
+    for column in ("expires_at", "max_clicks"):
+        if column not in columns:
+            connection.exec_driver_sql(f"ALTER TABLE urls ADD COLUMN {column} INTEGER")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_urls_expires_at"
+        " ON urls (expires_at) WHERE expires_at IS NOT NULL"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_urls_max_clicks_id ON urls (id) WHERE max_clicks IS NOT NULL"
+    )
+
+
+# 1. Incremental auto-vacuum lets the compactor free the pages of the rows it
+#    archives in small steps.
+# 2. The mode of an existing database only changes with a VACUUM, which
+#    rewrites the whole file and which SQLite refuses to run in a transaction:
+#    it runs on a connection of its own in autocommit mode, after add_expiry
+#    committed. Small databases are vacuumed here; large ones log how to run
+#    it offline.
+def enable_incremental_vacuum(engine: Engine) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == INCREMENTAL_VACUUM:
+            return
+        pages = connection.exec_driver_sql("PRAGMA page_count").scalar()
+        if pages <= VACUUM_PAGES_LIMIT:
+            connection.exec_driver_sql("VACUUM")
+        else:
+            logger.warning(
+                "%s has %d pages: run `python -m shortener_app.compaction --vacuum`"
+                " while the app is stopped to enable incremental vacuum",
+                engine.url,
+                pages,
+            )
+
+
+# Add the per-URL cache max-age column, unless create_all already created it.
+def add_cache_max_age(connection: Connection) -> None:
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(urls)")}
+    if "cache_max_age" not in columns:
+        connection.exec_driver_sql("ALTER TABLE urls ADD COLUMN cache_max_age INTEGER")
+
+
+# Drop the partial index on active keys that version 1 created: the lookups by
+# key use the unique ix_urls_key, and every insert paid for both.
+def drop_active_key_index(connection: Connection) -> None:
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_urls_active_key")
+
+
+# Drop the partial index on the clicks of the active rows: every click flush
+# updated it, for the one scan of the startup warmup, which now sorts the rows.
+def drop_active_clicks_index(connection: Connection) -> None:
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_urls_active_clicks")
+
+
+# The migrations in order; migration N brings the database to version N + 1.
+# Every migration must also succeed on a database created by create_all.
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    drop_target_url_index,
+    add_target_hash,
+    index_active_clicks,
+    add_expiry,
+    add_cache_max_age,
+    drop_active_key_index,
+    drop_active_clicks_index,
+]
+
+
+# 1. Create the missing tables, with the current schema.
+# 2. Read the schema version of the SQLite database.
+# 3. Run every migration above that version, each in its own transaction,
+#    and store the new version with it; add_expiry is followed by the VACUUM
+#    that enables incremental auto-vacuum, outside of any transaction.
+def migrate(engine: Engine) -> int:
+    """Bring the database of `engine` to the current schema
+
+    Args:
+        engine (Engine): the database to migrate
+
+    Returns:
+        int: the schema version of the database
+    """
+    models.Base.metadata.create_all(bind=engine)
+    if engine.dialect.name != "sqlite":
+        return len(MIGRATIONS)
+    with engine.connect() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with engine.begin() as connection:
+            migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+        if migration is add_expiry:
+            enable_incremental_vacuum(engine)
+        logger.info("Migrated %s to schema version %d", engine.url, number)
+    return len(MIGRATIONS)
+
+
+if __name__ == "__main__":
+    from .database import engine, engines
+
+    logging.basicConfig(level=logging.INFO)
+    for migrated_engine in dict.fromkeys([engine, *engines()]):
+        print(f"{migrated_engine.url}: schema version {migrate(migrated_engine)}")
@@ -1,6 +1,6 @@
 from email.policy import default
 from enum import unique
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, Index, Integer, String, text
 
 from .database import Base
 
@@ -11,9 +11,13 @@ from .database import Base
 # 4. Define the id column as the primary key.
 # 5. Define the key column as a unique column and index it.
 # 6. Define the secret_key column as a unique column and index it.
-# 7. Define the target_url column as an index.
+# 7. Define the target_url column without an index, no query filters on it.
 # 8. Define the is_active column as a default value of True.
 # 9. Define the clicks column as a default value of 0.
+# 10. Define the target_hash column, a digest used to find duplicate targets.
+# 11. Define the optional expiry of the URL: a unix time and a number of clicks.
+# 12. Define partial indexes that only hold the active (or inactive) rows,
+#     and the rows that can expire.
 class URL(Base):
     """A database model named URL
 
@@ -26,10 +30,98 @@ class URL(Base):
     """
 
     __tablename__ = "urls"
+    # The unique indexes on key and secret_key keep keys unique across all rows
+    # and serve the lookups by key, active or not. The partial indexes only
+    # cover one kind of rows: inactive rows are what compaction looks for, and
+    # active target hashes find an existing URL for the same target. Their
+    # condition matches the `is_active = 1` SQLAlchemy renders for SQLite. The
+    # compactor finds the expired rows through the indexes of the rows with an
+    # expiry. Clicks are not indexed: they change on every click flush.
+    __table_args__ = (
+        Index("ix_urls_inactive_id", "id", sqlite_where=text("is_active = 0")),
+        Index(
+            "ix_urls_active_target_hash",
+            "target_hash",
+            sqlite_where=text("is_active = 1"),
+        ),
+        Index("ix_urls_expires_at", "expires_at", sqlite_where=text("expires_at IS NOT NULL")),
+        Index("ix_urls_max_clicks_id", "id", sqlite_where=text("max_clicks IS NOT NULL")),
+    )
 
     id = Column(Integer, primary_key=True)
     key = Column(String, unique=True, index=True)
     secret_key = Column(String, unique=True, index=True)
-    target_url = Column(String, index=True)
+    target_url = Column(String)
+    # 64-bit digest of the normalized target_url (see dedup.url_digest).
+    target_hash = Column(Integer)
     is_active = Column(Boolean, default=True)
     clicks = Column(Integer, default=0)
+    # The URL stops redirecting at this unix time, or after max_clicks clicks.
+    expires_at = Column(Integer)
+    max_clicks = Column(Integer)
+    # Seconds browsers and CDNs may cache the redirect; NULL uses redirect_max_age.
+    cache_max_age = Column(Integer)
+
+
+# 1. Define the ArchivedURL class.
+# 2. The compactor moves the inactive and expired rows of urls here, which
+#    frees their key and keeps the unique indexes of urls small.
+# 3. The key is not unique, a key reused by a new URL may be archived again.
+#    The only index is on archived_at, to prune the archive by age.
+class ArchivedURL(Base):
+    """A URL removed from the urls table
+
+    Args:
+        Base (class): the columns of the URL, without its target hash, and
+        `archived_at`, the unix time it was archived at.
+    """
+
+    __tablename__ = "urls_archive"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False)
+    secret_key = Column(String, nullable=False)
+    target_url = Column(String)
+    is_active = Column(Boolean)
+    clicks = Column(Integer)
+    expires_at = Column(Integer)
+    max_clicks = Column(Integer)
+    archived_at = Column(Integer, nullable=False, index=True)
+
+
+# 1. Define the KeySequence class.
+# 2. Each row is a named counter, used by keygen.CounterKeyAllocator.
+# 3. The value column holds the next free value of the counter.
+class KeySequence(Base):
+    """A named monotonic counter
+
+    Args:
+        Base (class): `name` identifies the counter, `value` is its next free value.
+    """
+
+    __tablename__ = "key_sequences"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+# 1. Define the ClickRollup class.
+# 2. Each row counts the clicks of one key within one time bucket.
+# 3. The primary key (key, granularity, bucket) serves the range queries of the
+#    stats endpoint, and the table is stored without rowid to keep it compact.
+class ClickRollup(Base):
+    """Clicks of a URL in a minute, hour or day bucket
+
+    Args:
+        Base (class): `key` is the url key, `granularity` the bucket size
+        ("minute", "hour" or "day"), `bucket` the unix timestamp of the
+        bucket start and `clicks` the number of clicks in the bucket.
+    """
+
+    __tablename__ = "click_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    key = Column(String, primary_key=True)
+    granularity = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,247 @@
+# On-demand profiling of single requests with a statistical sampler.
+# A request is profiled when it carries a valid signed `X-Profile` header, or
+# when it is drawn by the sample rate. The profile is written in the collapsed
+# stack format (one "frame;frame;frame count" line per stack), which
+# flamegraph.pl and speedscope read. When `profiling_enabled` is off, the
+# middleware is not installed.
+#     python -m shortener_app.profiling sign GET /admin/ABCDE_SECRET
+import argparse
+import hashlib
+import hmac
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from .config import get_settings
+
+# Code from the files of the package marks the stacks that belong to requests.
+PACKAGE_DIR = str(Path(__file__).parent)
+
+# Profile names are generated by Profiler.save, anything else is refused.
+PROFILE_NAME = re.compile(r"^[\w.-]+\.collapsed$")
+
+# Signed headers are accepted for this many seconds after their timestamp.
+SIGNATURE_TTL = 300
+
+
+# 1. The signature covers a timestamp, the method and the path, so a header
+#    cannot be replayed on another route or after SIGNATURE_TTL.
+def sign(secret: str, method: str, path: str, timestamp: int) -> str:
+    """HMAC-SHA256 signature of a profiling request
+
+    Args:
+        secret (str): the `profiling_secret` setting
+        method (str): HTTP method, e.g. "GET"
+        path (str): request path, e.g. "/admin/ABCDE_SECRET"
+        timestamp (int): unix time of the signature
+
+    Returns:
+        str: the `X-Profile` header value, "<timestamp>:<hex digest>"
+    """
+    message = f"{timestamp} {method.upper()} {path}".encode()
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}:{digest}"
+
+
+# 1. Walk a frame up to the root of its thread and label every frame with its
+#    function, file and first line.
+# 2. Stacks without a frame of the package are idle threads and are dropped.
+def collapse(frame) -> Optional[str]:
+    labels = []
+    relevant = False
+    while frame is not None:
+        code = frame.f_code
+        relevant = relevant or code.co_filename.startswith(PACKAGE_DIR)
+        labels.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(labels)) if relevant else None
+
+
+# 1. A background thread snapshots the stacks of all threads every `interval`
+#    seconds with sys._current_frames(), while the request runs.
+# 2. This covers the event loop thread and the threadpool thread running a
+#    sync handler. Other requests running at the same time show up too.
+class Sampler:
+    """Statistical stack sampler.
+
+    Args:
+        interval (float): seconds between two samples.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """Stop sampling and return the sample count of every stack."""
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own and (stack := collapse(frame)):
+                    self.stacks[stack] += 1
+
+
+# 1. should_profile() checks the signed header first, then the sample rate.
+# 2. save() writes one file per profiled request and deletes the oldest
+#    profiles beyond `keep`.
+class Profiler:
+    """Profiling policy and storage.
+
+    Args:
+        directory (str): folder of the profiles.
+        secret (str): key of the signed header; empty disables the header.
+        sample_rate (float): fraction of the requests profiled at random.
+        interval (float): seconds between two stack samples.
+        keep (int): number of profiles kept in the directory.
+    """
+
+    def __init__(
+        self,
+        directory: str = "./profiles",
+        secret: str = "",
+        sample_rate: float = 0.0,
+        interval: float = 0.001,
+        keep: int = 100,
+    ) -> None:
+        self.directory = Path(directory)
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def should_profile(self, scope: dict) -> bool:
+        """Whether the request of this ASGI scope is profiled."""
+        if self.secret:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    return self.verify(scope["method"], scope["path"], value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def verify(self, method: str, path: str, header: str) -> bool:
+        """Check the timestamp and signature of an `X-Profile` header."""
+        timestamp, _, _ = header.partition(":")
+        if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > SIGNATURE_TTL:
+            return False
+        return hmac.compare_digest(header, sign(self.secret, method, path, int(timestamp)))
+
+    def save(self, scope: dict, stacks: Counter, elapsed: float) -> Path:
+        """Write the stacks of a request in the collapsed format."""
+        route = getattr(scope.get("route"), "path", scope["path"])
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        name = "{}-{:04d}-{}-{}-{}ms.collapsed".format(
+            int(time.time() * 1000),
+            sequence % 10000,
+            scope["method"],
+            re.sub(r"[^\w-]+", "_", route).strip("_") or "root",
+            int(elapsed * 1000),
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+            encoding="utf-8",
+        )
+        for old in self.profiles()[self.keep :]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def profiles(self) -> List[Path]:
+        """The stored profiles, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob("*.collapsed"), reverse=True)
+
+    def describe(self) -> List[Dict[str, object]]:
+        """Name, size and creation time of the stored profiles, newest first."""
+        return [
+            {
+                "name": path.name,
+                "bytes": path.stat().st_size,
+                "created": int(path.name.split("-", 1)[0]) / 1000,
+            }
+            for path in self.profiles()
+        ]
+
+    def path_for(self, name: str) -> Optional[Path]:
+        """The path of a stored profile, or None when there is no such profile."""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+# 1. Pure ASGI middleware: requests that are not profiled only pay for
+#    should_profile().
+# 2. A profiled request is sampled from the moment it enters the app until
+#    its response is sent, then its profile is saved.
+# 3. Stopping the sampler joins its thread and saving writes, lists and
+#    deletes files: both run in the threadpool, not on the event loop.
+class ProfilingMiddleware:
+    """Profile the requests selected by the Profiler."""
+
+    def __init__(self, app, profiler: Profiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        sampler = Sampler(self.profiler.interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            await run_in_threadpool(self.finish, scope, sampler, elapsed)
+
+    def finish(self, scope, sampler: Sampler, elapsed: float) -> None:
+        """Stop the sampler and save the profile of the request."""
+        self.profiler.save(scope, sampler.stop(), elapsed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sign a request for profiling")
+    parser.add_argument("command", choices=("sign",))
+    parser.add_argument("method")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    if not get_settings().profiling_secret:
+        sys.exit("PROFILING_SECRET is not set")
+    header = sign(get_settings().profiling_secret, args.method, args.path, int(time.time()))
+    print(f"X-Profile: {header}")
+
+
+profiler = Profiler(
+    directory=get_settings().profiling_dir,
+    secret=get_settings().profiling_secret,
+    sample_rate=get_settings().profiling_sample_rate,
+    interval=get_settings().profiling_interval,
+    keep=get_settings().profiling_keep,
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# HTTP caching of the redirects.
+# A redirect without cache headers makes browsers and CDNs ask the app on every
+# click; a permanent one (301, 308) without them may be cached forever, and
+# keep redirecting after the URL is deleted. The redirect policy sets the
+# status code and a bounded Cache-Control max-age on every redirect: clicks
+# served by a cache are not counted, so counting every click means no-store.
+import time
+from typing import Dict
+
+from fastapi.responses import RedirectResponse
+
+from .cache import RedirectTarget
+from .config import get_settings
+
+# The temporary counterpart of every supported redirect status code.
+TEMPORARY_CODES: Dict[int, int] = {301: 302, 302: 302, 307: 307, 308: 307}
+
+
+# 1. The max-age of a URL is its own cache_max_age, or the default one.
+# 2. It is capped by `max_age_limit` and by the time left before the URL
+#    expires; URLs with a click limit must count every click: no-store.
+# 3. A max-age of 0 sends `no-store`, otherwise `public, max-age=N`.
+# 4. A URL that cannot be cached, or that expires, never gets a permanent
+#    status code: its temporary counterpart is used.
+class RedirectPolicy:
+    """Status code and Cache-Control header of the redirects.
+
+    Args:
+        status_code (int): 301, 302, 307 or 308.
+        max_age (int): seconds a redirect may be cached, for URLs without their own.
+        max_age_limit (int): cap of every max-age.
+    """
+
+    def __init__(self, status_code: int = 307, max_age: int = 0, max_age_limit: int = 86400) -> None:
+        if status_code not in TEMPORARY_CODES:
+            raise ValueError(f"Unsupported redirect status code: {status_code!r}")
+        self.status_code = status_code
+        self.max_age = max_age
+        self.max_age_limit = max_age_limit
+
+    def max_age_of(self, target: RedirectTarget) -> int:
+        """Seconds the redirect of `target` may be cached, 0 when it may not."""
+        if target.max_clicks is not None:
+            return 0
+        max_age = self.max_age if target.max_age is None else target.max_age
+        max_age = min(max_age, self.max_age_limit)
+        if target.expires_at is not None:
+            max_age = min(max_age, target.expires_at - int(time.time()))
+        return max(max_age, 0)
+
+    def response(self, target: RedirectTarget) -> RedirectResponse:
+        """The redirect response of `target`, with its status code and Cache-Control."""
+        max_age = self.max_age_of(target)
+        status_code = self.status_code
+        if max_age == 0 or target.expires_at is not None:
+            status_code = TEMPORARY_CODES[status_code]
+        return RedirectResponse(
+            target.url,
+            status_code=status_code,
+            headers={
+                "Cache-Control": f"public, max-age={max_age}" if max_age else "no-store"
+            },
+        )
+
+
+redirect_policy = RedirectPolicy(
+    status_code=get_settings().redirect_status_code,
+    max_age=get_settings().redirect_max_age,
+    max_age_limit=get_settings().redirect_max_age_limit,
+)
@@ -1,18 +1,18 @@
 from fastapi import APIRouter, FastAPI, Form, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+
+from ..templating import get_templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates/")
 
 
 @router.get("/accordion", response_class=HTMLResponse)
 def get_accordion(request: Request):
     tag = "flower"
     result = "Type a number"
-    return templates.TemplateResponse('accordion.html', context={'request': request, 'result': result, 'tag': tag})
+    return get_templates().TemplateResponse('accordion.html', context={'request': request, 'result': result, 'tag': tag})
 
 
 @router.post("/accordion", response_class=HTMLResponse)
 def post_accordion(request: Request, tag: str = Form(...)):
-    return templates.TemplateResponse('accordion.html', context={'request': request, 'tag': tag})
+    return get_templates().TemplateResponse('accordion.html', context={'request': request, 'tag': tag})
@@ -0,0 +1,149 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..admission import admission
+from ..cache import redirect_cache
+from ..clicks import click_counter
+from ..compaction import compactor
+from ..config import get_settings
+from ..database import SessionLocal
+from ..keyfilter import key_filter
+from ..profiling import profiler
+from ..shmtable import shared_table
+from ..transfer import Importer, export_lines
+from ..warmup import warmup
+from ..writequeue import write_queue
+
+router = APIRouter(prefix="/admin")
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# 1. The routes that dump, scan or change every URL need the `admin_token` setting
+#    in an `X-Admin-Token` header.
+# 2. Without a configured token they do not exist: they answer 404.
+def require_admin_token(x_admin_token: str = Header("")):
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# 1. The request profiles expose stack frames and file paths: their routes need
+#    the `profiling_secret` setting in an `X-Profiling-Secret` header.
+# 2. With profiling disabled or no secret configured they answer 404.
+def require_profiling_secret(x_profiling_secret: str = Header("")):
+    if not get_settings().profiling_enabled or not profiler.secret:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_profiling_secret.encode(), profiler.secret.encode()):
+        raise HTTPException(status_code=403, detail="Invalid profiling secret")
+
+
+@router.get("/ready")
+async def get_readiness():
+    """200 once the startup warmup is done, 503 before, with its report."""
+    if not warmup.ready:
+        return JSONResponse(warmup.stats(), status_code=503)
+    return warmup.stats()
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Hit, miss and eviction counters of the redirect cache and the shared table."""
+    return {"redirect_cache": redirect_cache.stats(), "shared_table": shared_table.stats()}
+
+
+@router.get("/filter/stats")
+def get_filter_stats():
+    """Memory footprint and false-positive rate of the negative-lookup filter."""
+    return {"key_filter": key_filter.stats()}
+
+
+@router.get("/writes/stats")
+def get_write_stats():
+    """Batch counters of the group commit of the URL creations."""
+    return {"write_queue": write_queue.stats()}
+
+
+@router.get("/admission/stats")
+def get_admission_stats():
+    """Requests running, queued and shed by the admission control, per route class."""
+    return {"admission": admission.stats()}
+
+
+@router.post("/filter/rebuild", dependencies=[Depends(require_admin_token)])
+def rebuild_filter(db: Session = Depends(get_db)):
+    """Rebuild the negative-lookup filter from the active keys."""
+    crud.rebuild_key_filter(db)
+    return {"key_filter": key_filter.stats()}
+
+
+@router.post("/compact", dependencies=[Depends(require_admin_token)])
+def compact():
+    """Archive the inactive and expired URLs now, and vacuum their pages."""
+    return {"compaction": compactor.compact(), "totals": compactor.stats()}
+
+
+@router.get("/profiles", dependencies=[Depends(require_profiling_secret)])
+def list_profiles():
+    """The request profiles that are kept, newest first."""
+    return {"profiles": profiler.describe()}
+
+
+@router.get("/profiles/{name}", dependencies=[Depends(require_profiling_secret)])
+def download_profile(name: str):
+    """A request profile, in the collapsed stack format."""
+    if (path := profiler.path_for(name)) is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{name}' doesnt exist")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
+# 1. The pending clicks are written first, so the export holds every click.
+# 2. The rows are streamed from a session of their own, which lives as long
+#    as the response and is closed when the stream ends.
+@router.get("/export", dependencies=[Depends(require_admin_token)])
+def export_urls():
+    """Every URL as NDJSON, streamed."""
+    click_counter.flush()
+
+    def stream():
+        db = SessionLocal()
+        try:
+            yield from export_lines(db)
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# 1. The body is read incrementally and split into lines on the event loop.
+# 2. Every full chunk of rows is inserted in its own transaction in the threadpool.
+# 3. The negative-lookup filter is rebuilt to know the imported keys.
+@router.post("/import", dependencies=[Depends(require_admin_token)])
+async def import_urls(request: Request, db: Session = Depends(get_db)):
+    """Import NDJSON lines produced by /admin/export."""
+    importer = Importer(db)
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if chunk := importer.add(line):
+                await run_in_threadpool(importer.write, chunk)
+    importer.add(buffer)
+    await run_in_threadpool(importer.write, importer.remaining())
+    if key_filter.enabled:
+        await run_in_threadpool(crud.rebuild_key_filter, db)
+    return importer.result()
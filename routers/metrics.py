@@ -0,0 +1,18 @@
+from anyio.to_thread import current_default_thread_limiter
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..metrics import metrics
+
+router = APIRouter()
+
+
+# 1. The handler runs on the event loop, where the threadpool limiter lives.
+# 2. The per-thread metrics are merged and rendered in the Prometheus text format.
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms, in-flight requests, threadpool and pool usage."""
+    return PlainTextResponse(
+        metrics.render(threadpool=current_default_thread_limiter().statistics()),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 
-templates = Jinja2Templates(directory="templates")
+from ..templating import get_templates
+
 
 router = APIRouter()
 
 @router.get("/unsplash", response_class=HTMLResponse)
 async def unsplash_home(request: Request):
 
-    return templates.TemplateResponse("unsplash.html", {"request": request})
\ No newline at end of file
+    return get_templates().TemplateResponse("unsplash.html", {"request": request})
\ No newline at end of file
@@ -1,20 +1,32 @@
 # It creates a class that will be used to create objects that will be used
 # to create a schema for the data that will be input.
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 
 # 1. The URLBase class inherits from BaseModel.
 # 2. The URLBase class contains the field target_url, which requires a string.
 # 3. The URLBase class stores the URL to be shortened.
+# 4. The optional expires_at and max_clicks fields make the shortened URL expire.
+# 5. The optional cache_max_age field sets how long its redirect may be cached.
 class URLBase(BaseModel):
     """The URLBase class contains the field target_url,
     which requires a string. stores the URL to be shortened.
 
     Args:
         BaseModel (class): `target_url` stores the URL to be shortened.
+        `expires_at` is the time the URL stops redirecting, without a timezone it is UTC.
+        `max_clicks` is the number of redirects after which the URL stops redirecting.
+        `cache_max_age` is the seconds browsers and CDNs may cache the redirect,
+        whose clicks are then not counted; 0 counts every click.
     """
 
     target_url: str
+    expires_at: Optional[datetime] = None
+    max_clicks: Optional[int] = Field(None, ge=1)
+    cache_max_age: Optional[int] = Field(None, ge=0)
 
 
 # 1. Declares the URL class as a subclass of URLBase.
@@ -44,3 +56,40 @@ class URL(URLBase):
 class URLInfo(URL):
     url: str
     admin_url: str
+
+
+# 1. The URLBatchItem class is the result for one URL of a batch request.
+# 2. It holds the URL info when the URL was shortened, or the error otherwise.
+class URLBatchItem(BaseModel):
+    """Result of shortening one URL of a batch.
+
+    Args:
+        BaseModel (class): `target_url` is the submitted URL.
+        `url_info` is set when the URL was shortened, `error` when it was rejected.
+    """
+
+    target_url: str
+    url_info: Optional[URLInfo] = None
+    error: Optional[str] = None
+
+
+# 1. The StatsBucket class holds the clicks of one time bucket.
+# 2. The URLStats class is the answer of the stats endpoint.
+class StatsBucket(BaseModel):
+    start: datetime
+    clicks: int
+
+
+class URLStats(BaseModel):
+    """Clicks of a URL over time.
+
+    Args:
+        BaseModel (class): `granularity` is the bucket size, `buckets` the
+        non-empty buckets between `start` and `end`, `total` their sum.
+    """
+
+    granularity: str
+    start: datetime
+    end: datetime
+    total: int
+    buckets: List[StatsBucket]
@@ -0,0 +1,223 @@
+# Key-hash sharding of the urls across several SQLite databases.
+# Every url key hashes to one of BUCKETS buckets, and a shard map assigns each
+# bucket to a shard, a database of its own. The secret key of a URL starts with
+# its key ("<key>_<random>"), so admin lookups go to a single shard as well.
+# The map is a JSON file named by the `shard_map` setting:
+#     {"buckets": 1024, "shards": {"0": "sqlite:///./shortener.db"}, "assignment": ["0", ...]}
+# Moving buckets to a new shard only moves the rows of those buckets:
+#     python -m shortener_app.sharding init --shards 1
+#     python -m shortener_app.sharding split 0 sqlite:///./shortener-1.db
+import argparse
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Number of hash buckets; a shard holds whole buckets.
+BUCKETS = 1024
+
+T = TypeVar("T")
+
+
+def bucket_for(url_key: str, buckets: int = BUCKETS) -> int:
+    """The hash bucket of a url key, stable across processes and releases."""
+    digest = hashlib.blake2b(url_key.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % buckets
+
+
+def key_of_secret(secret_key: str) -> str:
+    """The url key a secret key starts with."""
+    return secret_key.rsplit("_", 1)[0]
+
+
+# 1. The assignment lists the shard name of every bucket.
+# 2. Shards are named "0", "1", ... and map to a database URL.
+class ShardMap:
+    """Assignment of the hash buckets to shard databases.
+
+    Args:
+        shards (Dict[str, str]): database URL of every shard, by name.
+        assignment (List[str]): shard name of every bucket.
+    """
+
+    def __init__(self, shards: Dict[str, str], assignment: List[str]) -> None:
+        unknown = set(assignment) - set(shards)
+        if unknown:
+            raise ValueError(f"Buckets assigned to unknown shards: {sorted(unknown)}")
+        self.shards = shards
+        self.assignment = assignment
+
+    @classmethod
+    def create(cls, db_urls: List[str], buckets: int = BUCKETS) -> "ShardMap":
+        """A map spreading contiguous ranges of buckets evenly over the databases."""
+        shards = {str(number): db_url for number, db_url in enumerate(db_urls)}
+        assignment = [str(bucket * len(db_urls) // buckets) for bucket in range(buckets)]
+        return cls(shards, assignment)
+
+    @classmethod
+    def load(cls, path: str) -> "ShardMap":
+        with open(path, encoding="utf-8") as map_file:
+            data = json.load(map_file)
+        if len(data["assignment"]) != data["buckets"]:
+            raise ValueError(f"{path}: the assignment must list {data['buckets']} buckets")
+        return cls(data["shards"], data["assignment"])
+
+    def save(self, path: str) -> None:
+        """Write the map atomically, so readers never see a partial file."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as map_file:
+            json.dump(
+                {"buckets": len(self.assignment), "shards": self.shards, "assignment": self.assignment},
+                map_file,
+            )
+        os.replace(temporary, path)
+
+    def shard_for_key(self, url_key: str) -> str:
+        return self.assignment[bucket_for(url_key, len(self.assignment))]
+
+    def group(self, items: Iterable[T], key: Callable[[T], str]) -> Dict[str, List[T]]:
+        """Group items by the shard of their url key."""
+        groups: Dict[str, List[T]] = defaultdict(list)
+        for item in items:
+            groups[self.shard_for_key(key(item))].append(item)
+        return groups
+
+    # 1. Take the upper half of the buckets of the shard, they stay contiguous.
+    # 2. Assign them to a new shard on `db_url`.
+    def split(self, name: str, db_url: str) -> str:
+        """Move half of the buckets of a shard to a new shard, return its name."""
+        buckets = [bucket for bucket, shard in enumerate(self.assignment) if shard == name]
+        if len(buckets) < 2:
+            raise ValueError(f"Shard {name!r} has fewer than 2 buckets, it cannot be split")
+        new_name = str(max(int(shard) for shard in self.shards) + 1)
+        self.shards[new_name] = db_url
+        for bucket in buckets[len(buckets) // 2 :]:
+            self.assignment[bucket] = new_name
+        return new_name
+
+
+def load_shard_map() -> Optional[ShardMap]:
+    """The shard map named by the settings, None when sharding is off."""
+    path = get_settings().shard_map
+    return ShardMap.load(path) if path else None
+
+
+# 1. Create the new shard database with the current schema.
+# 2. Copy the rows of the moving buckets (urls and click rollups) in chunks,
+#    selected with a `shard_bucket(key)` SQL function registered on the old
+#    shard; rows already copied by an interrupted run are skipped.
+# 3. Save the new map, then delete the moved rows from the old shard.
+# Run it while the app is stopped: the processes read the map at startup.
+def split_shard(path: str, name: str, db_url: str, chunk_size: int = 5000) -> Dict[str, int]:
+    """Split a shard and move the rows of half of its buckets
+
+    Args:
+        path (str): the shard map file
+        name (str): the shard to split
+        db_url (str): database URL of the new shard
+        chunk_size (int): rows copied per transaction
+
+    Returns:
+        Dict[str, int]: rows moved per table
+    """
+    from sqlalchemy import event, func
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    from sqlalchemy.orm import Session
+
+    from . import models
+    from .database import create_db_engine, get_db_profile
+    from .migrations import migrate
+
+    shard_map = ShardMap.load(path)
+    source = create_db_engine(shard_map.shards[name], get_db_profile())
+    buckets = len(shard_map.assignment)
+
+    @event.listens_for(source, "connect")
+    def register_bucket_function(dbapi_connection, connection_record):
+        dbapi_connection.create_function(
+            "shard_bucket", 1, lambda key: bucket_for(key, buckets), deterministic=True
+        )
+
+    new_name = shard_map.split(name, db_url)
+    moving = [bucket for bucket, shard in enumerate(shard_map.assignment) if shard == new_name]
+    target = create_db_engine(db_url, get_db_profile())
+    migrate(target)
+
+    moved = {}
+    tables = (models.URL.__table__, models.ClickRollup.__table__)
+    with Session(bind=source) as source_db, Session(bind=target) as target_db:
+        for table in tables:
+            columns = [column for column in table.columns if column.name != "id"]
+            query = (
+                source_db.query(*columns)
+                .filter(func.shard_bucket(table.c.key).in_(moving))
+                .yield_per(chunk_size)
+            )
+            chunk = []
+            moved[table.name] = 0
+            for row in query:
+                chunk.append(dict(row._mapping))
+                if len(chunk) >= chunk_size:
+                    target_db.execute(sqlite_insert(table).on_conflict_do_nothing(), chunk)
+                    target_db.commit()
+                    moved[table.name] += len(chunk)
+                    chunk = []
+            if chunk:
+                target_db.execute(sqlite_insert(table).on_conflict_do_nothing(), chunk)
+                target_db.commit()
+                moved[table.name] += len(chunk)
+        shard_map.save(path)
+
+        for table in tables:
+            source_db.execute(table.delete().where(func.shard_bucket(table.c.key).in_(moving)))
+        source_db.commit()
+    logger.info("Moved %s from shard %s to shard %s", moved, name, new_name)
+    return moved
+
+
+def has_urls(db_url: str) -> bool:
+    from sqlalchemy import create_engine, inspect, text
+
+    engine = create_engine(db_url)
+    if not inspect(engine).has_table("urls"):
+        return False
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT 1 FROM urls LIMIT 1")).first() is not None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the shard map")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init", help="create a shard map")
+    init.add_argument("--shards", type=int, default=1)
+    split = commands.add_parser("split", help="move half of a shard to a new database")
+    split.add_argument("shard")
+    split.add_argument("db_url")
+    parser.add_argument("--map", default=get_settings().shard_map or "shards.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "init":
+        # The first shard is the configured database, so its rows stay in place
+        # when it is the only one; split it later to spread them. An existing
+        # database with URLs can only start as a single shard.
+        if args.shards > 1 and has_urls(get_settings().db_url):
+            parser.error("the database already holds URLs: init one shard, then split it")
+        base, extension = os.path.splitext(get_settings().db_url)
+        db_urls = [get_settings().db_url] + [
+            f"{base}-{number}{extension}" for number in range(1, args.shards)
+        ]
+        ShardMap.create(db_urls).save(args.map)
+        print(f"Wrote {args.map} with {args.shards} shards")
+    else:
+        print(split_shard(args.map, args.shard, args.db_url))
+
+
+if __name__ == "__main__":
+    main()
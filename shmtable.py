@@ -0,0 +1,297 @@
+# Shared-memory table of the active redirects, for multi-process deployments.
+# Every worker of a uvicorn/gunicorn deployment keeps its own redirect cache:
+# N workers hold N copies, and a URL deleted by one worker stays cached in the
+# others until their entry expires. The shared table is one open-addressing
+# hash table in a memory-mapped file that every worker maps: lookups read it
+# without a lock, writes (creates, deletes, fills on a miss) take a file lock.
+#
+# File layout: a header (magic, version, slots, slot size, generation), then
+# fixed-size slots of a sequence number, a state, the key, the target URL, its
+# expiry and cache max-age.
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, Optional
+
+from .cache import RedirectTarget
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SHMT"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQ")
+HEADER_BYTES = 64
+GENERATION_OFFSET = 16
+# seq, state, key length, url length, expires_at (0: none), max_age (-1: none)
+SLOT = struct.Struct("<IBBHqi")
+SEQ = struct.Struct("<I")
+KEY_BYTES = 32
+EMPTY, USED, DELETED = 0, 1, 2
+# Attempts of a lookup to read a slot that is not being written.
+READ_RETRIES = 8
+
+
+# 1. A slot is found by linear probing from the crc32 of the key, over at most
+#    `max_probes` slots; deleted slots keep the probe chains intact.
+# 2. Every slot has a sequence number (a seqlock): a writer makes it odd while
+#    it writes the slot and even again after. A reader reads the number, the
+#    slot and the number again, and retries when they differ or are odd, so a
+#    lookup never returns a half-written entry and never takes a lock.
+# 3. Writers are serialized by a thread lock and a flock on the file, which
+#    every worker opens itself: a worker forked after the table was opened
+#    opens it again, as a flock is shared by the processes of one open file.
+# 4. The generation in the header grows on every removal. A worker filling the
+#    table after a database read passes the generation it saw before the read:
+#    when a URL was removed meanwhile, the fill is rejected, so a stale row read
+#    before a delete never comes back into the table.
+# 5. URLs with a click limit, and keys or target URLs longer than their slot,
+#    are not stored: their lookups go to the database.
+class SharedTable:
+    """Open-addressing hash table of url key -> RedirectTarget in a shared mmap.
+
+    Args:
+        path (str): the file mapped by every worker, empty disables the table.
+        slots (int): number of slots, fixed when the file is created.
+        slot_bytes (int): bytes per slot, which bounds the target URL length.
+        max_probes (int): slots probed at most per lookup and insert.
+    """
+
+    def __init__(
+        self, path: str = "", slots: int = 65536, slot_bytes: int = 512, max_probes: int = 32
+    ) -> None:
+        self.path = path
+        self.enabled = bool(path)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.url_bytes = slot_bytes - SLOT.size - KEY_BYTES
+        self.max_probes = min(max_probes, slots)
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self.rejected = 0
+        self._map: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        """Map the file, creating and formatting it under the file lock if needed."""
+        with self._lock:
+            if self._map is not None:
+                if self._pid == os.getpid():
+                    return
+                self._map.close()
+                os.close(self._fd)
+            size = HEADER_BYTES + self.slots * self.slot_bytes
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.slots, self.slot_bytes, 0), 0)
+                magic, version, slots, slot_bytes, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if (magic, version) != (MAGIC, VERSION):
+                    raise ValueError(f"{self.path} is not a shared table")
+                if (slots, slot_bytes) != (self.slots, self.slot_bytes):
+                    logger.warning(
+                        "%s has %d slots of %d bytes, not %d of %d: using the file",
+                        self.path,
+                        slots,
+                        slot_bytes,
+                        self.slots,
+                        self.slot_bytes,
+                    )
+                    self.slots, self.slot_bytes = slots, slot_bytes
+                    self.url_bytes = slot_bytes - SLOT.size - KEY_BYTES
+                    self.max_probes = min(self.max_probes, slots)
+                self._map = mmap.mmap(fd, HEADER_BYTES + self.slots * self.slot_bytes)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._pid = os.getpid()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = self._fd = None
+
+    def generation(self) -> int:
+        """The removal counter; pass it to put() to fill the table after a read."""
+        if self._map is None:
+            self.open()
+        return struct.unpack_from("<Q", self._map, GENERATION_OFFSET)[0]
+
+    def get(self, url_key: str) -> Optional[RedirectTarget]:
+        """The redirect of `url_key`, or None when it is not in the table."""
+        if self._map is None:
+            self.open()
+        key = url_key.encode()
+        table = self._map
+        for offset in self._probe(key):
+            for _ in range(READ_RETRIES):
+                seq, state, key_len, url_len, expires_at, max_age = SLOT.unpack_from(table, offset)
+                if seq & 1:
+                    self.retries += 1
+                    continue
+                if state == USED and key_len == len(key):
+                    start = offset + SLOT.size
+                    slot_key = table[start : start + key_len]
+                    url = table[start + KEY_BYTES : start + KEY_BYTES + url_len]
+                else:
+                    slot_key = url = None
+                if SEQ.unpack_from(table, offset)[0] != seq:
+                    self.retries += 1
+                    continue
+                break
+            else:
+                self.misses += 1
+                return None
+            if state == EMPTY:
+                break
+            if slot_key == key:
+                self.hits += 1
+                return RedirectTarget(
+                    url.decode(),
+                    expires_at or None,
+                    None if max_age < 0 else max_age,
+                )
+        self.misses += 1
+        return None
+
+    def put(self, url_key: str, target: RedirectTarget, generation: Optional[int] = None) -> bool:
+        """Store the redirect of `url_key`, unless a URL was removed since `generation`.
+
+        Returns:
+            bool: whether the entry was stored
+        """
+        key, url = url_key.encode(), target.url.encode()
+        if target.max_clicks is not None or len(key) > KEY_BYTES or len(url) > self.url_bytes:
+            return False
+        with self._write_lock():
+            if generation is not None and generation != self.generation():
+                self.rejected += 1
+                return False
+            free = None
+            for offset in self._probe(key):
+                _, state, key_len, _, _, _ = SLOT.unpack_from(self._map, offset)
+                if state == USED and self._slot_key(offset, key_len) == key:
+                    free = offset
+                    break
+                if state != USED and free is None:
+                    free = offset
+                if state == EMPTY:
+                    break
+            if free is None:
+                self.rejected += 1
+                return False
+            self._write_slot(free, USED, key, url, target.expires_at or 0, target.max_age)
+            return True
+
+    def remove(self, url_key: str) -> None:
+        """Remove `url_key`, and reject the fills of reads made before."""
+        key = url_key.encode()
+        with self._write_lock():
+            struct.pack_into("<Q", self._map, GENERATION_OFFSET, self.generation() + 1)
+            for offset in self._probe(key):
+                _, state, key_len, _, _, _ = SLOT.unpack_from(self._map, offset)
+                if state == EMPTY:
+                    return
+                if state == USED and self._slot_key(offset, key_len) == key:
+                    self._write_slot(offset, DELETED, b"", b"", 0, None)
+                    return
+
+    def clear(self) -> None:
+        """Empty every slot, e.g. after an import or a restore of the database."""
+        with self._write_lock():
+            struct.pack_into("<Q", self._map, GENERATION_OFFSET, self.generation() + 1)
+            for slot in range(self.slots):
+                self._write_slot(HEADER_BYTES + slot * self.slot_bytes, EMPTY, b"", b"", 0, None)
+
+    def stats(self) -> Dict[str, object]:
+        """Size of the table, slots in use, and the counters of this worker."""
+        stats: Dict[str, object] = {"enabled": self.enabled}
+        if not self.enabled:
+            return stats
+        if self._map is None:
+            self.open()
+        states = [
+            self._map[HEADER_BYTES + slot * self.slot_bytes + 4]
+            for slot in range(self.slots)
+        ]
+        return {
+            **stats,
+            "path": self.path,
+            "bytes": HEADER_BYTES + self.slots * self.slot_bytes,
+            "slots": self.slots,
+            "used": states.count(USED),
+            "deleted": states.count(DELETED),
+            "generation": self.generation(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+    def _probe(self, key: bytes) -> Iterator[int]:
+        first = zlib.crc32(key) % self.slots
+        for number in range(self.max_probes):
+            yield HEADER_BYTES + (first + number) % self.slots * self.slot_bytes
+
+    def _slot_key(self, offset: int, key_len: int) -> bytes:
+        start = offset + SLOT.size
+        return self._map[start : start + key_len]
+
+    def _write_slot(
+        self, offset: int, state: int, key: bytes, url: bytes, expires_at: int, max_age: Optional[int]
+    ) -> None:
+        seq = SEQ.unpack_from(self._map, offset)[0]
+        SEQ.pack_into(self._map, offset, seq + 1)
+        start = offset + SLOT.size
+        self._map[start : start + len(key)] = key
+        self._map[start + KEY_BYTES : start + KEY_BYTES + len(url)] = url
+        SLOT.pack_into(
+            self._map,
+            offset,
+            seq + 1,
+            state,
+            len(key),
+            len(url),
+            expires_at,
+            -1 if max_age is None else max_age,
+        )
+        SEQ.pack_into(self._map, offset, seq + 2)
+
+    def _write_lock(self) -> "_FileLock":
+        if self._map is None or self._pid != os.getpid():
+            self.open()
+        return _FileLock(self._lock, self._fd)
+
+
+class _FileLock:
+    """The thread lock of the table, then the flock of its file."""
+
+    def __init__(self, lock: threading.Lock, fd: int) -> None:
+        self._lock = lock
+        self._fd = fd
+
+    def __enter__(self) -> None:
+        self._lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc) -> None:
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+
+shared_table = SharedTable(
+    path=get_settings().shared_table_path,
+    slots=get_settings().shared_table_slots,
+    slot_bytes=get_settings().shared_table_slot_bytes,
+)
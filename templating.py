@@ -0,0 +1,31 @@
+# The Jinja environment shared by the app and the routers.
+# 1. It is created on first use, so importing the app does not import Jinja.
+# 2. Compiled templates are kept in a bytecode cache on disk: a new worker
+#    loads them instead of parsing and compiling the templates again.
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from fastapi.templating import Jinja2Templates
+
+
+@lru_cache
+def get_templates() -> "Jinja2Templates":
+    """The templates of the app, with a bytecode cache
+
+    Returns:
+        Jinja2Templates: renders the files of the templates directory
+    """
+    from fastapi.templating import Jinja2Templates
+    from jinja2 import FileSystemBytecodeCache
+
+    templates = Jinja2Templates(directory="templates")
+    cache_dir = get_settings().template_cache_dir
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    # Without a directory, Jinja uses a private folder in the temp directory.
+    templates.env.bytecode_cache = FileSystemBytecodeCache(cache_dir or None)
+    return templates
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from shortener_app.config import get_settings
+from shortener_app.sharding import ShardMap
+
+# The admin routes need a token, the metrics and the redirect fast path are
+# opt-in: they are set before the app reads its settings. Run the suite with
+# REDIRECT_FAST_PATH=false to test the ORM redirect handler.
+os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
+os.environ.setdefault("METRICS_ENABLED", "true")
+os.environ.setdefault("REDIRECT_FAST_PATH", "true")
+
+
+# 1. The tests write URLs, compact and delete them: every database they use
+#    (the default one, the shards of SHARD_MAP, the SHARED_TABLE_PATH table)
+#    is moved to a temporary directory, before shortener_app.main is imported.
+# 2. A shard map keeps its buckets, with its shards in the temporary directory.
+def use_temporary_databases(directory: str) -> None:
+    settings = get_settings()
+    db_url = f"sqlite:///{os.path.join(directory, 'shortener.db')}"
+    os.environ["DB_URL"] = db_url
+    if settings.shard_map:
+        shard_map = ShardMap.load(settings.shard_map)
+        shards = {
+            name: db_url
+            if shard_url == settings.db_url
+            else f"sqlite:///{os.path.join(directory, f'shortener-{name}.db')}"
+            for name, shard_url in shard_map.shards.items()
+        }
+        path = os.path.join(directory, "shards.json")
+        ShardMap(shards, shard_map.assignment).save(path)
+        os.environ["SHARD_MAP"] = path
+    if settings.shared_table_path:
+        os.environ["SHARED_TABLE_PATH"] = os.path.join(directory, "table.shm")
+    get_settings.cache_clear()
+
+
+TEST_DIRECTORY = tempfile.mkdtemp(prefix="shortener-tests-")
+use_temporary_databases(TEST_DIRECTORY)
+
+from shortener_app.main import flush_click_counter, migrate_databases  # noqa: E402
+
+
+# The schema is migrated by a startup hook, which a TestClient used outside a
+# `with` block never runs. At the end, the shutdown hook stops the background
+# writers before the temporary databases are removed.
+@pytest.fixture(scope="session", autouse=True)
+def migrated_databases():
+    migrate_databases()
+    yield
+    flush_click_counter()
+    shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,95 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from shortener_app.admission import (
+    ADMIN,
+    CREATE,
+    REDIRECT,
+    AdmissionController,
+    AdmissionMiddleware,
+    TokenBuckets,
+)
+from shortener_app.main import app
+
+
+def test_queued_redirects_are_admitted_first_and_lower_classes_are_shed():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, queue_size=2, queue_timeout=1)
+        assert await controller.acquire(CREATE)
+        admin = asyncio.ensure_future(controller.acquire(ADMIN))
+        create = asyncio.ensure_future(controller.acquire(CREATE))
+        await asyncio.sleep(0)
+        # The queue is full: the redirect takes the place of the admin call.
+        redirect = asyncio.ensure_future(controller.acquire(REDIRECT))
+        await asyncio.sleep(0.01)
+        assert admin.done() and not admin.result()
+        assert not await controller.acquire(ADMIN)
+
+        controller.release(CREATE)
+        assert await redirect and not create.done()
+        controller.release(REDIRECT)
+        assert await create
+        controller.release(CREATE)
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == {REDIRECT: 0, CREATE: 0, ADMIN: 0}
+    assert stats["counters"][ADMIN]["shed_queue_full"] == 2
+    assert stats["counters"][REDIRECT]["queued"] == 1
+
+
+def test_queued_requests_are_shed_after_the_timeout():
+    async def scenario():
+        controller = AdmissionController(limits={REDIRECT: 1}, queue_timeout=0.01)
+        assert await controller.acquire(REDIRECT)
+        assert not await controller.acquire(REDIRECT)
+        controller.release(REDIRECT)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.counters[REDIRECT]["shed_timeout"] == 1
+    assert controller.queued == 0 and controller.running == 0
+
+
+def test_place_granted_as_the_deadline_expires_is_kept(monkeypatch):
+    controller = AdmissionController(limits={REDIRECT: 1}, queue_timeout=1)
+
+    async def late_wait_for(waiter, timeout):
+        controller.release(REDIRECT)
+        assert waiter.result()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        assert await controller.acquire(REDIRECT)
+        monkeypatch.setattr(asyncio, "wait_for", late_wait_for)
+        admitted = await controller.acquire(REDIRECT)
+        monkeypatch.undo()
+        controller.release(REDIRECT)
+        return admitted
+
+    assert asyncio.run(scenario())
+    assert controller.running == controller.running_by_class[REDIRECT] == 0
+    assert controller.counters[REDIRECT]["shed_timeout"] == 0
+
+
+def test_middleware_rate_limits_clients_and_skips_other_routes():
+    controller = AdmissionController(buckets=TokenBuckets(rate=0.5, burst=1, size=16))
+    middleware = AdmissionMiddleware(app, controller=controller, routes=app.routes)
+    assert middleware.classify("GET", "/abcde") == REDIRECT
+    assert middleware.classify("GET", "/unsplash") is None
+    assert middleware.classify("POST", "/url") == CREATE
+    assert middleware.classify("GET", "/admin/ready") is None
+    app.get("/added-later")(lambda: {})
+    try:
+        assert middleware.classify("GET", "/added-later") is None
+    finally:
+        app.router.routes.pop()
+
+    client = TestClient(middleware)
+    assert client.get("/missing", follow_redirects=False).status_code == 404
+    response = client.get("/missing", follow_redirects=False)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert client.get("/admin/ready").status_code != 429
+    assert controller.counters[REDIRECT]["rate_limited"] == 1
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from shortener_app import crud
+from shortener_app.config import get_settings
+from shortener_app.main import app
+
+client = TestClient(app)
+
+# The handlers are registered once, at import, from ASYNC_MODE: the async
+# routes are tested in a process of their own unless the suite runs in async mode.
+requires_async_mode = pytest.mark.skipif(
+    not get_settings().async_mode, reason="the async routes need ASYNC_MODE=true"
+)
+
+
+def route_endpoint(method: str, path: str):
+    return next(
+        route.endpoint
+        for route in app.routes
+        if getattr(route, "path", None) == path and method in route.methods
+    )
+
+
+@requires_async_mode
+def test_async_routes_create_redirect_and_delete():
+    for method, path in (
+        ("GET", "/{url_key}"),
+        ("GET", "/admin/{secret_key}"),
+        ("DELETE", "/admin/{secret_key}"),
+    ):
+        assert asyncio.iscoroutinefunction(route_endpoint(method, path))
+
+    response = client.post("/url", json={"target_url": "https://example.com/async"})
+    assert response.status_code == 200
+    info = response.json()
+    key = info["url"].rsplit("/", 1)[-1]
+    admin_path = f"/admin/{info['admin_url'].rsplit('/', 1)[-1]}"
+
+    response = client.get(f"/{key}", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/async"
+    assert crud.cached_target(key).url == "https://example.com/async"
+    response = client.get(admin_path)
+    assert response.status_code == 200
+    assert response.json()["target_url"] == "https://example.com/async"
+
+    # The delete evicts the cached redirect: the key stops redirecting at once.
+    assert client.delete(admin_path).status_code == 200
+    assert crud.cached_target(key) is None
+    assert client.get(f"/{key}", follow_redirects=False).status_code == 404
+    assert client.get(admin_path).status_code == 404
+    assert client.delete(admin_path).status_code == 404
+
+
+@pytest.mark.skipif(
+    get_settings().async_mode or bool(get_settings().shard_map),
+    reason="already in async mode, or sharded (no async mode)",
+)
+def test_async_mode_in_a_separate_process():
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", __file__],
+        env={**os.environ, "ASYNC_MODE": "true"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout[-2000:]
+    assert "1 passed" in result.stdout
@@ -0,0 +1,23 @@
+from shortener_app.clicks import ClickCounter
+
+
+def test_clicks_are_coalesced_per_key():
+    batches = []
+    counter = ClickCounter(flush_interval=60, flush_threshold=100, writer=batches.append)
+    for _ in range(3):
+        counter.add("ABCDE")
+    counter.add("FGHIJ")
+    assert counter.pending("ABCDE") == 3
+    counter.stop()
+    assert batches == [{"ABCDE": 3, "FGHIJ": 1}]
+    assert counter.pending("ABCDE") == 0
+
+
+def test_failed_flush_keeps_clicks_pending():
+    def failing_writer(clicks):
+        raise RuntimeError("database is locked")
+
+    counter = ClickCounter(flush_interval=60, flush_threshold=100, writer=failing_writer)
+    counter.add("ABCDE", 2)
+    counter.flush()
+    assert counter.pending("ABCDE") == 2
@@ -0,0 +1,100 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from shortener_app import crud, models
+from shortener_app.cache import RedirectTarget
+from shortener_app.compaction import Compactor
+from shortener_app.database import SessionLocal
+from shortener_app.main import app
+
+client = TestClient(app)
+
+
+def key_of(info: dict) -> str:
+    return info["url"].rsplit("/", 1)[-1]
+
+
+def test_links_expire_by_time_and_clicks():
+    response = client.post(
+        "/url", json={"target_url": "https://example.com/", "expires_at": "2000-01-01T00:00:00"}
+    )
+    assert response.status_code == 400
+
+    info = client.post(
+        "/url", json={"target_url": "https://example.com/limited", "max_clicks": 2}
+    ).json()
+    assert info["max_clicks"] == 2
+    for _ in range(2):
+        assert client.get(f"/{key_of(info)}", follow_redirects=False).status_code == 307
+    assert client.get(f"/{key_of(info)}", follow_redirects=False).status_code == 404
+
+    info = client.post(
+        "/url", json={"target_url": "https://example.com/timed", "expires_at": "2999-01-01T00:00:00Z"}
+    ).json()
+    assert info["expires_at"].startswith("2999-01-01T00:00:00")
+    assert client.get(f"/{key_of(info)}", follow_redirects=False).status_code == 307
+    # An expired cached entry is evicted and the key looked up again, as when
+    # compaction archived the old URL and a new one reuses its key.
+    crud.cache_target(key_of(info), RedirectTarget("https://example.com/old", int(time.time()) - 1))
+    response = client.get(f"/{key_of(info)}", follow_redirects=False)
+    assert response.headers["location"] == "https://example.com/timed"
+
+    db = SessionLocal()
+    try:
+        for shard_db in crud.all_shard_sessions(db):
+            shard_db.query(models.URL).filter(models.URL.key == key_of(info)).update(
+                {"expires_at": int(time.time()) - 1}
+            )
+            shard_db.commit()
+    finally:
+        db.close()
+    crud.evict_target(key_of(info))
+    assert client.get(f"/{key_of(info)}", follow_redirects=False).status_code == 404
+
+
+def test_compactor_archives_inactive_and_expired_urls():
+    deleted = client.post("/url", json={"target_url": "https://example.com/deleted"}).json()
+    client.delete(f"/admin/{deleted['admin_url'].rsplit('/', 1)[-1]}")
+    expired = client.post(
+        "/url", json={"target_url": "https://example.com/expired", "expires_at": "2999-01-01T00:00:00"}
+    ).json()
+    kept = client.post("/url", json={"target_url": "https://example.com/kept"}).json()
+    db = SessionLocal()
+    try:
+        for shard_db in crud.all_shard_sessions(db):
+            shard_db.query(models.URL).filter(models.URL.key == key_of(expired)).update(
+                {"expires_at": int(time.time()) - 1}
+            )
+            shard_db.commit()
+
+        result = Compactor(batch_size=1, pause=0).compact()
+        assert result["archived"] >= 2 and result["batches"] >= 2
+        remaining, archived = set(), set()
+        for shard_db in crud.all_shard_sessions(db):
+            remaining |= {key for (key,) in shard_db.query(models.URL.key)}
+            archived |= {key for (key,) in shard_db.query(models.ArchivedURL.key)}
+        assert key_of(kept) in remaining
+        assert not {key_of(deleted), key_of(expired)} & remaining
+        assert {key_of(deleted), key_of(expired)} <= archived
+    finally:
+        db.close()
+    assert client.get(f"/{key_of(expired)}", follow_redirects=False).status_code == 404
+
+
+def test_archive_reads_past_skipped_rows():
+    infos = [
+        client.post("/url", json={"target_url": f"https://example.com/skip/{n}"}).json()
+        for n in range(3)
+    ]
+    for info in infos:
+        client.delete(f"/admin/{info['admin_url'].rsplit('/', 1)[-1]}")
+    wanted = key_of(infos[-1])
+    db = SessionLocal()
+    try:
+        archived = []
+        for shard_db in crud.all_shard_sessions(db):
+            archived += crud.archive_db_urls(shard_db, limit=1, skip=lambda key: key != wanted)
+    finally:
+        db.close()
+    assert archived == [(wanted, False)]
@@ -0,0 +1,128 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from shortener_app import crud, database
+from shortener_app.config import get_settings
+from shortener_app.database import DB_PROFILES, create_db_engine, get_db_profile
+from shortener_app.main import app
+from shortener_app.migrations import migrate
+
+client = TestClient(app)
+
+# The read-only pool is created once, at import, from DB_READ_ONLY_POOL: the
+# redirect test runs in a process of its own unless the suite enables it. The
+# sync redirect handlers use it; async mode and shards have their own engines.
+requires_read_only_pool = pytest.mark.skipif(
+    not get_settings().db_read_only_pool or get_settings().async_mode,
+    reason="the read-only pool needs DB_READ_ONLY_POOL=true and the sync handlers",
+)
+
+
+def read_pragmas(engine) -> tuple:
+    with engine.connect() as connection:
+        return tuple(
+            connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+            for pragma in ("journal_mode", "synchronous", "busy_timeout")
+        )
+
+
+# synchronous: 1 is NORMAL, 2 is FULL. The sqlite3 module waits 5 s on a
+# locked database by default.
+@pytest.mark.parametrize(
+    "profile, expected",
+    [("default", ("delete", 2, 5000)), ("wal", ("wal", 1, 5000)), ("durable", ("wal", 2, 5000))],
+)
+def test_profiles_apply_their_pragmas(tmp_path, profile, expected):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'profile.db'}", DB_PROFILES[profile])
+    assert read_pragmas(engine) == expected
+    if "pool_size" in DB_PROFILES[profile]:
+        assert engine.pool.size() == DB_PROFILES[profile]["pool_size"]
+    engine.dispose()
+
+
+def test_settings_override_the_profile(monkeypatch):
+    monkeypatch.setattr(get_settings(), "db_profile", "wal")
+    monkeypatch.setattr(get_settings(), "db_synchronous", "FULL")
+    monkeypatch.setattr(get_settings(), "db_busy_timeout", 100)
+    profile = get_db_profile()
+    assert (profile["journal_mode"], profile["synchronous"], profile["busy_timeout"]) == (
+        "WAL",
+        "FULL",
+        100,
+    )
+    monkeypatch.setattr(get_settings(), "db_profile", "missing")
+    with pytest.raises(ValueError):
+        get_db_profile()
+
+
+def test_read_only_engine_reads_and_rejects_writes(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'read-only.db'}"
+    engine = create_db_engine(db_url, DB_PROFILES["wal"])
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO urls (key, secret_key, target_url, is_active, clicks)"
+            " VALUES ('ABCDE', 'ABCDE_SECRET', 'https://example.com/', 1, 0)"
+        )
+    read_engine = create_db_engine(db_url, DB_PROFILES["wal"], read_only=True)
+    with read_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT target_url FROM urls").scalar() == (
+            "https://example.com/"
+        )
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("UPDATE urls SET clicks = 1")
+    read_engine.dispose()
+    engine.dispose()
+
+
+@requires_read_only_pool
+def test_redirects_read_through_the_read_only_pool():
+    assert database.read_engine is not database.engine
+    info = client.post("/url", json={"target_url": "https://example.com/read-only"}).json()
+    key = info["url"].rsplit("/", 1)[-1]
+    crud.evict_target(key)
+    checkouts = []
+
+    def on_checkout(*args):
+        checkouts.append(args)
+
+    event.listen(database.read_engine, "checkout", on_checkout)
+    try:
+        response = client.get(f"/{key}", follow_redirects=False)
+    finally:
+        event.remove(database.read_engine, "checkout", on_checkout)
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/read-only"
+    assert checkouts
+
+
+@pytest.mark.skipif(
+    get_settings().db_read_only_pool
+    or get_settings().async_mode
+    or bool(get_settings().shard_map),
+    reason="the read-only pool is already enabled, or not used by async mode and shards",
+)
+def test_read_only_pool_in_a_separate_process():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pytest",
+            "-q",
+            "-p",
+            "no:cacheprovider",
+            f"{__file__}::test_redirects_read_through_the_read_only_pool",
+        ],
+        env={**os.environ, "DB_READ_ONLY_POOL": "true"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout[-2000:]
+    assert "1 passed" in result.stdout
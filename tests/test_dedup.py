@@ -0,0 +1,140 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from shortener_app import crud, models, schemas
+from shortener_app.config import get_settings
+from shortener_app.database import SessionLocal
+from shortener_app.dedup import merge_duplicates, normalize_url, url_digest
+from shortener_app.main import app
+from shortener_app.migrations import migrate
+from shortener_app.writequeue import WriteQueue
+
+client = TestClient(app)
+
+# Sharding does not support dedup_enabled.
+requires_dedup = pytest.mark.skipif(
+    bool(get_settings().shard_map), reason="dedup_enabled needs a single database"
+)
+
+
+@pytest.fixture
+def dedup_enabled(monkeypatch):
+    monkeypatch.setattr(get_settings(), "dedup_enabled", True)
+
+
+def count_rows(target_url: str) -> int:
+    db = SessionLocal()
+    try:
+        return (
+            db.query(models.URL).filter(models.URL.target_hash == url_digest(target_url)).count()
+        )
+    finally:
+        db.close()
+
+
+def test_normalize_url_ignores_case_and_default_ports():
+    assert normalize_url("HTTPS://Example.COM:443") == "https://example.com/"
+    assert normalize_url("http://example.com:8080/Path?q=1") == "http://example.com:8080/Path?q=1"
+
+
+def test_url_digest_is_a_signed_64_bit_integer():
+    digest = url_digest("https://example.com/")
+    assert digest == url_digest("https://EXAMPLE.com")
+    assert -(2**63) <= digest < 2**63
+
+
+@requires_dedup
+def test_equivalent_url_returns_the_existing_url(dedup_enabled):
+    first = client.post("/url", json={"target_url": "https://dedup.example.com/single"})
+    second = client.post("/url", json={"target_url": "HTTPS://Dedup.Example.com:443/single"})
+    assert first.status_code == second.status_code == 200
+    assert second.json()["url"] == first.json()["url"]
+    assert count_rows("https://dedup.example.com/single") == 1
+    # A URL with its own expiry is always created.
+    third = client.post(
+        "/url", json={"target_url": "https://dedup.example.com/single", "max_clicks": 3}
+    )
+    assert third.json()["url"] != first.json()["url"]
+    assert count_rows("https://dedup.example.com/single") == 2
+
+
+@requires_dedup
+def test_batch_and_write_queue_reuse_equivalent_urls(dedup_enabled):
+    existing = client.post("/url", json={"target_url": "https://dedup.example.com/old"}).json()
+    response = client.post(
+        "/urls/batch",
+        json=[
+            {"target_url": "https://dedup.example.com/new"},
+            {"target_url": "https://DEDUP.example.com/new"},
+            {"target_url": "https://dedup.example.com:443/old"},
+        ],
+    )
+    urls = [item["url_info"]["url"] for item in response.json()]
+    assert urls[0] == urls[1] and urls[2] == existing["url"]
+    assert count_rows("https://dedup.example.com/new") == 1
+    assert count_rows("https://dedup.example.com/old") == 1
+
+    queue = WriteQueue(enabled=True, max_batch=8, max_wait=0.05)
+    futures = [
+        queue.submit(schemas.URLBase(target_url=target_url))
+        for target_url in (
+            "https://dedup.example.com/queued",
+            "https://Dedup.example.com/queued",
+            "https://dedup.example.com/old",
+        )
+    ]
+    keys = [future.result(5).key for future in futures]
+    queue.stop()
+    assert keys[0] == keys[1] and existing["url"].endswith(f"/{keys[2]}")
+    assert count_rows("https://dedup.example.com/queued") == 1
+
+
+# merge_duplicates works on the whole database: it runs on a database of its own.
+def test_merge_duplicates_sums_clicks_and_deactivates_the_others(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dedup.db'}")
+    migrate(engine)
+    db = Session(bind=engine)
+    for key, target_url, clicks in (
+        ("a", "https://example.com/x", 3),
+        ("b", "HTTPS://EXAMPLE.com:443/x", 4),
+        ("c", "https://example.com/x", 5),
+        ("d", "https://example.com/y", 6),
+    ):
+        db.add(
+            models.URL(
+                key=key,
+                secret_key=f"{key}_secret",
+                target_url=target_url,
+                target_hash=url_digest(target_url),
+                clicks=clicks,
+            )
+        )
+    db.add(
+        models.URL(
+            key="e",
+            secret_key="e_secret",
+            target_url="https://example.com/x",
+            target_hash=url_digest("https://example.com/x"),
+            clicks=1,
+            max_clicks=10,
+        )
+    )
+    db.commit()
+
+    assert merge_duplicates(db) == {"groups": 1, "deactivated": 2}
+    rows = {
+        db_url.key: (db_url.is_active, db_url.clicks)
+        for db_url in db.query(models.URL).order_by(models.URL.key)
+    }
+    assert rows == {
+        "a": (True, 12),
+        "b": (False, 0),
+        "c": (False, 0),
+        "d": (True, 6),
+        "e": (True, 1),
+    }
+    assert crud.get_db_url_by_target(db, "https://example.com:443/x").key == "a"
+    assert merge_duplicates(db) == {"groups": 0, "deactivated": 0}
+    db.close()
@@ -0,0 +1,18 @@
+from shortener_app.eventlog import EventLog, aggregate, closed_segments, read_segment, read_segment_mmap
+
+
+def test_events_are_written_to_rotated_segments(tmp_path):
+    log = EventLog(directory=str(tmp_path), enabled=True, segment_bytes=200)
+    log.start()
+    for number in range(10):
+        log.record_click(f"KEY{number % 2}", {"referer": "https://ref.example/"})
+    log.stop()
+    segments = closed_segments(str(tmp_path))
+    assert len(segments) > 1
+    assert not list(tmp_path.glob("*.open"))
+    events = [event for path in segments for event in read_segment(path)]
+    assert events == [event for path in segments for event in read_segment_mmap(path)]
+    summary = aggregate(events)
+    assert summary["events"] == 10
+    assert summary["keys"] == {"KEY0": 5, "KEY1": 5}
+    assert summary["referrers"] == {"https://ref.example/": 10}
@@ -0,0 +1,27 @@
+from shortener_app.keyfilter import CountingBloomFilter, KeyFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = CountingBloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"K{number:04d}" for number in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"X{number:04d}" in bloom for number in range(10000))
+    assert false_positives < 300
+    assert bloom.false_positive_rate() < 0.02
+
+
+def test_removed_keys_are_missing():
+    key_filter = KeyFilter(enabled=True, capacity=100)
+    key_filter.rebuild(["ABCDE", "FGHIJ"])
+    key_filter.add("KLMNO")
+    assert not key_filter.definitely_missing("KLMNO")
+    key_filter.remove("ABCDE")
+    assert key_filter.definitely_missing("ABCDE")
+    assert not key_filter.definitely_missing("FGHIJ")
+
+
+def test_filter_is_inactive_until_built():
+    key_filter = KeyFilter(enabled=True, capacity=100)
+    assert not key_filter.definitely_missing("ABCDE")
@@ -0,0 +1,15 @@
+from shortener_app.keygen import CounterKeyAllocator
+
+
+def test_counter_keys_are_a_permutation_of_the_key_space():
+    allocator = CounterKeyAllocator(length=2, occupancy_threshold=1.0, secret="test")
+    keys = [allocator.key_for(value) for value in range(36**2)]
+    assert len(set(keys)) == 36**2
+    assert all(len(key) == 2 for key in keys)
+
+
+def test_counter_keys_grow_past_the_occupancy_threshold():
+    allocator = CounterKeyAllocator(length=2, occupancy_threshold=0.5)
+    capacity = int(0.5 * 36**2)
+    assert len(allocator.key_for(capacity - 1)) == 2
+    assert len(allocator.key_for(capacity)) == 3
@@ -1,6 +1,10 @@
 from fastapi.testclient import TestClient
 
-from shortener_app.main import app
+from shortener_app import crud
+from shortener_app.cache import redirect_cache
+from shortener_app.database import SessionLocal
+from shortener_app.main import app, warm_pages
+from shortener_app.warmup import Warmup
 
 client = TestClient(app)
 
@@ -39,4 +43,97 @@ def test_accordion():
     response = client.post("/accordion", data={"tag": "flower"}, headers={
                            "Content-Type": "application/x-www-form-urlencoded"})
     assert response.status_code == 200
-    assert b"Accordion" in response.content
\ No newline at end of file
+    assert b"Accordion" in response.content
+
+def test_redirect_stops_after_delete():
+    response = client.post("/url", json={"target_url": "https://example.com/"})
+    assert response.status_code == 200
+    info = response.json()
+    key = info["url"].rsplit("/", 1)[-1]
+    response = client.get(f"/{key}", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/"
+    response = client.delete(f"/admin/{info['admin_url'].rsplit('/', 1)[-1]}")
+    assert response.status_code == 200
+    response = client.get(f"/{key}", follow_redirects=False)
+    assert response.status_code == 404
+
+
+def test_redirect_lookup_without_cache_and_admin_urls():
+    info = client.post("/url", json={"target_url": "https://example.net/"}).json()
+    key = info["url"].rsplit("/", 1)[-1]
+    secret_key = info["admin_url"].rsplit("/", 1)[-1]
+    assert info["url"] == f"http://localhost:8000/{key}"
+    assert info["admin_url"] == f"http://localhost:8000/admin/{secret_key}"
+    redirect_cache.clear()
+    assert crud.get_target_url_fast(key).url == "https://example.net/"
+    assert crud.get_target_url_fast("missing-key") is None
+
+
+def test_admin_info_reports_pending_clicks():
+    info = client.post("/url", json={"target_url": "https://example.org/"}).json()
+    key = info["url"].rsplit("/", 1)[-1]
+    secret_key = info["admin_url"].rsplit("/", 1)[-1]
+    for _ in range(3):
+        client.get(f"/{key}", follow_redirects=False)
+    assert client.get(f"/admin/{secret_key}").json()["clicks"] == 3
+
+
+def test_batch_reports_invalid_urls():
+    response = client.post(
+        "/urls/batch",
+        json=[
+            {"target_url": "https://example.com/a"},
+            {"target_url": "not a url"},
+            {"target_url": "https://example.com/b"},
+        ],
+    )
+    assert response.status_code == 200
+    items = response.json()
+    assert [item["error"] is None for item in items] == [True, False, True]
+    key = items[2]["url_info"]["url"].rsplit("/", 1)[-1]
+    response = client.get(f"/{key}", follow_redirects=False)
+    assert response.headers["location"] == "https://example.com/b"
+
+
+def test_page_etag_and_unknown_page():
+    response = client.get("/page/about")
+    etag = response.headers["etag"]
+    response = client.get("/page/about", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert client.get("/page/missing").status_code == 404
+
+    # A spoofed Host header gets the page of the configured base URL.
+    response = client.get("/page/about", headers={"host": "evil.example"})
+    assert response.headers["etag"] == etag and b"evil.example" not in response.content
+
+
+def test_stats_counts_clicks_per_bucket():
+    info = client.post("/url", json={"target_url": "https://example.net/"}).json()
+    key = info["url"].rsplit("/", 1)[-1]
+    secret_key = info["admin_url"].rsplit("/", 1)[-1]
+    for _ in range(2):
+        client.get(f"/{key}", follow_redirects=False)
+    stats = client.get(f"/admin/{secret_key}/stats", params={"granularity": "minute"}).json()
+    assert stats["total"] == 2
+    assert len(stats["buckets"]) == 1
+    response = client.get(f"/admin/{secret_key}/stats", params={"granularity": "week"})
+    assert response.status_code == 400
+
+
+def test_warmup_preloads_the_most_clicked_urls():
+    keys = []
+    for number in range(3):
+        info = client.post("/url", json={"target_url": f"https://example.org/{number}"}).json()
+        keys.append(info["url"].rsplit("/", 1)[-1])
+    db = SessionLocal()
+    try:
+        crud.add_db_clicks(db, {keys[1]: 1_000_000})
+    finally:
+        db.close()
+    redirect_cache.clear()
+    report = Warmup(keys=1, budget=5.0).run(SessionLocal, warm_pages)
+    assert report["keys"] == 1 and report["complete"]
+    assert report["pages"] > 0
+    assert redirect_cache.get(keys[1]).url == "https://example.org/1"
+    assert redirect_cache.get(keys[0]) is None
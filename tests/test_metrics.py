@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from shortener_app.main import app
+from shortener_app.metrics import Histogram, Metrics, metrics
+from shortener_app.writequeue import write_queue
+
+client = TestClient(app)
+
+
+def test_histogram_merges_thread_shards():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    threads = [
+        threading.Thread(target=histogram.observe, args=(("/a",), seconds))
+        for seconds in (0.05, 0.5, 5.0)
+    ]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    lines = list(histogram.render())
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+
+
+def test_disabled_metrics_leave_functions_untouched():
+    def lookup():
+        return 1
+
+    assert Metrics(enabled=False).timed(lookup) is lookup
+
+
+@pytest.mark.skipif(not metrics.enabled, reason="METRICS_ENABLED is off")
+def test_metrics_endpoint_reports_routes_and_operations():
+    response = client.post("/url", json={"target_url": "https://example.com/metrics"})
+    client.get(f"/{response.json()['url'].rsplit('/', 1)[-1]}", follow_redirects=False)
+    body = client.get("/metrics").text
+    assert 'route="/{url_key}"' in body
+    assert 'shortener_http_responses_total{method="POST",route="/url",status="200"}' in body
+    # With the write queue, creates are committed in batches by create_db_urls.
+    assert ('create_db_urls"}' if write_queue.enabled else 'create_db_url"}') in body
+    assert 'operation="commit"' in body
+    assert 'shortener_db_pool_checkout_seconds_count{pool=' in body
+    assert "shortener_threadpool_threads" in body
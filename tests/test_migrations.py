@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine
+
+from shortener_app.dedup import url_digest
+from shortener_app.migrations import MIGRATIONS, migrate
+
+# The schema of the first release, as create_all wrote it, before any migration.
+BASELINE_SCHEMA = [
+    "CREATE TABLE urls ("
+    " id INTEGER NOT NULL, key VARCHAR, secret_key VARCHAR, target_url VARCHAR,"
+    " is_active BOOLEAN, clicks INTEGER, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_urls_key ON urls (key)",
+    "CREATE UNIQUE INDEX ix_urls_secret_key ON urls (secret_key)",
+    "CREATE INDEX ix_urls_target_url ON urls (target_url)",
+    "INSERT INTO urls VALUES (1, 'ABCDE', 'ABCDE_SECRET', 'https://Example.com', 1, 7)",
+    "INSERT INTO urls VALUES (2, 'FGHIJ', 'FGHIJ_SECRET', 'https://example.org/x', 0, 2)",
+]
+
+
+def test_migrate_upgrades_a_baseline_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shortener.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.exec_driver_sql(statement)
+
+    assert migrate(engine) == len(MIGRATIONS)
+    with engine.connect() as connection:
+        columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(urls)")}
+        indexes = {row[1] for row in connection.exec_driver_sql("PRAGMA index_list(urls)")}
+        rows = connection.exec_driver_sql(
+            "SELECT id, key, target_url, is_active, clicks, target_hash, expires_at FROM urls"
+            " ORDER BY id"
+        ).all()
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT target_url FROM urls WHERE key = 'ABCDE' AND is_active = 1"
+        ).all()
+    assert version == len(MIGRATIONS)
+    assert {"target_hash", "expires_at", "max_clicks", "cache_max_age"} <= columns
+    assert {
+        "ix_urls_key",
+        "ix_urls_secret_key",
+        "ix_urls_inactive_id",
+        "ix_urls_active_target_hash",
+        "ix_urls_expires_at",
+        "ix_urls_max_clicks_id",
+    } <= indexes
+    assert not {"ix_urls_target_url", "ix_urls_active_key", "ix_urls_active_clicks"} & indexes
+    assert rows == [
+        (1, "ABCDE", "https://Example.com", 1, 7, url_digest("https://Example.com"), None),
+        (2, "FGHIJ", "https://example.org/x", 0, 2, url_digest("https://example.org/x"), None),
+    ]
+    assert "ix_urls_key" in plan[0][-1]
+    # A second run finds nothing left to do.
+    assert migrate(engine) == len(MIGRATIONS)
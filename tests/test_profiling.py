@@ -0,0 +1,76 @@
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from shortener_app.main import app
+from shortener_app.profiling import Profiler, ProfilingMiddleware, sign
+
+
+def busy_handler():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sign("secret", "GET", "/busy", 0)
+    return {"done": True}
+
+
+def make_client(profiler):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    app.get("/busy")(busy_handler)
+    return TestClient(app)
+
+
+def test_signed_request_is_profiled(tmp_path):
+    profiler = Profiler(directory=str(tmp_path), secret="secret")
+    client = make_client(profiler)
+
+    assert client.get("/busy").status_code == 200
+    assert client.get("/busy", headers={"X-Profile": "1:bad"}).status_code == 200
+    assert profiler.profiles() == []
+
+    header = sign("secret", "GET", "/busy", int(time.time()))
+    client.get("/busy", headers={"X-Profile": header})
+    (profile,) = profiler.profiles()
+    assert "-GET-busy-" in profile.name
+    stacks = profile.read_text().splitlines()
+    assert any("busy_handler" in line and "sign (profiling.py" in line for line in stacks)
+    assert profiler.path_for(profile.name) == profile
+    assert profiler.path_for("../secret.collapsed") is None
+
+
+def test_sampled_profiles_rotate(tmp_path):
+    profiler = Profiler(directory=str(tmp_path), sample_rate=1.0, keep=2)
+    client = make_client(profiler)
+    for _ in range(3):
+        client.get("/busy")
+    assert len(profiler.describe()) == 2
+
+
+def test_profile_is_saved_off_the_event_loop(tmp_path):
+    threads = {}
+
+    class RecordingProfiler(Profiler):
+        def save(self, scope, stacks, elapsed):
+            threads["save"] = threading.get_ident()
+            return super().save(scope, stacks, elapsed)
+
+    profiler = RecordingProfiler(directory=str(tmp_path), sample_rate=1.0)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    @app.get("/loop")
+    async def loop_handler():
+        threads["loop"] = threading.get_ident()
+        return {}
+
+    assert TestClient(app).get("/loop").status_code == 200
+    assert threads["save"] != threads["loop"]
+    assert len(profiler.profiles()) == 1
+
+
+def test_profile_routes_need_profiling_and_its_secret():
+    client = TestClient(app)
+    assert client.get("/admin/profiles").status_code == 404
+    assert client.get("/admin/profiles/any.collapsed").status_code == 404
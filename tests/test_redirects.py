@@ -0,0 +1,48 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from shortener_app.cache import RedirectTarget
+from shortener_app.main import app
+from shortener_app.redirects import RedirectPolicy
+
+client = TestClient(app)
+
+
+def test_policy_bounds_max_age_and_downgrades_uncacheable_permanent_redirects():
+    policy = RedirectPolicy(status_code=308, max_age=600, max_age_limit=3600)
+    response = policy.response(RedirectTarget("https://example.com/"))
+    assert response.status_code == 308
+    assert response.headers["cache-control"] == "public, max-age=600"
+    assert policy.max_age_of(RedirectTarget("https://example.com/", max_age=10**6)) == 3600
+
+    response = policy.response(RedirectTarget("https://example.com/", max_age=0))
+    assert response.status_code == 307
+    assert response.headers["cache-control"] == "no-store"
+    response = policy.response(RedirectTarget("https://example.com/", max_clicks=5))
+    assert response.status_code == 307 and response.headers["cache-control"] == "no-store"
+
+    expiring = RedirectTarget("https://example.com/", expires_at=int(time.time()) + 60)
+    assert 0 < policy.max_age_of(expiring) <= 60
+    assert RedirectPolicy(status_code=301).response(expiring).status_code == 302
+
+
+def test_redirect_cache_headers_and_admin_info_etag():
+    info = client.post(
+        "/url", json={"target_url": "https://example.com/cached", "cache_max_age": 120}
+    ).json()
+    assert info["cache_max_age"] == 120
+    response = client.get(f"/{info['url'].rsplit('/', 1)[-1]}", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["cache-control"] == "public, max-age=120"
+
+    admin_path = f"/admin/{info['admin_url'].rsplit('/', 1)[-1]}"
+    response = client.get(admin_path)
+    etag = response.headers["etag"]
+    assert response.status_code == 200 and etag.startswith('W/"')
+    response = client.get(admin_path, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and not response.content
+
+    client.get(f"/{info['url'].rsplit('/', 1)[-1]}", follow_redirects=False)
+    response = client.get(admin_path, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
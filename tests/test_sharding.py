@@ -0,0 +1,48 @@
+from sqlalchemy import create_engine, insert, select
+
+from shortener_app import models
+from shortener_app.migrations import migrate
+from shortener_app.sharding import BUCKETS, ShardMap, bucket_for, key_of_secret, split_shard
+
+
+def test_shard_map_split_and_round_trip(tmp_path):
+    shard_map = ShardMap.create(["sqlite:///a.db", "sqlite:///b.db"])
+    assert shard_map.assignment[0] == "0" and shard_map.assignment[-1] == "1"
+    new_name = shard_map.split("1", "sqlite:///c.db")
+    assert new_name == "2"
+    assert shard_map.assignment.count("1") == shard_map.assignment.count("2") == BUCKETS // 4
+
+    path = str(tmp_path / "shards.json")
+    shard_map.save(path)
+    loaded = ShardMap.load(path)
+    assert loaded.shards == shard_map.shards
+    assert loaded.shard_for_key("ABCDE") == shard_map.assignment[bucket_for("ABCDE")]
+    assert key_of_secret("ABCDE_FGHIJKLM") == "ABCDE"
+
+
+def test_split_shard_moves_the_rows_of_half_the_buckets(tmp_path):
+    source_url = f"sqlite:///{tmp_path / 'source.db'}"
+    target_url = f"sqlite:///{tmp_path / 'target.db'}"
+    path = str(tmp_path / "shards.json")
+    ShardMap.create([source_url]).save(path)
+    source = create_engine(source_url)
+    migrate(source)
+    keys = [f"K{number:04d}" for number in range(200)]
+    with source.begin() as connection:
+        connection.execute(
+            insert(models.URL.__table__),
+            [{"key": key, "secret_key": f"{key}_S", "target_url": "https://e.com"} for key in keys],
+        )
+
+    moved = split_shard(path, "0", target_url, chunk_size=16)
+
+    shard_map = ShardMap.load(path)
+    url_key = models.URL.__table__.c.key
+    with source.connect() as connection:
+        kept = set(connection.execute(select(url_key)).scalars())
+    with create_engine(target_url).connect() as connection:
+        copied = set(connection.execute(select(url_key)).scalars())
+    assert kept | copied == set(keys) and not kept & copied
+    assert moved["urls"] == len(copied) > 0
+    assert all(shard_map.shard_for_key(key) == "1" for key in copied)
+    assert all(shard_map.shard_for_key(key) == "0" for key in kept)
@@ -0,0 +1,42 @@
+import multiprocessing
+
+from shortener_app.cache import RedirectTarget
+from shortener_app.shmtable import SharedTable
+
+
+def test_entries_are_stored_replaced_and_removed(tmp_path):
+    table = SharedTable(path=str(tmp_path / "table.shm"), slots=8, slot_bytes=128)
+    assert table.get("abcde") is None
+    assert table.put("abcde", RedirectTarget("https://example.com/", 2_000_000_000, 60))
+    assert table.put("fghij", RedirectTarget("https://example.org/"))
+    assert table.get("abcde") == RedirectTarget("https://example.com/", 2_000_000_000, 60)
+    assert table.put("abcde", RedirectTarget("https://example.net/"))
+    assert table.get("abcde").url == "https://example.net/"
+
+    assert not table.put("limited", RedirectTarget("https://example.com/", max_clicks=3))
+    assert not table.put("long", RedirectTarget("https://example.com/" + "x" * 200))
+
+    generation = table.generation()
+    table.remove("abcde")
+    assert table.get("abcde") is None
+    assert table.get("fghij").url == "https://example.org/"
+    assert not table.put("abcde", RedirectTarget("https://example.com/"), generation)
+    assert table.stats()["used"] == 1
+    table.close()
+
+
+def write_entry(path: str) -> None:
+    SharedTable(path=path, slots=8, slot_bytes=128).put(
+        "child", RedirectTarget("https://example.com/child")
+    )
+
+
+def test_entries_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "table.shm")
+    table = SharedTable(path=path, slots=8, slot_bytes=128)
+    assert table.get("child") is None
+    process = multiprocessing.get_context("fork").Process(target=write_entry, args=(path,))
+    process.start()
+    process.join()
+    assert table.get("child").url == "https://example.com/child"
+    table.close()
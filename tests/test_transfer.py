@@ -0,0 +1,52 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from shortener_app.config import get_settings
+from shortener_app.database import SessionLocal
+from shortener_app.main import app
+from shortener_app.transfer import import_lines
+
+client = TestClient(app)
+headers = {"X-Admin-Token": get_settings().admin_token}
+
+
+def test_export_then_import_round_trip():
+    created = client.post("/url", json={"target_url": "https://example.com/export"}).json()
+    key = created["url"].rsplit("/", 1)[-1]
+
+    assert client.get("/admin/export").status_code == 403
+    response = client.get("/admin/export", headers=headers)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert {"key": key, "target_url": "https://example.com/export"}.items() <= next(
+        row for row in rows if row["key"] == key
+    ).items()
+
+    new_row = {
+        "key": "IMPORTED1",
+        "secret_key": "IMPORTED1_SECRET",
+        "target_url": "https://example.com/imported",
+        "is_active": True,
+        "clicks": 7,
+    }
+    body = "\n".join([json.dumps(rows[0]), "not json", json.dumps(new_row)])
+    result = client.post("/admin/import", content=body, headers=headers).json()
+    assert (result["rows"], result["inserted"], result["skipped"], result["invalid"]) == (3, 1, 1, 1)
+
+    info = client.get("/admin/IMPORTED1_SECRET").json()
+    assert (info["target_url"], info["clicks"]) == ("https://example.com/imported", 7)
+
+
+def test_import_lines_commits_in_chunks():
+    lines = [
+        json.dumps({"key": f"CHUNK{i}", "secret_key": f"CHUNK{i}_S", "target_url": "https://e.com"}).encode()
+        for i in range(5)
+    ]
+    db = SessionLocal()
+    try:
+        result = import_lines(db, lines, chunk_size=2)
+        assert (result["rows"], result["inserted"]) == (5, 5)
+        assert import_lines(db, lines, chunk_size=2)["skipped"] == 5
+    finally:
+        db.close()
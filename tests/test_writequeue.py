@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from shortener_app import crud, models, schemas
+from shortener_app.writequeue import WriteQueue, write_urls
+
+
+def test_concurrent_creates_are_committed_together():
+    batches = []
+    release = threading.Event()
+
+    def writer(urls):
+        release.wait(5)
+        batches.append(len(urls))
+        return [
+            models.URL(target_url=url.target_url, key=str(number))
+            for number, url in enumerate(urls)
+        ]
+
+    queue = WriteQueue(enabled=True, max_batch=8, max_wait=0, writer=writer)
+    futures = [
+        queue.submit(schemas.URLBase(target_url=f"https://example.com/{number}"))
+        for number in range(10)
+    ]
+    release.set()
+    results = [future.result(5) for future in futures]
+    queue.stop()
+    assert [db_url.target_url for db_url in results] == [
+        f"https://example.com/{number}" for number in range(10)
+    ]
+    assert sum(batches) == 10 and max(batches) <= 8 and len(batches) < 10
+    assert queue.stats()["urls"] == 10
+
+
+def test_failed_batch_only_fails_the_bad_url():
+    def writer(urls):
+        if any(url.target_url.endswith("bad") for url in urls):
+            raise ValueError("bad url")
+        return write_urls(urls)
+
+    queue = WriteQueue(enabled=True, max_batch=8, max_wait=0.05, writer=writer)
+    good = queue.submit(schemas.URLBase(target_url="https://example.com/good"))
+    bad = queue.submit(schemas.URLBase(target_url="https://example.com/bad"))
+    assert good.result(5).key
+    with pytest.raises(ValueError):
+        bad.result(5)
+    queue.stop()
+    assert queue.stats()["failed_batches"] == 1
+
+
+def test_urls_committed_before_a_shard_failed_are_not_written_again():
+    written = []
+
+    def writer(urls):
+        written.append([url.target_url for url in urls])
+        if len(urls) > 1:
+            raise crud.PartialCreateError({0: models.URL(target_url=urls[0].target_url, key="a")})
+        return [models.URL(target_url=urls[0].target_url, key="b")]
+
+    queue = WriteQueue(enabled=True, max_batch=8, max_wait=0.05, writer=writer)
+    queue._queue.put((schemas.URLBase(target_url="https://example.com/1"), first := Future()))
+    queue._queue.put((schemas.URLBase(target_url="https://example.com/2"), second := Future()))
+    queue.start()
+    assert (first.result(5).key, second.result(5).key) == ("a", "b")
+    queue.stop()
+    assert written[1:] == [["https://example.com/2"]]
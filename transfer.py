@@ -0,0 +1,229 @@
+# Streaming backup and migration of the urls table as NDJSON, one URL per line:
+#     {"key": "ABCDE", "secret_key": "ABCDE_FGHIJKLM", "target_url": "...", "is_active": true,
+#      "clicks": 3, "expires_at": null, "max_clicks": null, "cache_max_age": null}
+# expires_at is a unix time; the expiry and cache fields are optional on import.
+# Exports stream the rows with yield_per, imports insert them in chunked
+# transactions, so memory stays flat whatever the size of the table.
+#     python -m shortener_app.transfer export --output urls.ndjson
+#     python -m shortener_app.transfer import --input urls.ndjson
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .crud import all_shard_sessions, shard_sessions
+from .database import shard_map
+from .dedup import url_digest
+from .sharding import key_of_secret
+
+logger = logging.getLogger(__name__)
+
+# The exported columns; the id is not kept and the target hash is recomputed.
+COLUMNS = (
+    "key",
+    "secret_key",
+    "target_url",
+    "is_active",
+    "clicks",
+    "expires_at",
+    "max_clicks",
+    "cache_max_age",
+)
+
+# Rows fetched per round trip on export, and inserted per transaction on import.
+CHUNK_SIZE = 5000
+
+
+# 1. Stream the rows in id order, shard by shard, fetching `chunk_size` rows
+#    per round trip.
+# 2. Yield one bytes block of NDJSON lines per chunk, to keep writes few.
+# 3. Log the number of rows and the throughput when the export is done.
+def export_lines(db: Session, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Export the urls table as NDJSON
+
+    Args:
+        db (Session): Connect to a database
+        chunk_size (int): rows fetched per round trip
+
+    Yields:
+        bytes: blocks of complete NDJSON lines
+    """
+    start = time.perf_counter()
+    rows = 0
+    block: List[str] = []
+    columns = [getattr(models.URL, column) for column in COLUMNS]
+    for row in (
+        row
+        for shard_db in all_shard_sessions(db)
+        for row in shard_db.query(*columns).order_by(models.URL.id).yield_per(chunk_size)
+    ):
+        block.append(json.dumps(dict(zip(COLUMNS, row)), separators=(",", ":")))
+        if len(block) >= chunk_size:
+            rows += len(block)
+            yield ("\n".join(block) + "\n").encode()
+            block = []
+    if block:
+        rows += len(block)
+        yield ("\n".join(block) + "\n").encode()
+    elapsed = time.perf_counter() - start
+    logger.info("Exported %d rows in %.2fs (%d rows/s)", rows, elapsed, rows / max(elapsed, 1e-9))
+
+
+def optional_int(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+# 1. parse() turns a NDJSON line into a row of the urls table, or counts it
+#    as invalid; blank lines are ignored.
+# 2. add() buffers the rows and hands back a full chunk to write().
+# 3. write() inserts a chunk in one transaction (one per shard with a shard
+#    map); rows whose key or secret key already exists are skipped
+#    (ON CONFLICT DO NOTHING).
+# 4. With a shard map, the secret key must start with the key, as admin
+#    lookups find the shard from it.
+# 5. The parsing and the writes are separate, so the import endpoint can read
+#    the request body on the event loop and write in the threadpool.
+class Importer:
+    """Chunked import of NDJSON lines into the urls table.
+
+    Args:
+        db (Session): Connect to a database
+        chunk_size (int): rows inserted per transaction
+    """
+
+    def __init__(self, db: Session, chunk_size: int = CHUNK_SIZE) -> None:
+        self.db = db
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.inserted = 0
+        self.invalid = 0
+        self._pending: List[dict] = []
+        self._start = time.perf_counter()
+        table = models.URL.__table__
+        self._statement = sqlite_insert(table).on_conflict_do_nothing()
+
+    def parse(self, line: bytes) -> Optional[dict]:
+        """The urls row of a NDJSON line, or None when it is blank or invalid."""
+        if not line.strip():
+            return None
+        self.rows += 1
+        try:
+            data = json.loads(line)
+            row = {
+                "key": data["key"],
+                "secret_key": data["secret_key"],
+                "target_url": data["target_url"],
+                "is_active": bool(data.get("is_active", True)),
+                "clicks": int(data.get("clicks", 0)),
+                "expires_at": optional_int(data.get("expires_at")),
+                "max_clicks": optional_int(data.get("max_clicks")),
+                "cache_max_age": optional_int(data.get("cache_max_age")),
+            }
+            if not all(isinstance(row[column], str) for column in COLUMNS[:3]):
+                raise TypeError("key, secret_key and target_url must be strings")
+            if shard_map is not None and key_of_secret(row["secret_key"]) != row["key"]:
+                raise ValueError("secret_key must start with the key")
+        except (ValueError, KeyError, TypeError):
+            self.invalid += 1
+            return None
+        row["target_hash"] = url_digest(row["target_url"])
+        return row
+
+    def add(self, line: bytes) -> Optional[List[dict]]:
+        """Buffer a line, and return a chunk of rows once it is full."""
+        if (row := self.parse(line)) is not None:
+            self._pending.append(row)
+        if len(self._pending) >= self.chunk_size:
+            chunk, self._pending = self._pending, []
+            return chunk
+        return None
+
+    def remaining(self) -> List[dict]:
+        """The rows buffered since the last full chunk."""
+        chunk, self._pending = self._pending, []
+        return chunk
+
+    def write(self, chunk: List[dict]) -> None:
+        """Insert a chunk of rows in one transaction."""
+        if not chunk:
+            return
+        for shard_db, rows in shard_sessions(self.db, chunk, key=lambda row: row["key"]):
+            result = shard_db.execute(self._statement, rows)
+            shard_db.commit()
+            self.inserted += max(result.rowcount, 0)
+
+    def result(self) -> Dict[str, float]:
+        """Counters and throughput of the import."""
+        elapsed = time.perf_counter() - self._start
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "skipped": self.rows - self.inserted - self.invalid,
+            "invalid": self.invalid,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(self.rows / max(elapsed, 1e-9), 1),
+        }
+
+
+def import_lines(db: Session, lines: Iterable[bytes], chunk_size: int = CHUNK_SIZE) -> dict:
+    """Import NDJSON lines into the urls table
+
+    Args:
+        db (Session): Connect to a database
+        lines (Iterable[bytes]): NDJSON lines, e.g. a file opened in binary mode
+        chunk_size (int): rows inserted per transaction
+
+    Returns:
+        dict: rows read, inserted, skipped (existing keys) and invalid, and the throughput
+    """
+    importer = Importer(db, chunk_size)
+    for line in lines:
+        if chunk := importer.add(line):
+            importer.write(chunk)
+    importer.write(importer.remaining())
+    return importer.result()
+
+
+def main() -> None:
+    from .database import SessionLocal
+    from .main import migrate_databases
+
+    parser = argparse.ArgumentParser(description="Export or import the urls table as NDJSON")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("--output", help="export file, defaults to stdout")
+    parser.add_argument("--input", help="import file, defaults to stdin")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    migrate_databases()
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            output = open(args.output, "wb") if args.output else sys.stdout.buffer
+            try:
+                for block in export_lines(db, args.chunk_size):
+                    output.write(block)
+            finally:
+                if args.output:
+                    output.close()
+        else:
+            source = open(args.input, "rb") if args.input else sys.stdin.buffer
+            try:
+                result = import_lines(db, source, args.chunk_size)
+            finally:
+                if args.input:
+                    source.close()
+            logger.info("Imported: %s", result)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Warmup of a starting worker, before it reports ready.
+# A restarted worker has an empty redirect cache, so its first redirects all
+# reach the database at once. The warmup preloads the most clicked active URLs
+# into the redirect cache and renders the pages and templates, in a background
+# thread started at startup; /admin/ready answers 503 until it is done.
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud
+from .cache import RedirectTarget, redirect_cache
+from .config import get_settings
+from .shmtable import shared_table
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Load the `keys` most clicked active URLs, at most the size of the cache.
+# 2. Put them in the redirect cache (or the shared table) least clicked first,
+#    so the most clicked are the last to be evicted.
+# 3. Render the pages and templates with `warm_pages`.
+# 4. Every step is skipped once `budget` seconds have passed; the worker
+#    reports ready even then, a partial warmup only costs cache misses.
+# 5. Log the duration and the coverage: keys loaded, and their share of the
+#    clicks of all active URLs.
+class Warmup:
+    """Startup warmup of the redirect cache, pages and templates.
+
+    Args:
+        keys (int): number of most clicked URLs preloaded, 0 skips them.
+        budget (float): seconds after which the remaining steps are skipped.
+    """
+
+    def __init__(self, keys: int = 1000, budget: float = 5.0) -> None:
+        self.keys = keys
+        self.budget = budget
+        self.report: Dict[str, object] = {}
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def start(self, session_factory: Callable[[], Session], warm_pages: Callable[[], int]) -> None:
+        """Run the warmup in a background thread."""
+        self._done.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(session_factory, warm_pages), name="warmup", daemon=True
+        )
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the warmup to finish, return whether it did."""
+        return self._done.wait(timeout)
+
+    def run(self, session_factory: Callable[[], Session], warm_pages: Callable[[], int]) -> Dict:
+        """Warm the caches and mark the worker ready
+
+        Args:
+            session_factory (Callable[[], Session]): creates a database session
+            warm_pages (Callable[[], int]): renders the pages and templates,
+                returns how many were rendered
+
+        Returns:
+            Dict: duration, keys loaded, share of the clicks covered, pages rendered
+        """
+        start = time.perf_counter()
+        deadline = start + self.budget
+        report: Dict[str, object] = {"keys": 0, "click_coverage": None, "pages": 0, "complete": True}
+        try:
+            limit = min(
+                self.keys,
+                shared_table.slots if shared_table.enabled else redirect_cache.maxsize,
+            )
+            if limit > 0:
+                db = session_factory()
+                try:
+                    generation = crud.table_generation()
+                    hot_urls = crud.get_hot_urls(db, limit)
+                    for number, (key, target_url, _, expires_at, max_age) in enumerate(
+                        reversed(hot_urls)
+                    ):
+                        if number % 1000 == 0 and time.perf_counter() > deadline:
+                            report["complete"] = False
+                            break
+                        crud.cache_target(
+                            key, RedirectTarget(target_url, expires_at, max_age), generation
+                        )
+                        report["keys"] += 1
+                    if report["complete"] and time.perf_counter() <= deadline:
+                        total = crud.count_active_clicks(db)
+                        covered = sum(clicks for _, _, clicks, _, _ in hot_urls)
+                        report["click_coverage"] = round(covered / total, 4) if total else None
+                finally:
+                    db.close()
+            if time.perf_counter() <= deadline:
+                report["pages"] = warm_pages()
+            else:
+                report["complete"] = False
+        except Exception:
+            report["complete"] = False
+            logger.exception("Warmup failed, the worker starts cold")
+        finally:
+            report["seconds"] = round(time.perf_counter() - start, 3)
+            self.report = report
+            self._done.set()
+        logger.info(
+            "Warmup done in %.3fs: %d of %d keys, %s of the clicks, %d pages%s",
+            report["seconds"],
+            report["keys"],
+            self.keys,
+            "n/a" if report["click_coverage"] is None else f"{report['click_coverage']:.1%}",
+            report["pages"],
+            "" if report["complete"] else " (incomplete)",
+        )
+        return report
+
+    def stats(self) -> Dict[str, object]:
+        """Readiness and the report of the last warmup."""
+        return {"ready": self.ready, **self.report}
+
+
+warmup = Warmup(keys=get_settings().warmup_keys, budget=get_settings().warmup_budget)
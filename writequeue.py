@@ -0,0 +1,180 @@
+# Group commit of the URL creations.
+# Every create commits on its own: on SQLite each one waits for the write lock
+# and pays its own fsync. With the write queue, POST /url hands its URL to a
+# single writer thread, which collects the creates of many requests for up to
+# `max_wait` seconds, inserts them with crud.create_db_urls in one transaction
+# and resolves the future of every request with its URL.
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import crud, models, schemas
+from .config import get_settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Creates a batch of URLs with a new database session.
+# 2. All rows are inserted in one transaction by crud.create_db_urls
+#    (one per shard with a shard map).
+# 3. The session is always closed, even when the insert fails.
+def write_urls(urls: List[schemas.URLBase]) -> List[models.URL]:
+    """Create a batch of URLs in a single transaction.
+
+    Args:
+        urls (List[schemas.URLBase]): urls to be shortened
+
+    Returns:
+        List[models.URL]: the shortened URLs, in the order of `urls`
+    """
+    db = SessionLocal()
+    try:
+        return crud.create_db_urls(db, urls)
+    finally:
+        db.close()
+
+
+# 1. submit() queues a URL and returns a future, resolved with its models.URL
+#    once the batch holding it is committed.
+# 2. The writer thread blocks for the first URL and takes every URL already
+#    queued, up to `max_batch`. URLs queued while a batch is written form the
+#    next one, so batches grow with the load even when `max_wait` is 0.
+# 3. Under load, when this batch or the last one holds more than one URL, the
+#    writer also waits up to `max_wait` seconds for more. A lone client never
+#    waits: nobody would join its batch.
+# 4. When a batch fails, its URLs are written again one by one, so one bad URL
+#    only fails its own request. The URLs a shard already committed before
+#    another failed (crud.PartialCreateError) are not written again.
+# 5. stop() writes the URLs still queued before the thread exits.
+class WriteQueue:
+    """Single writer batching the URL creations of concurrent requests.
+
+    Args:
+        enabled (bool): when False, POST /url commits every create itself.
+        max_batch (int): URLs committed together at most.
+        max_wait (float): seconds the writer waits for more URLs under load.
+        writer (Callable): creates a batch of URLs, defaults to write_urls.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        writer: Optional[Callable[[List[schemas.URLBase]], List[models.URL]]] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._writer = writer or write_urls
+        self._queue: "queue.SimpleQueue[Optional[Tuple[schemas.URLBase, Future]]]" = (
+            queue.SimpleQueue()
+        )
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_batch = 0
+        self.totals = {"batches": 0, "urls": 0, "largest_batch": 0, "failed_batches": 0}
+
+    def submit(self, url: schemas.URLBase) -> "Future[models.URL]":
+        """Queue `url` for the next batch and return the future of its URL."""
+        future: "Future[models.URL]" = Future()
+        if self._thread is None:
+            self.start()
+        self._queue.put((url, future))
+        return future
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="url-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the queued URLs and stop the writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            while not self._queue.empty():
+                if item := self._queue.get_nowait():
+                    self._write([item])
+
+    def stats(self) -> Dict[str, object]:
+        batches = self.totals["batches"]
+        return {
+            "enabled": self.enabled,
+            "max_batch": self.max_batch,
+            "max_wait": self.max_wait,
+            **self.totals,
+            "mean_batch": round(self.totals["urls"] / batches, 2) if batches else 0.0,
+        }
+
+    def _collect(self) -> Tuple[List[Tuple[schemas.URLBase, Future]], bool]:
+        """The next batch, and whether stop() was called."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or len(batch) == 1 and self._last_batch <= 1:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        self._last_batch = len(batch)
+        return batch, False
+
+    def _write(self, batch: List[Tuple[schemas.URLBase, Future]]) -> None:
+        batch = [(url, future) for url, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            db_urls = self._writer([url for url, _ in batch])
+        except Exception as error:
+            self.totals["failed_batches"] += 1
+            logger.exception("Failed to write a batch of %d URLs, retrying one by one", len(batch))
+            created = error.created if isinstance(error, crud.PartialCreateError) else {}
+            for index, (url, future) in enumerate(batch):
+                if index in created:
+                    future.set_result(created[index])
+                    continue
+                try:
+                    future.set_result(self._writer([url])[0])
+                except Exception as error:
+                    future.set_exception(error)
+        else:
+            for (_, future), db_url in zip(batch, db_urls):
+                future.set_result(db_url)
+        self.totals["batches"] += 1
+        self.totals["urls"] += len(batch)
+        self.totals["largest_batch"] = max(self.totals["largest_batch"], len(batch))
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch, stopped = self._collect()
+            if batch:
+                self._write(batch)
+
+
+write_queue = WriteQueue(
+    enabled=get_settings().write_queue_enabled,
+    max_batch=get_settings().write_queue_max_batch,
+    max_wait=get_settings().write_queue_max_wait,
+)